@@ -0,0 +1,199 @@
+"""
+Teste de carga de escritas concorrentes: vários processos do Memento gravando revisões no mesmo banco.
+
+Cada processo simula uma pessoa revisando sem pausa: gera revisões dos seus
+QAs e as grava durante `--seconds`. Dois modos são comparados:
+
+- direct: um commit por revisão, em uma sessão própria (como era o start_review)
+- queue: ReviewWriter + fila de escrita (lotes, BEGIN IMMEDIATE e retentativas)
+
+Mede as revisões gravadas por segundo (somando os processos) e os erros de
+"database is locked", e confere se tudo o que os processos reportaram está no banco.
+
+Uso: python -m benchmarks.concurrent_writes [--processes 1,2,4,8] [--seconds 5] [--busy-timeout-ms 5000]
+"""
+import os
+import tempfile
+
+# Antes de importar o projeto: banco temporário (os processos filhos herdam o caminho)
+_CREATED_DIR = None
+if "MEMENTO_DB_PATH" not in os.environ:
+    _CREATED_DIR = tempfile.mkdtemp(prefix="memento-concurrency-")
+    os.environ["MEMENTO_DB_PATH"] = os.path.join(_CREATED_DIR, "concurrency.db")
+os.environ["MEMENTO_STUB_MODELS"] = "1"
+os.environ["MEMENTO_USE_DAEMON"] = "0"
+
+import argparse
+import json
+import multiprocessing
+import random
+import shutil
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import OperationalError
+
+QAS_PER_USER = 500
+MODES = ("direct", "queue")
+
+
+def populate(users):
+    """Cria um usuário (com PDF, blocos e QAs) por processo; retorna os IDs dos QAs de cada um."""
+    from database import engine, session_scope
+    from migrations.migrations import migrate
+    from models import User, PDFDocument, PDFBlock, QA
+
+    migrate(engine)
+    qa_ids = {}
+    with session_scope() as db:
+        for user_id in range(1, users + 1):
+            if db.get(User, user_id) is not None:
+                qa_ids[user_id] = db.execute(select(QA.id).where(QA.user_id == user_id)).scalars().all()
+                continue
+            db.execute(insert(User), [{"id": user_id, "name": f"Usuário {user_id}",
+                                       "email": f"user{user_id}@stress", "password": "x"}])
+            db.execute(insert(PDFDocument), [{"id": user_id, "file_path": f"stress/{user_id}.pdf", "uploader_id": user_id}])
+            db.execute(insert(PDFBlock), [{"id": user_id, "pdf_id": user_id, "text_content": "bloco"}])
+            first = (user_id - 1) * QAS_PER_USER + 1
+            db.execute(insert(QA), [
+                {"id": qa_id, "user_id": user_id, "pdf_block_id": user_id, "question": f"Pergunta {qa_id}?",
+                 "answer": f"Resposta {qa_id}."}
+                for qa_id in range(first, first + QAS_PER_USER)
+            ])
+            qa_ids[user_id] = list(range(first, first + QAS_PER_USER))
+    return qa_ids
+
+
+def _history(rng, user_id, qa_ids):
+    from models import UserHistory
+
+    now = datetime.utcnow()
+    stability = rng.uniform(1, 30)
+    return UserHistory(qa_id=rng.choice(qa_ids), user_id=user_id, user_answer="resposta",
+                       grade=rng.randint(1, 4), state=2, step=None, difficulty=rng.uniform(1, 10),
+                       stability=stability, review=now, due=now + timedelta(days=stability))
+
+
+def _worker(mode, user_id, qa_ids, seconds, flush_size, barrier, results):
+    from database import SessionLocal
+    from card_state.card_state import upsert_card_state
+    from qag.review_writer import ReviewWriter
+    from user_history.stats import record_review
+    from write_queue import is_locked_error, write_stats
+
+    rng = random.Random(user_id)
+    written = errors = 0
+    barrier.wait()
+    started = time.perf_counter()
+    deadline = started + seconds
+
+    if mode == "direct":
+        while time.perf_counter() < deadline:
+            history = _history(rng, user_id, qa_ids)
+            db = SessionLocal()
+            try:
+                db.add(history)
+                upsert_card_state(db, history)
+                record_review(db, history)
+                db.commit()
+                written += 1
+            except OperationalError as e:
+                db.rollback()
+                if not is_locked_error(e):
+                    raise
+                errors += 1
+            finally:
+                db.close()
+    else:
+        writer = ReviewWriter(flush_size=flush_size)
+        while time.perf_counter() < deadline:
+            try:
+                writer.add(_history(rng, user_id, qa_ids))
+            except OperationalError as e:
+                if not is_locked_error(e):
+                    raise
+                errors += 1
+        try:
+            writer.close()
+        except OperationalError:
+            errors += 1
+        written = writer.saved
+
+    results.put({"written": written, "lock_errors": errors, "elapsed_s": time.perf_counter() - started,
+                 "write_queue": write_stats()})
+
+
+def _history_count():
+    from database import session_scope
+    from models import UserHistory
+
+    with session_scope() as db:
+        return db.execute(select(func.count(UserHistory.id))).scalar_one()
+
+
+def run(mode, processes, qa_ids, seconds, flush_size):
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(processes)
+    results = context.Queue()
+    before = _history_count()
+
+    workers = [
+        context.Process(target=_worker, args=(mode, user_id, qa_ids[user_id], seconds, flush_size, barrier, results))
+        for user_id in range(1, processes + 1)
+    ]
+    for worker in workers:
+        worker.start()
+    reports = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    written = sum(report["written"] for report in reports)
+    elapsed = max(report["elapsed_s"] for report in reports)
+    return {
+        "mode": mode,
+        "processes": processes,
+        "written": written,
+        "reviews_per_s": written / elapsed,
+        "lock_errors": sum(report["lock_errors"] for report in reports),
+        "transactions": sum(report["write_queue"]["transactions"] for report in reports),
+        "retries": sum(report["write_queue"]["retries"] for report in reports),
+        "verified": _history_count() - before == written,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--processes", default="1,2,4,8", help="Quantidades de processos, separadas por vírgula")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Duração de cada rodada")
+    parser.add_argument("--flush-size", type=int, default=20, help="Revisões por lote no modo queue")
+    parser.add_argument("--busy-timeout-ms", type=int, help="busy_timeout do SQLite nos processos (padrão: o do projeto)")
+    parser.add_argument("--modes", default=",".join(MODES))
+    args = parser.parse_args()
+
+    if args.busy_timeout_ms is not None:
+        os.environ["MEMENTO_SQLITE_BUSY_TIMEOUT_MS"] = str(args.busy_timeout_ms)
+    counts = [int(count) for count in args.processes.split(",")]
+    modes = [mode.strip() for mode in args.modes.split(",")]
+    for mode in modes:
+        if mode not in MODES:
+            parser.error(f"modo desconhecido: {mode}")
+
+    try:
+        qa_ids = populate(max(counts))
+        results = [run(mode, processes, qa_ids, args.seconds, args.flush_size)
+                   for mode in modes for processes in counts]
+    finally:
+        if _CREATED_DIR:
+            shutil.rmtree(_CREATED_DIR, ignore_errors=True)
+
+    print(json.dumps({
+        "benchmark": "concurrent_writes",
+        "seconds": args.seconds,
+        "flush_size": args.flush_size,
+        "busy_timeout_ms": int(os.environ.get("MEMENTO_SQLITE_BUSY_TIMEOUT_MS", "5000")),
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
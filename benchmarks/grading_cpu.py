@@ -0,0 +1,126 @@
+"""
+Benchmark do BERTimbau-Grading na CPU: fp32 contra int8 (quantização dinâmica).
+
+Avalia um conjunto fixo de respostas com nota esperada e mede, para cada
+backend, a latência de uma resposta por vez (como na revisão) e a do conjunto
+em lote, a acurácia contra as notas esperadas e a concordância do int8 com o fp32.
+
+Uso: python -m benchmarks.grading_cpu [--repeats 5] [--threads N]
+Requer o modelo real; o resultado sai em JSON.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+import numpy as np
+from model_registry import THREADS_ENV_VAR, cpu_threads
+from grading.grading import _BertGrader
+
+# (pergunta, resposta de referência, resposta do aluno, nota esperada 0-3)
+GRADING_SET = [
+    ("O que é fotossíntese?", "Processo em que as plantas convertem luz em energia química.",
+     "É o processo em que as plantas transformam luz em energia química.", 3),
+    ("O que é fotossíntese?", "Processo em que as plantas convertem luz em energia química.",
+     "As plantas usam a luz para fazer comida.", 2),
+    ("O que é fotossíntese?", "Processo em que as plantas convertem luz em energia química.",
+     "É a respiração das plantas.", 1),
+    ("O que é fotossíntese?", "Processo em que as plantas convertem luz em energia química.",
+     "Não sei.", 0),
+    ("Onde ocorre a fotossíntese?", "Nos cloroplastos das células vegetais.",
+     "Nos cloroplastos.", 3),
+    ("Onde ocorre a fotossíntese?", "Nos cloroplastos das células vegetais.",
+     "Nas folhas.", 2),
+    ("Onde ocorre a fotossíntese?", "Nos cloroplastos das células vegetais.",
+     "Nas mitocôndrias.", 0),
+    ("Qual gás é liberado na fotossíntese?", "Oxigênio.",
+     "Oxigênio.", 3),
+    ("Qual gás é liberado na fotossíntese?", "Oxigênio.",
+     "Gás carbônico.", 0),
+    ("Quem escreveu Dom Casmurro?", "Machado de Assis.",
+     "Machado de Assis escreveu Dom Casmurro.", 3),
+    ("Quem escreveu Dom Casmurro?", "Machado de Assis.",
+     "Machado.", 2),
+    ("Quem escreveu Dom Casmurro?", "Machado de Assis.",
+     "José de Alencar.", 0),
+    ("O que é uma chave primária?", "Coluna ou conjunto de colunas que identifica unicamente cada linha de uma tabela.",
+     "Um campo que identifica cada registro da tabela de forma única.", 3),
+    ("O que é uma chave primária?", "Coluna ou conjunto de colunas que identifica unicamente cada linha de uma tabela.",
+     "Uma coluna da tabela.", 1),
+    ("O que é uma chave primária?", "Coluna ou conjunto de colunas que identifica unicamente cada linha de uma tabela.",
+     "É a senha do banco de dados.", 0),
+    ("Para que serve um índice em banco de dados?", "Para acelerar a busca de linhas sem percorrer a tabela inteira.",
+     "Deixa as consultas mais rápidas porque evita ler a tabela toda.", 3),
+    ("Para que serve um índice em banco de dados?", "Para acelerar a busca de linhas sem percorrer a tabela inteira.",
+     "Organizar os dados.", 1),
+    ("Qual é a capital do Brasil?", "Brasília.",
+     "Brasília.", 3),
+    ("Qual é a capital do Brasil?", "Brasília.",
+     "Rio de Janeiro.", 0),
+    ("O que a mitocôndria produz?", "Energia na forma de ATP, pela respiração celular.",
+     "ATP.", 2),
+    ("O que a mitocôndria produz?", "Energia na forma de ATP, pela respiração celular.",
+     "Produz energia (ATP) através da respiração celular.", 3),
+    ("O que a mitocôndria produz?", "Energia na forma de ATP, pela respiração celular.",
+     "Proteínas.", 0),
+]
+
+
+def run_backend(grader, question_refs, student_answers, repeats):
+    # Aquecimento: a primeira chamada inclui alocações e inicializações
+    grader.predict_batch(question_refs[:1], student_answers[:1], batch_size=1)
+
+    single = []
+    for _ in range(repeats):
+        for question_ref, student_answer in zip(question_refs, student_answers):
+            started = time.perf_counter()
+            grader.predict_batch([question_ref], [student_answer], batch_size=1)
+            single.append(time.perf_counter() - started)
+
+    batch = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        grades, confidences = grader.predict_batch(question_refs, student_answers, batch_size=32)
+        batch.append(time.perf_counter() - started)
+
+    single.sort()
+    return grades, {
+        "single_p50_s": statistics.median(single),
+        "single_p95_s": single[int(0.95 * (len(single) - 1))],
+        "batch_s": statistics.median(batch),
+        "mean_confidence": float(np.mean(confidences)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--threads", type=int, help="Threads intra-op (padrão: núcleos disponíveis)")
+    args = parser.parse_args()
+    if args.threads:
+        os.environ[THREADS_ENV_VAR] = str(args.threads)
+
+    question_refs = [f"{question} {reference}" for question, reference, _, _ in GRADING_SET]
+    student_answers = [student_answer for _, _, student_answer, _ in GRADING_SET]
+    expected = np.array([grade for _, _, _, grade in GRADING_SET])
+
+    results = {}
+    predictions = {}
+    for name, quantize in (("fp32", False), ("int8", True)):
+        grader = _BertGrader(device="cpu", quantize=quantize)
+        predictions[name], results[name] = run_backend(grader, question_refs, student_answers, args.repeats)
+        results[name]["accuracy"] = float(np.mean(predictions[name] == expected))
+        del grader
+
+    print(json.dumps({
+        "benchmark": "grading_cpu",
+        "threads": cpu_threads(),
+        "items": len(GRADING_SET),
+        "results": results,
+        "int8_agreement_with_fp32": float(np.mean(predictions["int8"] == predictions["fp32"])),
+        "int8_speedup_single": results["fp32"]["single_p50_s"] / results["int8"]["single_p50_s"],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
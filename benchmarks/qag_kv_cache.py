@@ -0,0 +1,64 @@
+"""
+Benchmark do KV-cache do prompt no generate_qa.
+
+Mede, para alguns blocos de texto, o tempo de cada regeneração com o prompt
+codificado do zero e com o KV-cache do prompt reaproveitado. Usa greedy search
+para que os dois lados decodifiquem exatamente os mesmos tokens.
+
+Uso: python -m benchmarks.qag_kv_cache [--blocks 3] [--regenerations 3]
+Requer o modelo real (GPU); o resultado sai em JSON.
+"""
+import argparse
+import json
+import time
+from model_registry import get_model
+from qag.generator import build_prompt
+
+SAMPLE_TEXT = (
+    "A fotossíntese é o processo pelo qual plantas, algas e algumas bactérias convertem "
+    "energia luminosa em energia química. Ela ocorre nos cloroplastos, onde a clorofila "
+    "absorve a luz, e produz glicose e oxigênio a partir de dióxido de carbono e água. "
+)
+
+
+def time_regenerations(qag, prompt, cache_prompt, regenerations):
+    started = time.perf_counter()
+    inputs = qag.encode(prompt, cache_prompt=cache_prompt)
+    encode_seconds = time.perf_counter() - started
+
+    timings = []
+    for _ in range(regenerations):
+        started = time.perf_counter()
+        qag.generate(inputs, do_sample=False)
+        timings.append(time.perf_counter() - started)
+    return {"encode_s": encode_seconds, "regenerations_s": timings}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--blocks", type=int, default=3)
+    parser.add_argument("--regenerations", type=int, default=3)
+    args = parser.parse_args()
+
+    qag = get_model("qag")
+    results = []
+    for i in range(args.blocks):
+        # Blocos de tamanhos diferentes, até perto do limite de 1024 tokens
+        prompt = build_prompt(SAMPLE_TEXT * (2 ** i))
+        uncached = time_regenerations(qag, prompt, False, args.regenerations)
+        cached = time_regenerations(qag, prompt, True, args.regenerations)
+        mean_uncached = sum(uncached["regenerations_s"]) / args.regenerations
+        mean_cached = sum(cached["regenerations_s"]) / args.regenerations
+        results.append({
+            "block": i,
+            "prompt_chars": len(prompt),
+            "uncached": uncached,
+            "cached": cached,
+            "speedup": mean_uncached / mean_cached if mean_cached else None,
+        })
+
+    print(json.dumps({"benchmark": "qag_kv_cache", "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
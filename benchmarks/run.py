@@ -0,0 +1,296 @@
+"""
+Suíte de benchmarks dos caminhos críticos do Memento.
+
+Gera usuários, QAs e histórico sintéticos em um banco temporário e mede o
+caminho quente de cada ponto de entrada:
+
+- start_review: seleção dos cards para revisar, avaliação, FSRS e gravação
+- visualizar_qas / visualizar_desempenho_por_qa: listagem e agregação do histórico
+- handle_pdf_upload: gravação dos chunks no pipeline de ingestão
+- previsão de carga (`scheduling.forecast`) sobre todos os cards
+- reagendamento em lote e leitura do histórico para o ajuste dos pesos do FSRS
+- compactação do users_history e leitura do histórico arquivado
+- geração de QAs (modelo stub): em lote e interativa
+
+Usa os modelos stub (sem GPU e sem rede). O resultado sai em JSON, para
+comparar commits.
+
+Uso: python -m benchmarks.run [--scales 10k,100k,1m] [--repeats 5] [--output arquivo.json]
+"""
+import os
+import tempfile
+
+# Antes de importar o projeto: banco e arquivo do histórico temporários (nunca os
+# do usuário, mesmo com MEMENTO_DB_PATH definido), modelos stub e sem daemon
+_BENCH_DIR = tempfile.mkdtemp(prefix="memento-bench-")
+os.environ["MEMENTO_DB_PATH"] = os.path.join(_BENCH_DIR, "bench.db")
+os.environ["MEMENTO_ARCHIVE_DIR"] = os.path.join(_BENCH_DIR, "history_archive")
+os.environ["MEMENTO_STUB_MODELS"] = "1"
+os.environ["MEMENTO_USE_DAEMON"] = "0"
+
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import time
+from datetime import datetime, timedelta, timezone
+from fsrs import Scheduler
+from sqlalchemy import create_engine, insert, delete
+import database
+from models import User, PDFDocument, PDFBlock, QA, UserHistory, GradingCache
+from migrations.migrations import migrate
+from card_state.card_state import get_due_cards, backfill_card_states
+from grading import grading
+from grading.grading import predict_grades
+from qag.generator import grade_answers, generate_candidates, generate_qa
+from qag.review_writer import ReviewWriter
+from pdf_extract.pipeline import IngestionPipeline
+from scheduling.forecast import forecast_workload
+from scheduling.scheduler import iter_review_logs, reschedule_user_cards
+from user_history import archive
+from user_history.archive import compact_history, iter_user_history
+from user_history.user_history import visualizar_qas, visualizar_desempenho_por_qa, obter_estatisticas_usuario
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+# Cada usuário tem QAS_PER_USER QAs e REVIEWS_PER_QA revisões por QA
+QAS_PER_USER = 2000
+REVIEWS_PER_QA = 5
+QAS_PER_BLOCK = 4
+INSERT_CHUNK = 50_000
+
+NOW = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+WORDS = ("fotossíntese clorofila energia luz glicose oxigênio célula planta água carbono "
+         "mitocôndria núcleo proteína enzima membrana tecido órgão sistema").split()
+
+
+def _text(rng, n):
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def _insert(db, table, rows):
+    for start in range(0, len(rows), INSERT_CHUNK):
+        db.execute(insert(table), rows[start:start + INSERT_CHUNK])
+
+
+def populate(db, history_rows, seed=42):
+    """Gera os dados sintéticos; retorna a quantidade de linhas de cada tabela."""
+    rng = random.Random(seed)
+    users = max(1, history_rows // (QAS_PER_USER * REVIEWS_PER_QA))
+    now = NOW.replace(tzinfo=None)
+
+    _insert(db, User.__table__, [
+        {"id": u, "name": f"Usuário {u}", "email": f"user{u}@bench", "password": "x"} for u in range(1, users + 1)
+    ])
+    _insert(db, PDFDocument.__table__, [
+        {"id": u, "file_path": f"bench/{u}.pdf", "original_name": f"{u}.pdf", "uploader_id": u, "uploaded_at": now}
+        for u in range(1, users + 1)
+    ])
+
+    blocks, qas, history = [], [], []
+    qa_id = 0
+    for u in range(1, users + 1):
+        for b in range(QAS_PER_USER // QAS_PER_BLOCK):
+            block_id = len(blocks) + 1
+            blocks.append({"id": block_id, "pdf_id": u, "text_content": _text(rng, 120)})
+            for _ in range(QAS_PER_BLOCK):
+                qa_id += 1
+                qas.append({"id": qa_id, "user_id": u, "pdf_block_id": block_id,
+                            "question": f"O que é {_text(rng, 6)}?", "answer": _text(rng, 8)})
+                # Revisões espaçadas; a última vence entre 10 dias atrás e 20 dias à frente
+                review = now - timedelta(days=rng.randint(40, 60))
+                stability = 1.0
+                for _ in range(REVIEWS_PER_QA):
+                    grade = rng.randint(1, 4)
+                    stability = stability * (1.5 + grade / 2)
+                    due = review + timedelta(days=stability)
+                    history.append({"qa_id": qa_id, "user_id": u, "user_answer": _text(rng, 5), "grade": grade,
+                                    "state": 2, "step": None, "difficulty": rng.uniform(1, 10),
+                                    "stability": stability, "review": review, "due": due})
+                    review = due
+                last = history[-1]
+                last["due"] = now + timedelta(days=rng.uniform(-10, 20))
+
+    _insert(db, PDFBlock.__table__, blocks)
+    _insert(db, QA.__table__, qas)
+    _insert(db, UserHistory.__table__, history)
+    db.commit()
+    return {"users": users, "pdf_blocks": len(blocks), "questions_answers": len(qas), "users_history": len(history)}
+
+
+def timed(fn, repeats):
+    """Executa `fn` `repeats` vezes; retorna o resultado da última e os tempos."""
+    timings = []
+    result = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return result, {"median_s": statistics.median(timings), "min_s": min(timings), "runs": repeats}
+
+
+@contextlib.contextmanager
+def quiet(answer=""):
+    """Descarta a saída e responde `answer` (padrão: Enter) a qualquer input() das telas do CLI."""
+    original_input = builtins.input
+    builtins.input = lambda prompt="": answer
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        builtins.input = original_input
+
+
+def bench_scale(name, history_rows, repeats):
+    db_path = os.path.join(_BENCH_DIR, f"bench-{name}.db")
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    database.SessionLocal.configure(bind=engine)
+    # Cada escala arquiva o histórico em uma pasta própria
+    archive.ARCHIVE_DIR = os.path.join(_BENCH_DIR, f"history_archive-{name}")
+    migrate(engine)
+    grading._memory_cache.clear()
+
+    db = database.SessionLocal()
+    results = {}
+    try:
+        started = time.perf_counter()
+        rows = populate(db, history_rows)
+        setup_s = time.perf_counter() - started
+
+        _, results["card_state_backfill"] = timed(lambda: backfill_card_states(db), 1)
+
+        user = db.get(User, 1)
+        due, results["due_selection"] = timed(lambda: get_due_cards(db, user.id, NOW), repeats)
+        results["due_selection"]["cards"] = len(due)
+
+        # Previsão de carga de todos os cards do banco
+        _, results["forecast_all_users"] = timed(lambda: forecast_workload(db, horizon=30, now=NOW), repeats)
+
+        # Reagendamento em lote do usuário (retenção diferente: todos os cards mudam) e leitura do histórico
+        _, results["reschedule_user"] = timed(
+            lambda: reschedule_user_cards(db, user.id, Scheduler(desired_retention=0.85)), 1)
+        _, results["stream_review_logs"] = timed(lambda: sum(1 for _ in iter_review_logs(db, user.id)), repeats)
+
+        # Avaliação: cache frio (memória e banco vazios) e quente
+        triples = [(qa.question, qa.answer, f"resposta {i}") for i, (qa, _, _) in enumerate(due[:500])]
+
+        def cold_grading():
+            grading._memory_cache.clear()
+            db.execute(delete(GradingCache))
+            db.commit()
+            return predict_grades(triples)
+
+        _, results["grading_cold"] = timed(cold_grading, repeats)
+        _, results["grading_warm"] = timed(lambda: predict_grades(triples), repeats)
+        results["grading_cold"]["answers"] = results["grading_warm"]["answers"] = len(triples)
+
+        # FSRS: avaliação + agendamento de 200 cards, depois a gravação em lotes do start_review
+        items = [(qa, state, "resposta") for qa, _, state in due[:200]]
+        reviewed, results["fsrs_update"] = timed(lambda: grade_answers(items, user.id, NOW), repeats)
+        results["fsrs_update"]["cards"] = len(items)
+
+        def write_reviews():
+            with ReviewWriter() as writer:
+                for result in reviewed:
+                    if result.history is not None:
+                        writer.add(result.history)
+            return writer
+
+        writer, results["review_write"] = timed(write_reviews, 1)
+        results["review_write"].update(cards=writer.saved, flush_size=writer.flush_size)
+
+        with quiet():
+            _, results["history_aggregation"] = timed(lambda: visualizar_desempenho_por_qa(user), repeats)
+            _, results["user_statistics"] = timed(lambda: obter_estatisticas_usuario(user), repeats)
+            # Todas as páginas (Enter em cada uma)
+            _, results["qa_listing"] = timed(lambda: visualizar_qas(user), repeats)
+        with quiet("q"):
+            # Só a primeira página: o tempo que o usuário espera para ver a lista
+            _, results["qa_listing_first_page"] = timed(lambda: visualizar_qas(user), repeats)
+
+        # Ingestão: gravação de 1000 chunks pelo pipeline
+        rng = random.Random(7)
+        chunks = [_text(rng, 150) for _ in range(1000)]
+
+        def insert_chunks():
+            pipeline = IngestionPipeline(chunks, pdf_id=1).start()
+            for _ in pipeline.blocks():
+                pass
+            return pipeline.timings
+
+        pipeline_timings, results["chunk_insert"] = timed(insert_chunks, repeats)
+        results["chunk_insert"].update(chunks=len(chunks), commits=pipeline_timings["commits"])
+
+        # Compactação do histórico e leitura do histórico completo (arquivo + tabela) depois dela
+        compacted, results["compact_history"] = timed(lambda: compact_history(db, keep_days=0, now=NOW.replace(tzinfo=None)), 1)
+        results["compact_history"].update(compacted)
+        _, results["iter_user_history_archived"] = timed(lambda: sum(1 for _ in iter_user_history(db, user.id)), repeats)
+
+        # Geração (por último: a interativa aprova e grava QAs novas): candidatas em
+        # lote e generate_qa aprovando a QA greedy de cada bloco
+        blocks = db.query(PDFBlock).join(PDFDocument).filter(PDFDocument.uploader_id == user.id).limit(64).all()
+        with quiet():
+            _, results["qa_generation_batch"] = timed(lambda: generate_candidates(blocks, user.id), repeats)
+        with quiet("a"):
+            _, results["qa_generation_interactive"] = timed(lambda: [generate_qa(block, user.id) for block in blocks[:16]], repeats)
+        results["qa_generation_batch"]["blocks"] = len(blocks)
+        results["qa_generation_interactive"]["blocks"] = len(blocks[:16])
+    finally:
+        db.close()
+        engine.dispose()
+
+    return {
+        "scale": name,
+        "rows": rows,
+        "setup_s": setup_s,
+        "db_size_mb": os.path.getsize(db_path) / 1024 / 1024,
+        "results": results,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=database.BASE_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", default="10k", help=f"Escalas separadas por vírgula ({', '.join(SCALES)})")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="Arquivo para o JSON (padrão: saída padrão)")
+    args = parser.parse_args()
+
+    scales = [scale.strip().lower() for scale in args.scales.split(",")]
+    for scale in scales:
+        if scale not in SCALES:
+            parser.error(f"escala desconhecida: {scale}")
+
+    try:
+        report = {
+            "benchmark": "suite",
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "scales": [bench_scale(scale, SCALES[scale], args.repeats) for scale in scales],
+        }
+    finally:
+        shutil.rmtree(_BENCH_DIR, ignore_errors=True)
+
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
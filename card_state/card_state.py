@@ -0,0 +1,96 @@
+"""
+Estado atual de cada card (QA) do usuário.
+
+A tabela `cards_state` guarda o estado FSRS mais recente de cada QA, evitando
+uma consulta ao `users_history` por QA para descobrir o que está para revisar.
+"""
+from datetime import timezone
+from sqlalchemy import func, or_, select, delete
+from sqlalchemy.dialects.sqlite import insert
+from models import CardState, UserHistory, QA, PDFBlock
+
+CARD_STATE_FIELDS = ("state", "step", "difficulty", "stability", "review", "due")
+
+
+def _to_utc_naive(dt):
+    """O SQLite guarda as datas em UTC sem timezone; compara no mesmo formato."""
+    if dt is None or dt.tzinfo is None:
+        return dt
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def upsert_card_state(db, history: UserHistory):
+    """
+    Atualiza o estado do card a partir de uma nova linha de histórico.
+
+    Deve ser chamada na mesma sessão (e transação) que insere o `UserHistory`.
+    Se o estado salvo for de uma revisão mais recente, ele é mantido.
+    """
+    upsert_card_states(db, [history])
+
+
+def upsert_card_states(db, histories):
+    """Como `upsert_card_state`, para várias linhas de histórico em um único executemany (na ordem dada)."""
+    stmt = insert(CardState)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CardState.user_id, CardState.qa_id],
+        set_={field: stmt.excluded[field] for field in CARD_STATE_FIELDS},
+        where=or_(CardState.review.is_(None), CardState.review <= stmt.excluded.review),
+    )
+    db.execute(stmt, [
+        {"qa_id": history.qa_id, "user_id": history.user_id,
+         **{field: getattr(history, field) for field in CARD_STATE_FIELDS}}
+        for history in histories
+    ])
+
+
+def get_due_cards(db, user_id, now):
+    """
+    Retorna os QAs do usuário que estão para revisar em `now`.
+
+    Returns:
+        list: Tuplas (QA, PDFBlock, CardState ou None); QAs nunca revisados vêm com None
+    """
+    return db.query(QA, PDFBlock, CardState).join(
+        PDFBlock, QA.pdf_block_id == PDFBlock.id
+    ).outerjoin(
+        CardState, (CardState.qa_id == QA.id) & (CardState.user_id == QA.user_id)
+    ).filter(
+        QA.user_id == user_id,
+        or_(CardState.id.is_(None), CardState.due.is_(None), CardState.due <= _to_utc_naive(now))
+    ).order_by(QA.id).all()
+
+
+def backfill_card_states(db, user_id=None):
+    """
+    Reconstrói `cards_state` a partir do `users_history` existente.
+
+    Args:
+        db: Sessão do banco
+        user_id: Restringe a reconstrução a um usuário (opcional)
+
+    Returns:
+        int: Quantidade de cards gravados
+    """
+    ranked = select(
+        UserHistory.qa_id,
+        UserHistory.user_id,
+        *[getattr(UserHistory, field) for field in CARD_STATE_FIELDS],
+        func.row_number().over(
+            partition_by=UserHistory.qa_id,
+            order_by=(UserHistory.review.desc(), UserHistory.id.desc())
+        ).label("rn"),
+    )
+    clear = delete(CardState)
+    if user_id is not None:
+        ranked = ranked.where(UserHistory.user_id == user_id)
+        clear = clear.where(CardState.user_id == user_id)
+    ranked = ranked.subquery()
+
+    columns = ["qa_id", "user_id", *CARD_STATE_FIELDS]
+    latest = select(*[ranked.c[column] for column in columns]).where(ranked.c.rn == 1)
+
+    db.execute(clear)
+    result = db.execute(insert(CardState).from_select(columns, latest))
+    db.commit()
+    return result.rowcount
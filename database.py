@@ -1,14 +1,66 @@
 import os
-from sqlalchemy import create_engine
+import sqlite3
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 # Caminho absoluto da pasta do projeto
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, "memento.db")
+# MEMENTO_DB_PATH permite usar outro arquivo (ex.: benchmarks, cópias do banco)
+DB_PATH = os.environ.get("MEMENTO_DB_PATH", os.path.join(BASE_DIR, "memento.db"))
 
 DATABASE_URL = f"sqlite:///{DB_PATH}"
 
+# Tamanho do mmap do arquivo do banco, em MB (0 desliga)
+SQLITE_MMAP_MB = int(os.environ.get("MEMENTO_SQLITE_MMAP_MB", "256"))
+# Quanto uma escrita espera pelo lock de outro processo antes de "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("MEMENTO_SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Pragmas de cada conexão SQLite aberta, de qualquer engine do processo.
+
+    WAL deixa leituras rodarem durante uma escrita e, com synchronous=NORMAL,
+    o commit não espera o fsync do arquivo (só o checkpoint espera); uma queda
+    de energia pode perder os últimos commits, mas não corrompe o banco.
+    """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_MB * 1024 * 1024}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(bind=engine)
+# Objetos continuam utilizáveis depois do commit e do fechamento da sessão
+# (ex.: o usuário do login, os cards carregados para a revisão)
+SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
 Base = declarative_base()
+
+
+@contextmanager
+def session_scope():
+    """
+    Unidade de trabalho: uma sessão com commit no final, rollback em caso de
+    erro e sempre fechada.
+
+        with session_scope() as db:
+            db.add(objeto)
+    """
+    db = SessionLocal()
+    try:
+        yield db
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    finally:
+        db.close()
@@ -1,31 +1,324 @@
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+from database import session_scope
+from write_queue import submit_write
+from models import GradingCache
+from model_registry import register_model, get_model, use_model, get_remote, get_device, cpu_threads, lazy_import, use_stub_models
+from inference_server.client import remote_grader
 
 model_name = "graziele-fagundes/BERTimbau-Grading"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForSequenceClassification.from_pretrained(model_name, device_map="cuda")
-model.eval()
+model_revision = os.environ.get("MEMENTO_GRADING_REVISION", "main")
+max_length = 512
+
+# Commit do modelo de fato carregado (ou resolvido pelo cache do Hugging Face);
+# é ele, e não o nome da revisão, que entra na chave do cache de notas
+_resolved_commit = None
+
+# Na CPU, as camadas lineares usam quantização dinâmica int8 (MEMENTO_GRADING_INT8=0 mantém fp32)
+quantize_on_cpu = os.environ.get("MEMENTO_GRADING_INT8", "1").lower() not in ("0", "false", "no")
+
+# Cache de notas: LRU em memória na frente da tabela grading_cache
+CACHE_SIZE = int(os.environ.get("MEMENTO_GRADING_CACHE_SIZE", "10000"))
+_memory_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "db_hits": 0, "misses": 0}
+
+# Limites da tabela grading_cache: linhas e idade (dias); aplicados a cada PRUNE_EVERY notas gravadas
+DB_CACHE_MAX_ROWS = int(os.environ.get("MEMENTO_GRADING_DB_CACHE_ROWS", "200000"))
+DB_CACHE_MAX_DAYS = int(os.environ.get("MEMENTO_GRADING_DB_CACHE_DAYS", "180"))
+PRUNE_EVERY = 1000
+_stored_since_prune = 0
+
+
+def _backend_name(device, quantize):
+    if device == "cpu":
+        return "cpu-int8" if quantize else "cpu-fp32"
+    return device
+
+
+class _BertGrader:
+    """
+    BERTimbau-Grading na GPU ou, sem GPU, na CPU com quantização dinâmica int8.
+
+    Args:
+        device: "cuda" ou "cpu" (padrão: `get_device()`)
+        quantize: Quantiza em int8 quando roda na CPU (padrão: `quantize_on_cpu`)
+    """
+
+    def __init__(self, device=None, quantize=None):
+        torch = lazy_import("torch")
+        transformers = lazy_import("transformers")
+        self.device = device or get_device()
+        self.quantize = self.device == "cpu" and (quantize_on_cpu if quantize is None else quantize)
+        self.backend = _backend_name(self.device, self.quantize)
+
+        self.tokenizer = transformers.AutoTokenizer.from_pretrained(model_name, revision=model_revision)
+        self.model = transformers.AutoModelForSequenceClassification.from_pretrained(
+            model_name, revision=model_revision, device_map=self.device
+        )
+        self.model.eval()
+        # Commit resolvido pelo Hugging Face (o "main" muda quando o modelo é atualizado)
+        self.commit_hash = getattr(self.model.config, "_commit_hash", None) or model_revision
+        global _resolved_commit
+        _resolved_commit = self.commit_hash
+        if self.device == "cpu":
+            torch.set_num_threads(cpu_threads())
+            if self.quantize:
+                self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def predict_batch(self, question_refs, student_answers, batch_size):
+        torch = lazy_import("torch")
+        # Tokeniza tudo uma vez, sem padding, para conhecer o tamanho real de cada item
+        encodings = self.tokenizer(question_refs, student_answers,
+                                   truncation=True,
+                                   max_length=max_length)
+        lengths = [len(ids) for ids in encodings["input_ids"]]
+        # Ordena por tamanho: cada lote é preenchido só até o maior item dele
+        order = np.argsort(lengths, kind="stable")
+
+        grades = np.empty(len(lengths), dtype=np.int64)
+        confidences = np.empty(len(lengths), dtype=np.float32)
+        with torch.no_grad():
+            for start in range(0, len(order), batch_size):
+                indices = order[start:start + batch_size]
+                features = [{key: encodings[key][i] for key in encodings.keys()} for i in indices]
+                inputs = self.tokenizer.pad(features, padding="longest", return_tensors="pt").to(self.device)
+
+                # Cálculo da predição e da confiança
+                outputs = self.model(**inputs)
+                probabilities = torch.softmax(outputs.logits, dim=1)
+                confidence, predicted_class = probabilities.max(dim=1)
+
+                grades[indices] = predicted_class.cpu().numpy()
+                confidences[indices] = confidence.float().cpu().numpy()
+
+        return grades, confidences
+
+
+class _StubGrader:
+    """Avaliador determinístico, sem torch, para testes e benchmarks."""
+
+    def predict_batch(self, question_refs, student_answers, batch_size):
+        grades = np.empty(len(question_refs), dtype=np.int64)
+        confidences = np.empty(len(question_refs), dtype=np.float32)
+        for i, (question_ref, student_answer) in enumerate(zip(question_refs, student_answers)):
+            reference = set(question_ref.lower().split())
+            answer = set(student_answer.lower().split())
+            if not answer:
+                grades[i], confidences[i] = 0, 1.0
+                continue
+            overlap = len(reference & answer) / len(answer)
+            grades[i] = min(3, int(overlap * 4))
+            confidences[i] = 0.5 + overlap / 2
+        return grades, confidences
+
+
+register_model("grading", _BertGrader, stub_loader=_StubGrader, remote_loader=remote_grader)
+
+
+def _normalize(text):
+    return " ".join(unicodedata.normalize("NFC", text).casefold().split())
+
+
+def _current_revision():
+    # Com o daemon, as notas vêm do modelo carregado nele
+    remote = get_remote("grading")
+    if remote is not None and remote.revision:
+        return remote.revision
+    if use_stub_models():
+        return "stub"
+    # O int8 pode mudar algumas notas: cada backend tem o próprio cache
+    device = get_device()
+    return f"{model_name}@{_model_commit()}:{_backend_name(device, device == 'cpu' and quantize_on_cpu)}"
+
+
+def _cached_commit():
+    """Commit para o qual `model_revision` aponta no cache local do Hugging Face, ou None."""
+    if re.fullmatch(r"[0-9a-f]{40}", model_revision):
+        return model_revision
+    hub_constants = lazy_import("huggingface_hub.constants")
+    ref_path = os.path.join(hub_constants.HF_HUB_CACHE, f"models--{model_name.replace('/', '--')}",
+                            "refs", model_revision)
+    try:
+        with open(ref_path, encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _model_commit():
+    """
+    Commit do BERTimbau-Grading usado nas notas.
+
+    Sem o modelo carregado, vem do cache local do Hugging Face (sem rede); se a
+    revisão nunca foi baixada, o modelo é carregado para resolvê-la.
+    """
+    global _resolved_commit
+    if _resolved_commit is None:
+        commit = _cached_commit()
+        if commit is None:
+            get_model("grading")
+        else:
+            _resolved_commit = commit
+    return _resolved_commit
+
+
+def _cache_key(revision, question, reference_answer, student_answer):
+    parts = [revision, _normalize(question), _normalize(reference_answer), _normalize(student_answer)]
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+
+def _remember(key, value):
+    with _cache_lock:
+        _memory_cache[key] = value
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+
+
+def get_cache_stats():
+    """Contadores do cache de notas (acertos em memória, acertos no SQLite e misses)."""
+    with _cache_lock:
+        stats = dict(_cache_stats)
+        stats["size"] = len(_memory_cache)
+    total = stats["hits"] + stats["db_hits"] + stats["misses"]
+    stats["hit_rate"] = (stats["hits"] + stats["db_hits"]) / total if total else 0.0
+    return stats
+
+
+def _lookup_cache(keys):
+    """Busca as chaves no LRU e, o que faltar, no SQLite. Retorna {chave: (nota, confiança)}."""
+    found = {}
+    with _cache_lock:
+        for key in keys:
+            if key in _memory_cache:
+                _memory_cache.move_to_end(key)
+                found[key] = _memory_cache[key]
+        _cache_stats["hits"] += len(found)
+
+    missing = [key for key in dict.fromkeys(keys) if key not in found]
+    if missing:
+        with session_scope() as db:
+            for start in range(0, len(missing), 500):
+                rows = db.query(GradingCache.key, GradingCache.grade, GradingCache.confidence).filter(
+                    GradingCache.key.in_(missing[start:start + 500])
+                ).all()
+                for key, grade, confidence in rows:
+                    found[key] = (grade, confidence)
+                    _remember(key, (grade, confidence))
+                    with _cache_lock:
+                        _cache_stats["db_hits"] += 1
+    return found
+
+
+def _log_write_error(future):
+    # A nota já foi calculada e entregue; só o cache persistente fica sem ela
+    error = future.exception()
+    if error is not None:
+        print(f"⚠️ Não foi possível gravar o cache de notas: {error}")
+
+
+def _store_cache(revision, entries):
+    """
+    Grava novas notas no LRU e, sem esperar, no SQLite (ignorando chaves que já existem).
+
+    A gravação vai para a fila de escrita e é juntada às revisões que estiverem
+    pendentes; uma falha só é registrada.
+    """
+    global _stored_since_prune
+    for key, value in entries.items():
+        _remember(key, value)
+    rows = [
+        {"key": key, "model_revision": revision, "grade": int(grade), "confidence": float(confidence)}
+        for key, (grade, confidence) in entries.items()
+    ]
+    submit_write(lambda db: db.execute(
+        insert(GradingCache).on_conflict_do_nothing(index_elements=[GradingCache.key]), rows
+    )).add_done_callback(_log_write_error)
+
+    with _cache_lock:
+        _stored_since_prune += len(rows)
+        prune = _stored_since_prune >= PRUNE_EVERY
+        if prune:
+            _stored_since_prune = 0
+    if prune:
+        submit_write(prune_cache).add_done_callback(_log_write_error)
+
+
+def prune_cache(db, max_rows=DB_CACHE_MAX_ROWS, max_days=DB_CACHE_MAX_DAYS):
+    """
+    Apaga do grading_cache as notas com mais de `max_days` dias e, passando de
+    `max_rows` linhas, as mais antigas.
+
+    Returns:
+        int: Quantidade de linhas apagadas
+    """
+    deleted = db.execute(
+        delete(GradingCache).where(GradingCache.created_at < datetime.utcnow() - timedelta(days=max_days))
+    ).rowcount
+    oldest = select(GradingCache.key).order_by(GradingCache.created_at.desc()).offset(max_rows)
+    deleted += db.execute(delete(GradingCache).where(GradingCache.key.in_(oldest))).rowcount
+    return deleted
+
+
+def predict_grades(batch, batch_size=32):
+    """
+    Avalia várias respostas de uma vez.
+
+    Args:
+        batch: Sequência de triplas (pergunta, resposta de referência, resposta do aluno)
+        batch_size: Quantidade máxima de itens por forward pass
+
+    Returns:
+        tuple: (notas 0-3, confianças), ambos numpy arrays na ordem de entrada
+    """
+    batch = list(batch)
+    grades = np.empty(len(batch), dtype=np.int64)
+    confidences = np.empty(len(batch), dtype=np.float32)
+    if not batch:
+        return grades, confidences
+
+    # Acertos no cache pulam tokenização e inferência
+    revision = _current_revision()
+    keys = [_cache_key(revision, *triple) for triple in batch]
+    cached = _lookup_cache(keys)
+
+    question_refs = []
+    student_answers = []
+    to_predict = {}
+    for i, (key, (question, reference_answer, student_answer)) in enumerate(zip(keys, batch)):
+        if key in cached:
+            grades[i], confidences[i] = cached[key]
+        elif key in to_predict:
+            to_predict[key].append(i)
+        else:
+            to_predict[key] = [i]
+            question_refs.append(f"{question.strip()} {reference_answer.strip()}")
+            student_answers.append(student_answer.strip())
+
+    if to_predict:
+        with _cache_lock:
+            _cache_stats["misses"] += len(to_predict)
+        with use_model("grading") as grader:
+            new_grades, new_confidences = grader.predict_batch(question_refs, student_answers, batch_size)
+        entries = {}
+        for (key, indices), grade, confidence in zip(to_predict.items(), new_grades, new_confidences):
+            grades[indices] = grade
+            confidences[indices] = confidence
+            entries[key] = (int(grade), float(confidence))
+        _store_cache(revision, entries)
+
+    return grades, confidences
+
 
 def predict_grade(question, reference_answer, student_answer):
-    question = question.strip()
-    reference_answer = reference_answer.strip()
-    student_answer = student_answer.strip()
-    question_ref = f"{question} {reference_answer}"
-
-    inputs = tokenizer(question_ref, student_answer,
-                       return_tensors="pt",
-                       padding="max_length",
-                       truncation=True,
-                       max_length=512).to("cuda")
-    with torch.no_grad():
-        # Cálculo da predição
-        outputs = model(**inputs)
-        predicted_class = torch.argmax(outputs.logits, dim=1).item()
-
-        # Cálculo da confiança
-        probabilities = torch.softmax(outputs.logits, dim=1)
-        confidence = probabilities[0][predicted_class].item()
-
-    final_grade = int(round(predicted_class))
-    
-    return final_grade, confidence
+    grades, confidences = predict_grades([(question, reference_answer, student_answer)])
+    return int(grades[0]), float(confidences[0])
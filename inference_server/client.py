@@ -0,0 +1,175 @@
+"""
+Cliente do daemon de inferência.
+
+Quando o daemon está rodando, `get_model("grading")` e `get_model("qag")`
+retornam os proxies deste módulo no lugar dos modelos locais, com a mesma
+interface. Se o daemon cair no meio da sessão, os proxies passam a usar o
+modelo local.
+"""
+import os
+import socket
+import threading
+import time
+import numpy as np
+from inference_server.protocol import socket_path, check_socket, send_message, read_message, DISABLE_ENV_VAR
+
+# Segundos entre verificações de disponibilidade do daemon
+PROBE_INTERVAL = 5.0
+
+_probe = {"checked_at": None, "info": None}
+_proxies = {}
+_lock = threading.Lock()
+
+
+def daemon_enabled() -> bool:
+    """O uso do daemon pode ser desligado com MEMENTO_USE_DAEMON=0."""
+    return os.environ.get(DISABLE_ENV_VAR, "1").lower() not in ("0", "false", "no")
+
+
+def request(message, connect_timeout=1.0):
+    """
+    Envia uma mensagem ao daemon e retorna a resposta.
+
+    Raises:
+        OSError: Se o daemon não estiver acessível ou o socket não for do usuário
+        RuntimeError: Se o daemon responder com erro
+    """
+    path = socket_path()
+    check_socket(path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(connect_timeout)
+        sock.connect(path)
+        # Gerações podem demorar: depois de conectado, espera sem limite
+        sock.settimeout(None)
+        with sock.makefile("rwb") as sock_file:
+            send_message(sock_file, message)
+            response = read_message(sock_file)
+    if "error" in response:
+        raise RuntimeError(f"Erro no daemon de inferência: {response['error']}")
+    return response
+
+
+def daemon_info():
+    """Resposta do ping ao daemon (cacheada por PROBE_INTERVAL), ou None se ele não estiver rodando."""
+    if not daemon_enabled():
+        return None
+    now = time.monotonic()
+    with _lock:
+        if _probe["checked_at"] is not None and now - _probe["checked_at"] < PROBE_INTERVAL:
+            return _probe["info"]
+    info = None
+    if os.path.exists(socket_path()):
+        try:
+            info = request({"op": "ping"})
+        except (OSError, ValueError, RuntimeError):
+            info = None
+    with _lock:
+        _probe["checked_at"] = now
+        _probe["info"] = info
+    return info
+
+
+def mark_unavailable():
+    with _lock:
+        _probe["checked_at"] = time.monotonic()
+        _probe["info"] = None
+
+
+def _local(name):
+    from model_registry import get_model
+
+    mark_unavailable()
+    print("⚠️ Daemon de inferência indisponível, usando o modelo local.")
+    return get_model(name)
+
+
+class RemoteGrader:
+    """Proxy do BERTimbau-Grading hospedado no daemon."""
+
+    def __init__(self, revision):
+        self.revision = revision
+
+    def predict_batch(self, question_refs, student_answers, batch_size=32):
+        try:
+            response = request({
+                "op": "grade",
+                "question_refs": list(question_refs),
+                "student_answers": list(student_answers),
+            })
+        except OSError:
+            return _local("grading").predict_batch(question_refs, student_answers, batch_size)
+        return np.asarray(response["grades"], dtype=np.int64), np.asarray(response["confidences"], dtype=np.float32)
+
+
+class RemoteGenerator:
+    """
+    Proxy do Sabia7B-QAG hospedado no daemon.
+
+    O prompt viaja como texto: o KV-cache fica no daemon, que junta em lote os
+    pedidos de todos os clientes. Um lote com um único prompt (as regenerações
+    de um bloco) usa o KV-cache desse prompt, guardado no daemon.
+    """
+
+    def encode(self, prompt, cache_prompt=True):
+        return prompt
+
+    def _request(self, prompts, do_sample):
+        response = request({"op": "generate", "prompts": prompts, "do_sample": do_sample})
+        return response["texts"], response["stats"]
+
+    def generate(self, inputs, do_sample, stats=None, output_scores=False):
+        try:
+            texts, row_stats = self._request([inputs], do_sample)
+        except OSError:
+            local = _local("qag")
+            return local.generate(local.encode(inputs), do_sample, stats=stats, output_scores=output_scores)
+        _merge_stats(stats, row_stats)
+        return texts[0]
+
+    def sample(self, inputs, n, stats=None):
+        try:
+            texts, row_stats = self._request([inputs] * n, True)
+        except OSError:
+            local = _local("qag")
+            return local.sample(local.encode(inputs), n, stats=stats)
+        _merge_stats(stats, row_stats)
+        return texts
+
+    def generate_batch(self, prompts, do_sample, stats=None):
+        try:
+            texts, row_stats = self._request(list(prompts), do_sample)
+        except OSError:
+            return _local("qag").generate_batch(prompts, do_sample, stats=stats)
+        if stats is not None:
+            for target, source in zip(stats, row_stats):
+                _merge_stats(target, [source])
+        return texts
+
+
+def _merge_stats(stats, row_stats):
+    """Soma os tokens de todas as linhas; o tempo é o do lote, contado uma vez."""
+    if stats is None:
+        return
+    stats["new_tokens"] = stats.get("new_tokens", 0) + sum(row.get("new_tokens", 0) for row in row_stats)
+    stats["seconds"] = stats.get("seconds", 0.0) + max((row.get("seconds", 0.0) for row in row_stats), default=0.0)
+
+
+def remote_grader():
+    """Loader remoto do "grading": proxy se o daemon estiver rodando, senão None."""
+    info = daemon_info()
+    if info is None:
+        return None
+    revision = info.get("grading_revision")
+    with _lock:
+        proxy = _proxies.get("grading")
+        if proxy is None or proxy.revision != revision:
+            proxy = _proxies["grading"] = RemoteGrader(revision)
+        return proxy
+
+
+def remote_generator():
+    """Loader remoto do "qag": proxy se o daemon estiver rodando, senão None."""
+    if daemon_info() is None:
+        return None
+    with _lock:
+        return _proxies.setdefault("qag", RemoteGenerator())
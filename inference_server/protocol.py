@@ -0,0 +1,84 @@
+"""
+Protocolo entre o daemon de inferência e os clientes.
+
+Cada mensagem é um objeto JSON em uma linha, sobre um socket Unix:
+
+    {"op": "ping"}
+    {"op": "grade", "question_refs": [...], "student_answers": [...]}
+    {"op": "generate", "prompts": [...], "do_sample": false}
+
+A resposta tem os campos do resultado ou {"error": "..."}.
+
+O socket fica por padrão em um diretório só do usuário (`$XDG_RUNTIME_DIR/memento`
+ou `<tmp>/memento-<uid>`, modo 0700) e tem modo 0600; os clientes só conversam
+com um socket do próprio usuário (`check_socket`).
+"""
+import json
+import os
+import stat
+import tempfile
+
+SOCKET_ENV_VAR = "MEMENTO_DAEMON_SOCKET"
+DISABLE_ENV_VAR = "MEMENTO_USE_DAEMON"
+
+
+def socket_dir() -> str:
+    """Diretório padrão do socket, só do usuário."""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "memento")
+    return os.path.join(tempfile.gettempdir(), f"memento-{os.getuid()}")
+
+
+def socket_path() -> str:
+    return os.environ.get(SOCKET_ENV_VAR, os.path.join(socket_dir(), "inference.sock"))
+
+
+def _check_directory(directory):
+    # Em um diretório de outro usuário, o socket poderia ser trocado depois da
+    # verificação; o /tmp serve por causa do sticky bit
+    info = os.stat(directory)
+    if info.st_uid != os.getuid() and not info.st_mode & stat.S_ISVTX:
+        raise PermissionError(f"O diretório {directory} pertence a outro usuário")
+    if info.st_uid == os.getuid() and directory == socket_dir() and stat.S_IMODE(info.st_mode) & 0o077:
+        raise PermissionError(f"O diretório {directory} pode ser acessado por outros usuários")
+
+
+def prepare_socket_dir(path):
+    """
+    Cria o diretório do socket (modo 0700) e verifica se ele é seguro.
+
+    Raises:
+        PermissionError: Se o diretório for de outro usuário ou, sendo o padrão, aberto a outros
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    _check_directory(directory)
+
+
+def check_socket(path):
+    """
+    Verifica se o arquivo é um socket do próprio usuário antes de confiar nele.
+
+    Raises:
+        FileNotFoundError: Se o socket não existir
+        PermissionError: Se não for um socket ou pertencer a outro usuário
+    """
+    info = os.lstat(path)
+    if not stat.S_ISSOCK(info.st_mode):
+        raise PermissionError(f"{path} não é um socket")
+    if info.st_uid != os.getuid():
+        raise PermissionError(f"O socket {path} pertence a outro usuário")
+    _check_directory(os.path.dirname(os.path.abspath(path)))
+
+
+def send_message(sock_file, message):
+    sock_file.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+    sock_file.flush()
+
+
+def read_message(sock_file):
+    line = sock_file.readline()
+    if not line:
+        raise ConnectionError("Conexão encerrada pelo outro lado")
+    return json.loads(line.decode("utf-8"))
@@ -0,0 +1,241 @@
+"""
+Daemon local de inferência compartilhado por várias sessões do Memento.
+
+Carrega o Sabia7B-QAG e o BERTimbau-Grading uma única vez e atende os
+clientes por um socket Unix. Pedidos que chegam ao mesmo tempo, de clientes
+diferentes, são juntados em um único lote (batching dinâmico).
+
+Uso: python manage.py serve [--stub]
+"""
+import os
+import queue
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections import OrderedDict
+from inference_server.protocol import (socket_path, prepare_socket_dir, check_socket, send_message, read_message,
+                                       DISABLE_ENV_VAR)
+from model_registry import get_model, STUB_ENV_VAR, IDLE_ENV_VAR
+
+
+class _Batcher:
+    """
+    Junta itens de vários pedidos e os processa em lote numa thread própria.
+
+    Args:
+        process: Função que recebe a lista de itens e retorna a lista de resultados
+        max_batch: Máximo de itens por lote
+        max_wait: Segundos que o primeiro item espera por outros antes do lote sair
+    """
+
+    def __init__(self, process, max_batch, max_wait):
+        self.process = process
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, items):
+        """Enfileira os itens de um pedido e espera os resultados deles."""
+        done = threading.Event()
+        request = {"items": items, "results": None, "error": None, "done": done}
+        self._queue.put(request)
+        done.wait()
+        if request["error"] is not None:
+            raise request["error"]
+        return request["results"]
+
+    def _run(self):
+        while True:
+            requests = [self._queue.get()]
+            size = len(requests[0]["items"])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                requests.append(request)
+                size += len(request["items"])
+
+            items = [item for request in requests for item in request["items"]]
+            try:
+                results = self.process(items)
+                start = 0
+                for request in requests:
+                    end = start + len(request["items"])
+                    request["results"] = results[start:end]
+                    start = end
+            except Exception as e:
+                for request in requests:
+                    request["error"] = e
+            for request in requests:
+                request["done"].set()
+
+
+def _grade(items):
+    grades, confidences = get_model("grading").predict_batch(
+        [question_ref for question_ref, _ in items],
+        [student_answer for _, student_answer in items],
+        batch_size=32,
+    )
+    return [(int(grade), float(confidence)) for grade, confidence in zip(grades, confidences)]
+
+
+# Prompts codificados (com o KV-cache) guardados no daemon. Cada um ocupa
+# centenas de MB na GPU com o modelo real, então o LRU é pequeno: cobre as
+# regenerações seguidas do mesmo bloco por um ou dois clientes
+PROMPT_CACHE_SIZE = 2
+_encoded_prompts = OrderedDict()
+_encoded_lock = threading.Lock()
+
+
+def _encode(qag, prompt):
+    with _encoded_lock:
+        if prompt in _encoded_prompts:
+            _encoded_prompts.move_to_end(prompt)
+            return _encoded_prompts[prompt]
+    inputs = qag.encode(prompt)
+    with _encoded_lock:
+        _encoded_prompts[prompt] = inputs
+        while len(_encoded_prompts) > PROMPT_CACHE_SIZE:
+            _encoded_prompts.popitem(last=False)
+    return inputs
+
+
+def _generator(do_sample):
+    def generate(prompts):
+        qag = get_model("qag")
+        if len(set(prompts)) == 1:
+            # Um só prompt no lote (regenerações do generate_qa): usa o KV-cache
+            # do prompt, como o modelo local, em vez de codificá-lo de novo
+            inputs = _encode(qag, prompts[0])
+            stats = {}
+            if do_sample:
+                texts = qag.sample(inputs, len(prompts), stats=stats)
+            else:
+                # Greedy é determinístico: uma geração serve a todos os pedidos iguais
+                texts = [qag.generate(inputs, do_sample=False, stats=stats)] * len(prompts)
+            # Os clientes somam os tokens das linhas: o total vai na primeira
+            return list(zip(texts, [stats] + [{} for _ in prompts[1:]]))
+
+        stats = [{} for _ in prompts]
+        texts = qag.generate_batch(prompts, do_sample=do_sample, stats=stats)
+        return list(zip(texts, stats))
+    return generate
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, max_batch=16, max_wait=0.02):
+        self.batchers = {
+            "grade": _Batcher(_grade, max_batch * 2, max_wait),
+            "greedy": _Batcher(_generator(False), max_batch, max_wait),
+            "sample": _Batcher(_generator(True), max_batch, max_wait),
+        }
+        super().__init__(path, _Handler)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                message = read_message(self.rfile)
+            except ConnectionError:
+                return
+            try:
+                send_message(self.wfile, self._dispatch(message))
+            except Exception as e:
+                send_message(self.wfile, {"error": f"{type(e).__name__}: {e}"})
+
+    def _dispatch(self, message):
+        op = message.get("op")
+        batchers = self.server.batchers
+        if op == "ping":
+            from grading.grading import _current_revision
+
+            return {"ok": True, "pid": os.getpid(), "grading_revision": _current_revision()}
+        if op == "grade":
+            results = batchers["grade"].submit(list(zip(message["question_refs"], message["student_answers"])))
+            return {"grades": [grade for grade, _ in results], "confidences": [confidence for _, confidence in results]}
+        if op == "generate":
+            batcher = batchers["sample" if message.get("do_sample") else "greedy"]
+            results = batcher.submit(message["prompts"])
+            return {"texts": [text for text, _ in results], "stats": [stats for _, stats in results]}
+        raise ValueError(f"Operação desconhecida: {op}")
+
+
+def _socket_in_use(path):
+    """Se já há um daemon atendendo no socket (um arquivo que recusa conexões é de um daemon que morreu)."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(1.0)
+        try:
+            sock.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            return False
+        except socket.timeout:
+            return True
+    return True
+
+
+def serve(path=None, stub=False, max_batch=16, max_wait_ms=20, preload=True):
+    """
+    Inicia o daemon e atende até ser interrompido (Ctrl+C).
+
+    Returns:
+        bool: False se outro daemon já estiver atendendo no mesmo socket, ou se o
+        socket ou o diretório dele forem de outro usuário
+    """
+    # O próprio daemon nunca vira cliente de si mesmo
+    os.environ[DISABLE_ENV_VAR] = "0"
+    if stub:
+        os.environ[STUB_ENV_VAR] = "1"
+    # O daemon existe para manter os modelos prontos: só a falta de memória os descarrega
+    os.environ.setdefault(IDLE_ENV_VAR, "0")
+
+    # Os loaders dos modelos são registrados na importação dos módulos
+    import grading.grading  # noqa: F401
+    import qag.generator  # noqa: F401
+
+    path = path or socket_path()
+    try:
+        prepare_socket_dir(path)
+        if os.path.lexists(path):
+            check_socket(path)
+    except PermissionError as e:
+        print(f"❌ {e}.")
+        return False
+    if os.path.lexists(path):
+        if _socket_in_use(path):
+            print(f"❌ Já existe um daemon de inferência ouvindo em {path}.")
+            return False
+        # Socket de um daemon que não terminou direito
+        os.remove(path)
+
+    if preload:
+        print("⏳ Carregando modelos...")
+        get_model("grading")
+        get_model("qag")
+
+    server = InferenceServer(path, max_batch=max_batch, max_wait=max_wait_ms / 1000)
+    # Só o próprio usuário conecta (o diretório padrão já é 0700)
+    os.chmod(path, 0o600)
+    print(f"✅ Daemon de inferência ouvindo em {path}{' (stub)' if stub else ''}")
+    # Encerrado pelo sistema (SIGTERM), também apaga o socket
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
+    return True
@@ -2,11 +2,12 @@ from auth.auth import login, register
 from pdf_extract.pdf_extractor import handle_pdf_upload
 from qag.generator import start_review
 from user_history.user_history import user_history_menu
-from models import Base
+from migrations.migrations import migrate
 from database import engine
+from model_registry import prefetch, print_memory_report
 
-# Garante que as tabelas sejam criadas se não existirem
-Base.metadata.create_all(bind=engine)
+# Cria as tabelas que não existem e aplica as migrações pendentes
+migrate(engine, verbose=True)
 
 print("1. Login\n2. Registrar")
 escolha = input("Escolha: ")
@@ -17,11 +18,17 @@ if not user:
 while True:
     print("\nMenu:\n1. Carregar PDF\n2. Iniciar Revisão\n3. Gerenciar QAs\n4. Sair")
     op = input("Opção: ")
+    # Os modelos do menu começam a carregar enquanto a pessoa digita
     if op == "1":
+        prefetch("docling_converter")
+        prefetch("qag")
         handle_pdf_upload(user)
     elif op == "2":
+        prefetch("grading")
         start_review(user)
     elif op == "3":
         user_history_menu(user)
     elif op == "4":
         break
+
+print_memory_report()
@@ -0,0 +1,236 @@
+"""
+Comandos de manutenção do Memento.
+
+Uso: python manage.py <comando> [opções]
+"""
+import argparse
+import sys
+import time
+from sqlalchemy import distinct, inspect, select
+from database import engine, SessionLocal
+from models import UserHistory
+from migrations.migrations import migrate, print_query_plans, schema_version
+from model_registry import peak_rss_mb
+
+
+def cmd_backfill_card_states(args):
+    from card_state.card_state import backfill_card_states
+
+    db = SessionLocal()
+    try:
+        total = backfill_card_states(db, user_id=args.user)
+    finally:
+        db.close()
+    print(f"✅ {total} cards atualizados em cards_state.")
+
+
+def cmd_gc_blobs(args):
+    from pdf_extract.blob_store import collect_garbage
+
+    db = SessionLocal()
+    try:
+        removed, freed = collect_garbage(db, dry_run=args.dry_run)
+    finally:
+        db.close()
+    prefix = "Seriam removidos" if args.dry_run else "Removidos"
+    print(f"🗑️ {prefix} {removed} blobs ({freed / 1024 / 1024:.1f} MB).")
+
+
+def cmd_invalidate_docling_cache(args):
+    from pdf_extract.docling_cache import invalidate
+
+    removed = invalidate(content_hash=args.hash)
+    print(f"🗑️ {removed} arquivos removidos do cache do docling.")
+
+
+def cmd_ingest(args):
+    from pdf_extract.pdf_extractor import ingest_pdfs
+
+    ingest_pdfs(args.user, args.paths, token_limit=args.max_tokens)
+
+
+def cmd_serve(args):
+    from inference_server.server import serve
+
+    if not serve(path=args.socket, stub=args.stub, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms):
+        sys.exit(1)
+
+
+def cmd_forecast(args):
+    from scheduling.forecast import forecast_workload, print_forecast
+
+    db = SessionLocal()
+    try:
+        forecast = forecast_workload(db, user_id=args.user, horizon=args.days)
+    finally:
+        db.close()
+    print_forecast(forecast)
+
+
+def cmd_fit_scheduler(args):
+    from scheduling.scheduler import fit_user_parameters, reschedule_user_cards, get_scheduler
+
+    db = SessionLocal()
+    try:
+        user_ids = [args.user] if args.user else db.execute(select(distinct(UserHistory.user_id))).scalars().all()
+        for user_id in user_ids:
+            if not args.reschedule_only:
+                started = time.perf_counter()
+                try:
+                    _, review_count = fit_user_parameters(db, user_id)
+                except ImportError:
+                    print('❌ Otimizador do FSRS não instalado. Instale com: pip install "fsrs[optimizer]"')
+                    return
+                print(f"🧠 Usuário {user_id}: pesos ajustados com {review_count} revisões em {time.perf_counter() - started:.2f}s")
+
+            started = time.perf_counter()
+            changed = reschedule_user_cards(db, user_id, get_scheduler(user_id))
+            print(f"📅 Usuário {user_id}: {changed} cards reagendados em {time.perf_counter() - started:.2f}s")
+    finally:
+        db.close()
+
+    print(f"💾 Pico de memória do processo: {peak_rss_mb():.0f} MB")
+
+
+def cmd_compact_history(args):
+    from user_history.archive import compact_history
+
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        result = compact_history(db, user_id=args.user, keep_days=args.keep_days)
+    finally:
+        db.close()
+    print(f"🗜️ {result['rows']} revisões arquivadas em {result['segments']} segmentos "
+          f"({result['bytes'] / 1024 / 1024:.1f} MB) em {time.perf_counter() - started:.2f}s.")
+
+
+def cmd_export_history(args):
+    from user_history.archive import export_history
+
+    db = SessionLocal()
+    try:
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                count = export_history(db, args.user, f)
+            print(f"✅ {count} revisões exportadas para {args.output}.")
+        else:
+            export_history(db, args.user, sys.stdout)
+    finally:
+        db.close()
+
+
+def cmd_rebuild_user_stats(args):
+    from user_history.stats import rebuild_user_stats
+    from write_queue import run_write
+
+    count = run_write(lambda db: rebuild_user_stats(db, user_id=args.user))
+    print(f"✅ Estatísticas recalculadas para {count} usuários.")
+
+
+def cmd_prune_grading_cache(args):
+    from grading.grading import prune_cache, DB_CACHE_MAX_ROWS, DB_CACHE_MAX_DAYS
+    from write_queue import run_write
+
+    max_rows = args.max_rows if args.max_rows is not None else DB_CACHE_MAX_ROWS
+    max_days = args.days if args.days is not None else DB_CACHE_MAX_DAYS
+    deleted = run_write(lambda db: prune_cache(db, max_rows=max_rows, max_days=max_days))
+    print(f"🗑️ {deleted} notas removidas do cache de avaliação.")
+
+
+def cmd_migrate(args):
+    if args.explain and inspect(engine).get_table_names():
+        db = SessionLocal()
+        try:
+            print_query_plans(db, "antes")
+        finally:
+            db.close()
+
+    started = time.perf_counter()
+    applied = migrate(engine, verbose=True)
+    elapsed = time.perf_counter() - started
+
+    db = SessionLocal()
+    try:
+        version = schema_version(db)
+        if args.explain:
+            print_query_plans(db, "depois")
+    finally:
+        db.close()
+    if applied:
+        print(f"✅ {len(applied)} migrações aplicadas em {elapsed:.2f}s; esquema na versão {version}.")
+    else:
+        print(f"✅ O banco já está na versão {version}.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comandos de manutenção do Memento")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backfill = commands.add_parser("backfill-card-states", help="Reconstrói cards_state a partir do histórico")
+    backfill.add_argument("--user", type=int, help="ID do usuário (padrão: todos)")
+    backfill.set_defaults(func=cmd_backfill_card_states)
+
+    gc_blobs = commands.add_parser("gc-blobs", help="Remove PDFs armazenados que nenhum documento referencia")
+    gc_blobs.add_argument("--dry-run", action="store_true", help="Só mostra o que seria removido")
+    gc_blobs.set_defaults(func=cmd_gc_blobs)
+
+    invalidate_cache = commands.add_parser("invalidate-docling-cache", help="Apaga o cache de conversão e chunks do docling")
+    invalidate_cache.add_argument("--hash", help="SHA-256 do PDF (padrão: todo o cache)")
+    invalidate_cache.set_defaults(func=cmd_invalidate_docling_cache)
+
+    ingest = commands.add_parser("ingest", help="Processa vários PDFs em lote; as QAs ficam pendentes de aprovação")
+    ingest.add_argument("--user", type=int, required=True, help="ID do usuário dono dos PDFs")
+    ingest.add_argument("--max-tokens", type=int, default=1024, help="Tamanho máximo de cada bloco")
+    ingest.add_argument("paths", nargs="+", help="Caminhos dos PDFs")
+    ingest.set_defaults(func=cmd_ingest)
+
+    serve = commands.add_parser("serve", help="Inicia o daemon de inferência compartilhado pelas sessões")
+    serve.add_argument("--socket", help="Caminho do socket Unix (padrão: MEMENTO_DAEMON_SOCKET ou /tmp/memento-inference.sock)")
+    serve.add_argument("--stub", action="store_true", help="Usa os modelos stub (sem GPU), para testes")
+    serve.add_argument("--max-batch", type=int, default=16, help="Máximo de gerações por lote")
+    serve.add_argument("--max-wait-ms", type=int, default=20, help="Espera máxima por outros pedidos antes de rodar o lote")
+    serve.set_defaults(func=cmd_serve)
+
+    forecast = commands.add_parser("forecast", help="Previsão de revisões por dia para os próximos dias")
+    forecast.add_argument("--user", type=int, help="ID do usuário (padrão: todos)")
+    forecast.add_argument("--days", type=int, default=30, help="Horizonte da previsão, em dias")
+    forecast.set_defaults(func=cmd_forecast)
+
+    fit_scheduler = commands.add_parser("fit-scheduler", help="Ajusta os pesos do FSRS ao histórico e reagenda os cards")
+    fit_scheduler.add_argument("--user", type=int, help="ID do usuário (padrão: todos com histórico)")
+    fit_scheduler.add_argument("--reschedule-only", action="store_true", help="Só reagenda, com os pesos já salvos")
+    fit_scheduler.set_defaults(func=cmd_fit_scheduler)
+
+    compact = commands.add_parser("compact-history", help="Arquiva as revisões antigas do histórico em segmentos gzip")
+    compact.add_argument("--user", type=int, help="ID do usuário (padrão: todos)")
+    compact.add_argument("--keep-days", type=int, default=30, help="Revisões mais novas que isso ficam na tabela")
+    compact.set_defaults(func=cmd_compact_history)
+
+    export = commands.add_parser("export-history", help="Exporta todo o histórico do usuário (inclusive o arquivado) em JSONL")
+    export.add_argument("--user", type=int, required=True, help="ID do usuário")
+    export.add_argument("--output", help="Arquivo de saída (padrão: saída padrão)")
+    export.set_defaults(func=cmd_export_history)
+
+    rebuild_stats = commands.add_parser("rebuild-user-stats", help="Recalcula os totais de revisões e notas de user_stats")
+    rebuild_stats.add_argument("--user", type=int, help="ID do usuário (padrão: todos)")
+    rebuild_stats.set_defaults(func=cmd_rebuild_user_stats)
+
+    prune_grading = commands.add_parser("prune-grading-cache", help="Apaga notas antigas do cache de avaliação")
+    prune_grading.add_argument("--max-rows", type=int,
+                               help="Linhas mantidas, as mais novas (padrão: MEMENTO_GRADING_DB_CACHE_ROWS ou 200000)")
+    prune_grading.add_argument("--days", type=int, help="Idade máxima das notas (padrão: MEMENTO_GRADING_DB_CACHE_DAYS ou 180)")
+    prune_grading.set_defaults(func=cmd_prune_grading_cache)
+
+    migrate_parser = commands.add_parser("migrate", help="Aplica as migrações pendentes do esquema do banco")
+    migrate_parser.add_argument("--explain", action="store_true", help="Mostra os planos das consultas principais antes e depois")
+    migrate_parser.set_defaults(func=cmd_migrate)
+
+    args = parser.parse_args()
+    if args.func is not cmd_migrate:
+        migrate(engine, verbose=True)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Migrações do esquema do banco.
+
+A versão do esquema fica no próprio arquivo SQLite (`PRAGMA user_version`).
+`migrate` cria as tabelas que não existem (`create_all`) e aplica, em ordem, as
+migrações com versão maior que a do banco, gravando a nova versão depois de
+cada uma. Um banco novo já nasce com o esquema atual e recebe a última versão
+sem rodar nenhuma migração.
+
+Cada migração recebe a sessão e deve poder rodar de novo sem efeito (uma
+interrupção entre a migração e a gravação da versão a repete na próxima vez).
+Para mudar o esquema: altere o modelo em `models.py` e acrescente uma função
+ao final de `MIGRATIONS` com o que os bancos antigos precisam.
+"""
+import os
+import sqlite3
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+from models import Base, CardState, UserHistory, PDFDocument
+from card_state.card_state import backfill_card_states
+from pdf_extract.blob_store import BLOB_DIR, copy_blob, register_blob
+
+# Onde as versões antigas guardavam os uploads: uploads/<user_id>/<nome do arquivo>
+LEGACY_UPLOAD_DIR = os.path.dirname(BLOB_DIR)
+
+
+def _add_blob_columns(db):
+    """Colunas do blob store em pdf_documents, em bancos criados antes delas."""
+    columns = {column["name"] for column in inspect(db.connection()).get_columns("pdf_documents")}
+    if "original_name" not in columns:
+        db.execute(text("ALTER TABLE pdf_documents ADD COLUMN original_name VARCHAR(255)"))
+    if "blob_sha256" not in columns:
+        db.execute(text("ALTER TABLE pdf_documents ADD COLUMN blob_sha256 VARCHAR(64) REFERENCES pdf_blobs (sha256)"))
+
+
+def _backfill_card_states(db):
+    """cards_state a partir do histórico, em bancos anteriores a ela."""
+    has_states = db.query(CardState.id).first() is not None
+    has_history = db.query(UserHistory.id).first() is not None
+    if has_history and not has_states:
+        backfill_card_states(db)
+
+
+def _backfill_blobs(db):
+    """PDFs enviados antes do blob store passam para ele e entram na coleta de lixo."""
+    documents = {}
+    for document in db.query(PDFDocument).filter(PDFDocument.blob_sha256.is_(None)):
+        documents.setdefault(document.file_path, []).append(document)
+
+    legacy_files = []
+    for path, same_file in documents.items():
+        # Arquivo já removido do disco: o documento fica como está
+        if not os.path.exists(path):
+            continue
+        sha256, size = copy_blob(path)
+        blob = register_blob(db, sha256, size)
+        for document in same_file:
+            document.original_name = document.original_name or os.path.basename(path)
+            document.file_path = blob.path
+            document.blob_sha256 = sha256
+        if os.path.commonpath([LEGACY_UPLOAD_DIR, os.path.abspath(path)]) == LEGACY_UPLOAD_DIR:
+            legacy_files.append(path)
+
+    # A cópia antiga só é apagada depois que os documentos apontam para o blob;
+    # uma interrupção antes disso deixa só um arquivo a mais em uploads/
+    db.commit()
+    for path in legacy_files:
+        os.remove(path)
+
+
+# Mesmos nomes e colunas dos índices declarados em models.py
+INDEXES = (
+    ("ix_questions_answers_user_id", "questions_answers", "user_id"),
+    ("ix_questions_answers_pdf_block_id", "questions_answers", "pdf_block_id"),
+    ("ix_pdf_blocks_pdf_id", "pdf_blocks", "pdf_id"),
+    ("ix_users_history_qa_id_review", "users_history", "qa_id, review"),
+    ("ix_users_history_user_id_qa_id_review", "users_history", "user_id, qa_id, review"),
+)
+
+
+def _add_indexes(db):
+    """Índices das chaves estrangeiras e do histórico; ANALYZE atualiza as estatísticas do planejador."""
+    for name, table, columns in INDEXES:
+        db.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+    db.execute(text("ANALYZE"))
+
+
+# (versão, descrição, função), em ordem de versão
+MIGRATIONS = (
+    (1, "colunas do blob store em pdf_documents", _add_blob_columns),
+    (2, "backfill de cards_state a partir do histórico", _backfill_card_states),
+    (3, "índices de QAs, blocos e histórico", _add_indexes),
+    (4, "PDFs antigos de uploads/ no blob store", _backfill_blobs),
+)
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(db):
+    return db.execute(text("PRAGMA user_version")).scalar()
+
+
+def _set_schema_version(db, version):
+    # PRAGMA não aceita parâmetros; a versão vem sempre de MIGRATIONS
+    db.execute(text(f"PRAGMA user_version = {int(version)}"))
+
+
+def migrate(engine, verbose=False):
+    """
+    Atualiza o banco para a última versão do esquema.
+
+    Returns:
+        list: (versão, descrição) das migrações aplicadas
+    """
+    is_new = not inspect(engine).get_table_names()
+    Base.metadata.create_all(bind=engine)
+
+    applied = []
+    with Session(bind=engine) as db:
+        if is_new:
+            _set_schema_version(db, LATEST_VERSION)
+            db.commit()
+            return applied
+
+        current = schema_version(db)
+        for version, description, migration in MIGRATIONS:
+            if version <= current:
+                continue
+            if verbose:
+                print(f"🔧 Migração {version}: {description}...")
+            migration(db)
+            _set_schema_version(db, version)
+            db.commit()
+            applied.append((version, description))
+    return applied
+
+
+# Consultas principais e o índice que cada uma deve usar (parâmetros são só exemplos)
+QUERY_PLAN_CHECKS = (
+    ("QAs do usuário (listagem)",
+     "SELECT id FROM questions_answers WHERE user_id = ? AND id > ? ORDER BY id LIMIT 20", (1, 0),
+     "ix_questions_answers_user_id"),
+    ("QAs de um bloco",
+     "SELECT id FROM questions_answers WHERE pdf_block_id = ?", (1,),
+     "ix_questions_answers_pdf_block_id"),
+    ("blocos de um PDF",
+     "SELECT id FROM pdf_blocks WHERE pdf_id = ?", (1,),
+     "ix_pdf_blocks_pdf_id"),
+    ("última revisão de um QA",
+     "SELECT id FROM users_history WHERE qa_id = ? ORDER BY review DESC LIMIT 1", (1,),
+     "ix_users_history_qa_id_review"),
+    ("desempenho por QA",
+     "SELECT qa_id, count(*), max(review) FROM users_history WHERE user_id = ? GROUP BY qa_id", (1,),
+     "ix_users_history_user_id_qa_id_review"),
+    ("cards vencidos",
+     "SELECT qa_id FROM cards_state WHERE user_id = ? AND due <= ?", (1, "2100-01-01"),
+     "ix_cards_state_user_id_due"),
+)
+
+
+def explain_queries(db):
+    """
+    Roda EXPLAIN QUERY PLAN nas consultas de `QUERY_PLAN_CHECKS`.
+
+    Returns:
+        list: (nome, linhas do plano, índice esperado, se o plano usa o índice)
+    """
+    results = []
+    for name, sql, params, index in QUERY_PLAN_CHECKS:
+        cursor = db.connection().connection.cursor()
+        try:
+            plan = [row[-1] for row in cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        except sqlite3.OperationalError as e:
+            # Ex.: tabela que só existe depois da migração
+            plan = [f"erro: {e}"]
+        finally:
+            cursor.close()
+        results.append((name, plan, index, any(index in line for line in plan)))
+    return results
+
+
+def print_query_plans(db, title):
+    print(f"\n=== PLANOS DE CONSULTA ({title}) ===")
+    for name, plan, index, uses_index in explain_queries(db):
+        print(f"{'✅' if uses_index else '⚠️'} {name} (esperado: {index})")
+        for line in plan:
+            print(f"     {line}")
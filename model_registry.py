@@ -0,0 +1,399 @@
+"""
+Registro de modelos e bibliotecas pesadas carregados sob demanda.
+
+Os módulos registram uma função de carregamento (loader) para cada modelo e o
+registro só a executa na primeira vez que o modelo é pedido. Assim, importar
+`qag.generator`, `grading.grading` ou `pdf_extract.pdf_extractor` não carrega
+torch, transformers nem docling.
+
+Um modelo também pode ter um loader remoto, que retorna um proxy para o daemon
+de inferência (ver `inference_server`) quando ele está rodando, ou None.
+
+Os modelos carregados formam um pool: o registro guarda quando cada um foi
+usado pela última vez e uma thread de manutenção descarrega os que ficaram
+ociosos por `MEMENTO_MODEL_IDLE_SECONDS` ou, com pouca memória livre (RAM ou
+GPU abaixo de `MEMENTO_MODEL_MIN_FREE_MB`), os menos usados recentemente. Um
+modelo descarregado é recarregado no próximo `get_model`. Enquanto um trecho
+de código usa o modelo (`use_model`), ele não é descarregado. `prefetch`
+carrega um modelo em segundo plano, antes de ele ser pedido.
+"""
+import contextlib
+import ctypes
+import gc
+import importlib
+import os
+import resource
+import sys
+import threading
+import time
+
+# Quando ativo, os loaders "stub" são usados no lugar dos modelos reais
+STUB_ENV_VAR = "MEMENTO_STUB_MODELS"
+
+# Força o dispositivo dos modelos ("cuda" ou "cpu"); por padrão, GPU se houver
+DEVICE_ENV_VAR = "MEMENTO_DEVICE"
+# Threads de CPU por operação; por padrão, os núcleos disponíveis ao processo
+THREADS_ENV_VAR = "MEMENTO_CPU_THREADS"
+# Segundos sem uso até o modelo ser descarregado (0 desliga)
+IDLE_ENV_VAR = "MEMENTO_MODEL_IDLE_SECONDS"
+# Memória livre mínima (MB, na RAM e na GPU) antes de descarregar modelos ociosos (0 desliga)
+MIN_FREE_ENV_VAR = "MEMENTO_MODEL_MIN_FREE_MB"
+
+# Com pouca memória, só sai do pool o modelo sem uso há pelo menos isso (segundos),
+# para não recarregar o avaliador a cada resposta
+PRESSURE_MIN_IDLE = 30
+# Intervalo máximo entre as verificações da thread de manutenção (segundos)
+CHECK_INTERVAL = 30
+
+_loaders = {}
+_stub_loaders = {}
+_remote_loaders = {}
+_models = {}
+_lock = threading.RLock()
+
+# Pool: um lock de carregamento por modelo, último uso, usos em andamento e contadores
+_load_locks = {}
+_last_used = {}
+_in_use = {}
+_pool_stats = {}
+_reaper = None
+
+
+def use_stub_models() -> bool:
+    """Verifica se os modelos stub (sem GPU e sem rede) devem ser usados."""
+    return os.environ.get(STUB_ENV_VAR, "").lower() in ("1", "true", "yes")
+
+
+def get_device() -> str:
+    """Dispositivo dos modelos: MEMENTO_DEVICE, ou "cuda" se houver GPU, senão "cpu"."""
+    device = os.environ.get(DEVICE_ENV_VAR)
+    if device:
+        return device
+    torch = lazy_import("torch")
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def cpu_threads() -> int:
+    """Quantidade de threads intra-op para inferência na CPU."""
+    threads = os.environ.get(THREADS_ENV_VAR)
+    if threads:
+        return int(threads)
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def idle_seconds() -> float:
+    """Segundos sem uso até um modelo ser descarregado; 0 desliga a descarga por ociosidade."""
+    return float(os.environ.get(IDLE_ENV_VAR, "600"))
+
+
+def min_free_mb() -> float:
+    """Memória livre mínima, em MB; abaixo disso os modelos ociosos são descarregados."""
+    return float(os.environ.get(MIN_FREE_ENV_VAR, "1024"))
+
+
+def register_model(name: str, loader, stub_loader=None, remote_loader=None):
+    """
+    Registra a função que carrega um modelo.
+
+    Args:
+        name: Nome do modelo no registro
+        loader: Função sem argumentos que retorna o modelo carregado
+        stub_loader: Função alternativa usada quando os stubs estão ativos
+        remote_loader: Função que retorna um proxy para o daemon de inferência, ou None
+    """
+    with _lock:
+        _loaders[name] = loader
+        if stub_loader is not None:
+            _stub_loaders[name] = stub_loader
+        if remote_loader is not None:
+            _remote_loaders[name] = remote_loader
+
+
+def get_remote(name: str):
+    """Retorna o proxy do modelo no daemon de inferência, ou None se ele não estiver rodando."""
+    remote_loader = _remote_loaders.get(name)
+    if remote_loader is None:
+        return None
+    return remote_loader()
+
+
+def get_model(name: str):
+    """
+    Retorna o modelo registrado, carregando-o se ele não estiver no pool.
+
+    Se o daemon de inferência estiver rodando, retorna o proxy dele e o modelo
+    não é carregado neste processo.
+
+    Raises:
+        KeyError: Se nenhum loader foi registrado com esse nome
+    """
+    remote = get_remote(name)
+    if remote is not None:
+        return remote
+    return _acquire(name)
+
+
+@contextlib.contextmanager
+def use_model(name: str):
+    """
+    Entrega o modelo e o mantém no pool até o fim do bloco `with`.
+
+    Para trechos que guardam o modelo por mais tempo (uma geração interativa,
+    um lote de avaliações): descarregá-lo no meio não liberaria a memória,
+    pois a referência continua viva, e o próximo uso carregaria outra cópia.
+    """
+    remote = get_remote(name)
+    if remote is not None:
+        yield remote
+        return
+    model = _acquire(name, pin=True)
+    try:
+        yield model
+    finally:
+        with _lock:
+            _in_use[name] -= 1
+            _last_used[name] = time.monotonic()
+
+
+def _acquire(name, pin=False):
+    with _lock:
+        if name not in _loaders:
+            raise KeyError(f"Modelo não registrado: {name}")
+        load_lock = _load_locks.setdefault(name, threading.Lock())
+
+    # O lock é do modelo: carregar o QAG não trava quem usa o avaliador
+    with load_lock:
+        with _lock:
+            model = _models.get(name)
+            if model is not None:
+                _touch(name, pin)
+                return model
+
+        # Sem memória para o novo modelo, os outros ociosos saem antes
+        if _memory_pressure():
+            evict_models(min_idle=0, exclude=name)
+
+        started = time.perf_counter()
+        if use_stub_models() and name in _stub_loaders:
+            model = _stub_loaders[name]()
+        else:
+            model = _loaders[name]()
+
+        with _lock:
+            _models[name] = model
+            stats = _pool_stats.setdefault(name, {"loads": 0, "evictions": 0, "load_seconds": 0.0})
+            stats["loads"] += 1
+            stats["load_seconds"] += time.perf_counter() - started
+            _touch(name, pin)
+        _start_reaper()
+        return model
+
+
+def _touch(name, pin):
+    _last_used[name] = time.monotonic()
+    if pin:
+        _in_use[name] = _in_use.get(name, 0) + 1
+
+
+def is_loaded(name: str) -> bool:
+    """Verifica se o modelo já está carregado na memória."""
+    return name in _models
+
+
+def unload_model(name: str) -> bool:
+    """
+    Remove o modelo do registro; ele será recarregado no próximo uso.
+
+    Como em `evict_models`, um modelo em uso (`use_model`) fica no pool.
+
+    Returns:
+        bool: True se o modelo foi descarregado
+    """
+    with _lock:
+        if name not in _models or _in_use.get(name):
+            return False
+        del _models[name]
+        _last_used.pop(name, None)
+        _pool_stats[name]["evictions"] += 1
+    _release_memory()
+    return True
+
+
+def prefetch(name: str):
+    """
+    Começa a carregar o modelo em segundo plano, se ele ainda não estiver no pool.
+
+    Chamado ao entrar em um menu que vai precisar do modelo: o carregamento
+    corre enquanto a pessoa digita. Um `get_model` feito antes do fim espera o
+    mesmo carregamento em vez de começar outro.
+
+    Returns:
+        threading.Thread | None: A thread do carregamento, ou None se não houver o que carregar
+    """
+    if get_remote(name) is not None:
+        return None
+    with _lock:
+        if name in _models:
+            _last_used[name] = time.monotonic()
+            return None
+
+    def load():
+        try:
+            _acquire(name)
+        except Exception as e:
+            # O erro aparece de novo (e é tratado) quando o modelo for pedido
+            print(f"⚠️ Não foi possível pré-carregar o modelo {name}: {e}")
+
+    thread = threading.Thread(target=load, name=f"memento-prefetch-{name}", daemon=True)
+    thread.start()
+    return thread
+
+
+def evict_models(min_idle=None, exclude=None):
+    """
+    Descarrega os modelos ociosos, do uso mais antigo ao mais recente.
+
+    Sai do pool o modelo sem uso há `idle_seconds()` ou, com pouca memória
+    livre, há pelo menos `min_idle` segundos (padrão `PRESSURE_MIN_IDLE`).
+    Modelos em uso (`use_model`) ficam.
+
+    Returns:
+        list: Nomes dos modelos descarregados
+    """
+    if min_idle is None:
+        min_idle = PRESSURE_MIN_IDLE
+    idle = idle_seconds()
+    evicted = []
+    with _lock:
+        now = time.monotonic()
+        candidates = sorted(
+            (name for name in _models if name != exclude and not _in_use.get(name)),
+            key=lambda name: _last_used.get(name, 0),
+        )
+        for name in candidates:
+            idle_for = now - _last_used.get(name, 0)
+            expired = 0 < idle <= idle_for
+            if not expired and (idle_for < min_idle or not _memory_pressure()):
+                continue
+            del _models[name]
+            _last_used.pop(name, None)
+            _pool_stats[name]["evictions"] += 1
+            evicted.append(name)
+            # A pressão é medida de novo depois de devolver a memória deste modelo
+            _release_memory()
+    return evicted
+
+
+def _release_memory():
+    gc.collect()
+    # torch só é consultado se já foi importado por algum modelo
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    # Devolve ao sistema a memória liberada pelo malloc (glibc)
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def available_memory_mb():
+    """
+    Memória livre, em MB.
+
+    Returns:
+        dict: "ram" e, se algum modelo estiver na GPU, "gpu"
+    """
+    psutil = lazy_import("psutil")
+    available = {"ram": psutil.virtual_memory().available / 2 ** 20}
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        free, _ = torch.cuda.mem_get_info()
+        available["gpu"] = free / 2 ** 20
+    return available
+
+
+def _memory_pressure():
+    threshold = min_free_mb()
+    if threshold <= 0:
+        return False
+    return any(free < threshold for free in available_memory_mb().values())
+
+
+def _start_reaper():
+    global _reaper
+    with _lock:
+        if _reaper is not None and _reaper.is_alive():
+            return
+        _reaper = threading.Thread(target=_reap, name="memento-model-pool", daemon=True)
+        _reaper.start()
+
+
+def _reap():
+    while True:
+        idle = idle_seconds()
+        time.sleep(min(CHECK_INTERVAL, idle / 4) if idle > 0 else CHECK_INTERVAL)
+        try:
+            evict_models()
+        except Exception as e:
+            print(f"⚠️ Erro ao descarregar modelos ociosos: {e}")
+
+
+def peak_rss_mb() -> float:
+    """Pico de memória residente do processo, em MB."""
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def memory_report():
+    """
+    Memória do processo e situação de cada modelo do pool.
+
+    Returns:
+        dict: RSS atual e de pico (MB), pico na GPU (MB, se usada) e, por modelo,
+        se está carregado, há quantos segundos não é usado, carregamentos e descargas
+    """
+    psutil = lazy_import("psutil")
+    report = {
+        "rss_mb": psutil.Process().memory_info().rss / 2 ** 20,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        report["peak_gpu_mb"] = torch.cuda.max_memory_allocated() / 2 ** 20
+    now = time.monotonic()
+    with _lock:
+        report["models"] = {
+            name: {
+                "loaded": name in _models,
+                "idle_s": now - _last_used[name] if name in _last_used else None,
+                **stats,
+            }
+            for name, stats in _pool_stats.items()
+        }
+    return report
+
+
+def print_memory_report():
+    report = memory_report()
+    print("\n=== MEMÓRIA ===")
+    print(f"💾 Pico de memória do processo: {report['peak_rss_mb']:.0f} MB (atual: {report['rss_mb']:.0f} MB)")
+    if "peak_gpu_mb" in report:
+        print(f"🎮 Pico de memória na GPU: {report['peak_gpu_mb']:.0f} MB")
+    for name, model in report["models"].items():
+        status = "carregado" if model["loaded"] else "descarregado"
+        print(f"   {name}: {status}, {model['loads']} carregamento(s) em {model['load_seconds']:.1f}s, "
+              f"{model['evictions']} descarga(s)")
+
+
+def lazy_import(module_name: str):
+    """
+    Importa um módulo pesado apenas no momento do uso.
+
+    Chamadas repetidas são baratas, pois o módulo fica em `sys.modules`.
+    """
+    return importlib.import_module(module_name)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Float
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Float, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -18,19 +18,38 @@ class PDFDocument(Base):
     file_path = Column(String(500), nullable=False)
     uploaded_at = Column(DateTime, default=datetime.utcnow)
     uploader_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    original_name = Column(String(255))
+    blob_sha256 = Column(String(64), ForeignKey("pdf_blobs.sha256"))
     
     # Relações
     blocks = relationship("PDFBlock", back_populates="pdf_document")
+    blob = relationship("PDFBlob", back_populates="documents")
+
+class PDFBlob(Base):
+    """Conteúdo de um PDF armazenado uma única vez, endereçado pelo SHA-256."""
+    __tablename__ = "pdf_blobs"
+    sha256 = Column(String(64), primary_key=True)
+    path = Column(String(500), nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Relações
+    documents = relationship("PDFDocument", back_populates="blob")
 
 class PDFBlock(Base):
     __tablename__ = "pdf_blocks"
     id = Column(Integer, primary_key=True)
     pdf_id = Column(Integer, ForeignKey("pdf_documents.id"), nullable=False)
     text_content = Column(Text, nullable=False)
+
+    __table_args__ = (
+        Index("ix_pdf_blocks_pdf_id", "pdf_id"),
+    )
     
     # Relações
     pdf_document = relationship("PDFDocument", back_populates="blocks")
     qas = relationship("QA", back_populates="pdf_block")
+    candidates = relationship("QACandidate", back_populates="pdf_block")
 
 class QA(Base):
     __tablename__ = "questions_answers"
@@ -39,10 +58,16 @@ class QA(Base):
     pdf_block_id = Column(Integer, ForeignKey("pdf_blocks.id"), nullable=False)
     question = Column(Text, nullable=False)
     answer = Column(Text, nullable=False)
+
+    __table_args__ = (
+        Index("ix_questions_answers_user_id", "user_id"),
+        Index("ix_questions_answers_pdf_block_id", "pdf_block_id"),
+    )
     
     # Relações
     pdf_block = relationship("PDFBlock", back_populates="qas")
     user_history = relationship("UserHistory", back_populates="qa")
+    card_state = relationship("CardState", back_populates="qa", uselist=False)
 
 class UserHistory(Base):
     __tablename__ = "users_history"
@@ -57,7 +82,110 @@ class UserHistory(Base):
     stability = Column(Float)
     review = Column(DateTime)
     due = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_users_history_qa_id_review", "qa_id", "review"),
+        Index("ix_users_history_user_id_qa_id_review", "user_id", "qa_id", "review"),
+    )
     
     # Relações
     qa = relationship("QA", back_populates="user_history")
-    user = relationship("User", back_populates="histories")
\ No newline at end of file
+    user = relationship("User", back_populates="histories")
+
+class CardState(Base):
+    """Estado FSRS mais recente de cada QA, atualizado junto com o UserHistory."""
+    __tablename__ = "cards_state"
+    id = Column(Integer, primary_key=True)
+    qa_id = Column(Integer, ForeignKey("questions_answers.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    state = Column(Integer)
+    step = Column(Integer)
+    difficulty = Column(Float)
+    stability = Column(Float)
+    review = Column(DateTime)
+    due = Column(DateTime)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "qa_id", name="uq_cards_state_user_id_qa_id"),
+        Index("ix_cards_state_user_id_due", "user_id", "due"),
+    )
+
+    # Relações
+    qa = relationship("QA", back_populates="card_state")
+
+class QACandidate(Base):
+    """QA gerada em lote, aguardando aprovação do usuário."""
+    __tablename__ = "qa_candidates"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    pdf_block_id = Column(Integer, ForeignKey("pdf_blocks.id"), nullable=False)
+    question = Column(Text, nullable=False)
+    answer = Column(Text, nullable=False)
+    strategy = Column(String(20), nullable=False)  # greedy | top_p
+    status = Column(String(20), nullable=False, default="pending")  # pending | approved | rejected | regenerate
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_qa_candidates_user_id_status", "user_id", "status"),
+    )
+
+    # Relações
+    pdf_block = relationship("PDFBlock", back_populates="candidates")
+
+class GradingCache(Base):
+    """Notas já calculadas pelo BERTimbau-Grading, por tripla normalizada e revisão do modelo."""
+    __tablename__ = "grading_cache"
+    key = Column(String(64), primary_key=True)
+    model_revision = Column(String(100), nullable=False)
+    grade = Column(Integer, nullable=False)
+    confidence = Column(Float, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class UserSchedulerParams(Base):
+    """Pesos do FSRS ajustados ao histórico de cada usuário."""
+    __tablename__ = "user_scheduler_params"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    parameters = Column(Text, nullable=False)  # lista JSON com os pesos
+    review_count = Column(Integer, nullable=False)
+    fitted_at = Column(DateTime, default=datetime.utcnow)
+
+class HistoryArchiveSegment(Base):
+    """Segmento (gzip JSONL) com linhas antigas do users_history, de um usuário e mês."""
+    __tablename__ = "history_archive_segments"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    month = Column(String(7), nullable=False)  # AAAA-MM da revisão
+    path = Column(String(500), nullable=False)
+    row_count = Column(Integer, nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_history_archive_segments_user_id_month", "user_id", "month"),
+    )
+
+class HistoryArchiveStats(Base):
+    """Agregados por QA das linhas já arquivadas, para as telas de desempenho."""
+    __tablename__ = "history_archive_stats"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    qa_id = Column(Integer, ForeignKey("questions_answers.id"), nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    grade_count = Column(Integer, nullable=False, default=0)
+    grade_sum = Column(Integer, nullable=False, default=0)
+    grade_min = Column(Integer)
+    grade_max = Column(Integer)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "qa_id", name="uq_history_archive_stats_user_id_qa_id"),
+    )
+
+class UserStats(Base):
+    """Totais de revisões de cada usuário, atualizados a cada revisão gravada."""
+    __tablename__ = "user_stats"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    total_reviews = Column(Integer, nullable=False, default=0)
+    graded_reviews = Column(Integer, nullable=False, default=0)
+    grade_sum = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,156 @@
+"""
+Armazenamento de PDFs endereçado por conteúdo.
+
+Cada upload é copiado em blocos de tamanho fixo e o SHA-256 é calculado na
+mesma passada. O arquivo fica em `uploads/blobs/<2 primeiros>/<sha256>.pdf`,
+uma única vez, não importa quantos usuários enviem o mesmo PDF.
+"""
+import hashlib
+import os
+import tempfile
+import time
+from models import PDFBlob, PDFDocument
+from write_queue import run_write
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BLOB_DIR = os.path.join(BASE_DIR, "uploads", "blobs")
+CHUNK_SIZE = 1024 * 1024  # 1 MB por leitura: memória constante mesmo para PDFs de 500 MB
+TMP_MAX_AGE = 3600  # arquivos mais novos que isso podem ser de um upload em andamento
+
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(BLOB_DIR, sha256[:2], f"{sha256}.pdf")
+
+
+def copy_blob(source_path: str):
+    """
+    Copia o arquivo para o blob store, calculando o hash durante a cópia.
+
+    Se o conteúdo já existe, a cópia temporária é descartada. Não usa o banco:
+    a cópia (até 500 MB) roda fora de qualquer transação e o registro é feito
+    depois, com `register_blob`.
+
+    Returns:
+        tuple: (sha256, tamanho em bytes)
+    """
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+
+    fd, tmp_path = tempfile.mkstemp(dir=BLOB_DIR, suffix=".tmp")
+    try:
+        with open(source_path, "rb") as src, os.fdopen(fd, "wb") as dst:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                dst.write(chunk)
+                size += len(chunk)
+
+        sha256 = digest.hexdigest()
+        final_path = blob_path(sha256)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+            # O blob volta a ser recente: o coletor de lixo não o remove antes do registro
+            os.utime(final_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return sha256, size
+
+
+def register_blob(db, sha256: str, size: int) -> PDFBlob:
+    """
+    Registra no banco um blob já copiado por `copy_blob`.
+
+    Returns:
+        PDFBlob: Registro do blob (novo ou existente), ainda não commitado
+
+    Raises:
+        FileNotFoundError: Se o coletor de lixo removeu o arquivo depois da cópia
+    """
+    if not os.path.exists(blob_path(sha256)):
+        raise FileNotFoundError(blob_path(sha256))
+    blob = db.get(PDFBlob, sha256)
+    if blob is None:
+        blob = PDFBlob(sha256=sha256, path=blob_path(sha256), size_bytes=size)
+        db.add(blob)
+    return blob
+
+
+def _is_recent(path):
+    # Arquivo ausente conta como antigo: não há o que proteger
+    try:
+        return time.time() - os.path.getmtime(path) < TMP_MAX_AGE
+    except FileNotFoundError:
+        return False
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def _unreferenced_blobs(db):
+    """Blobs sem PDFDocument cujo arquivo não foi copiado nem reutilizado recentemente."""
+    referenced = db.query(PDFDocument.id).filter(PDFDocument.blob_sha256 == PDFBlob.sha256).exists()
+    return [blob for blob in db.query(PDFBlob).filter(~referenced).all() if not _is_recent(blob.path)]
+
+
+def _orphan_files(db):
+    """Arquivos sem registro no banco (ex.: upload interrompido antes do commit)."""
+    if not os.path.isdir(BLOB_DIR):
+        return []
+    known = {sha for (sha,) in db.query(PDFBlob.sha256)}
+    orphans = []
+    for root, _, files in os.walk(BLOB_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            # Arquivos recentes (.tmp ou já no caminho final) podem ser um upload ainda não registrado
+            if name.split(".")[0] not in known and not _is_recent(path):
+                orphans.append(path)
+    return orphans
+
+
+def _delete_garbage(db):
+    # Roda na transação da fila de escrita (BEGIN IMMEDIATE): nenhum upload
+    # registra um blob entre a verificação e a remoção
+    removed = 0
+    freed = 0
+    for blob in _unreferenced_blobs(db):
+        freed += _file_size(blob.path)
+        if os.path.exists(blob.path):
+            os.remove(blob.path)
+        db.delete(blob)
+        removed += 1
+    for path in _orphan_files(db):
+        freed += _file_size(path)
+        os.remove(path)
+        removed += 1
+    return removed, freed
+
+
+def collect_garbage(db, dry_run=False):
+    """
+    Remove blobs que nenhum PDFDocument referencia, e arquivos órfãos no disco.
+
+    Arquivos copiados ou reutilizados há menos de `TMP_MAX_AGE` segundos ficam:
+    podem ser de um upload que ainda não gravou o PDFDocument. A remoção passa
+    pela fila de escrita e as referências são verificadas de novo dentro dela.
+
+    Returns:
+        tuple: (quantidade de blobs removidos, bytes liberados)
+    """
+    if dry_run:
+        blobs = _unreferenced_blobs(db)
+        orphans = _orphan_files(db)
+        freed = sum(blob.size_bytes for blob in blobs) + sum(_file_size(path) for path in orphans)
+        return len(blobs) + len(orphans), freed
+    return run_write(_delete_garbage)
@@ -0,0 +1,153 @@
+"""
+Cache em disco da conversão do docling e dos chunks gerados.
+
+- Documento convertido: `cache/documents/<sha256>.json`, chave = hash do PDF
+- Chunks: `cache/chunks/<sha256>-<configuração>.json`, chave = hash do PDF +
+  max_tokens + use_tokenizer_limit + tokenizer
+
+Os arquivos usados são "tocados" (mtime) a cada acerto e os mais antigos são
+removidos quando o cache passa do limite de tamanho (LRU).
+"""
+import hashlib
+import json
+import os
+import tempfile
+from model_registry import lazy_import
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, "cache")
+DOCUMENTS_DIR = os.path.join(CACHE_DIR, "documents")
+CHUNKS_DIR = os.path.join(CACHE_DIR, "chunks")
+
+# Limite de tamanho do cache, em MB (padrão: 2 GB)
+MAX_CACHE_MB = int(os.environ.get("MEMENTO_DOCLING_CACHE_MB", "2048"))
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _settings_key(max_tokens, use_tokenizer_limit, tokenizer_name) -> str:
+    settings = json.dumps([max_tokens, use_tokenizer_limit, tokenizer_name])
+    return hashlib.sha256(settings.encode()).hexdigest()[:16]
+
+
+def _chunks_path(content_hash, max_tokens, use_tokenizer_limit, tokenizer_name):
+    key = _settings_key(max_tokens, use_tokenizer_limit, tokenizer_name)
+    return os.path.join(CHUNKS_DIR, f"{content_hash}-{key}.json")
+
+
+def _document_path(content_hash):
+    return os.path.join(DOCUMENTS_DIR, f"{content_hash}.json")
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _atomic_write(path, write):
+    """Escreve em um arquivo temporário e renomeia, para nunca deixar cache pela metade."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_chunks(content_hash, max_tokens, use_tokenizer_limit, tokenizer_name):
+    """Retorna a lista de chunks em cache, ou None."""
+    path = _chunks_path(content_hash, max_tokens, use_tokenizer_limit, tokenizer_name)
+    try:
+        with open(path, encoding="utf-8") as f:
+            chunks = json.load(f)
+    except (OSError, ValueError):
+        return None
+    _touch(path)
+    return chunks
+
+
+def save_chunks(content_hash, max_tokens, use_tokenizer_limit, tokenizer_name, chunks):
+    path = _chunks_path(content_hash, max_tokens, use_tokenizer_limit, tokenizer_name)
+
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(chunks, f, ensure_ascii=False)
+
+    _atomic_write(path, write)
+    enforce_size_limit()
+
+
+def load_document(content_hash):
+    """Retorna o DoclingDocument convertido em cache, ou None."""
+    path = _document_path(content_hash)
+    if not os.path.exists(path):
+        return None
+    document = lazy_import("docling_core.types.doc.document")
+    try:
+        doc = document.DoclingDocument.load_from_json(path)
+    except (OSError, ValueError):
+        return None
+    _touch(path)
+    return doc
+
+
+def save_document(content_hash, doc):
+    _atomic_write(_document_path(content_hash), doc.save_as_json)
+    enforce_size_limit()
+
+
+def _cache_files():
+    files = []
+    for directory in (DOCUMENTS_DIR, CHUNKS_DIR):
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            if name.endswith(".json"):
+                path = os.path.join(directory, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, stat.st_size, path))
+    return files
+
+
+def enforce_size_limit(max_mb=None):
+    """Remove os arquivos usados há mais tempo até o cache caber no limite."""
+    limit = (MAX_CACHE_MB if max_mb is None else max_mb) * 1024 * 1024
+    files = sorted(_cache_files())
+    total = sum(size for _, size, _ in files)
+    for _, size, path in files:
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+def invalidate(content_hash=None):
+    """
+    Apaga entradas do cache.
+
+    Args:
+        content_hash: Apaga só o que for deste PDF; None apaga tudo
+
+    Returns:
+        int: Quantidade de arquivos removidos
+    """
+    removed = 0
+    for _, _, path in _cache_files():
+        if content_hash is None or os.path.basename(path).startswith(content_hash):
+            os.remove(path)
+            removed += 1
+    return removed
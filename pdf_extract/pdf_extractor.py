@@ -1,51 +1,174 @@
 import os
-from database import SessionLocal
-from models import PDFDocument, PDFBlock
-from qag.generator import generate_qa
-from docling.document_converter import DocumentConverter
-from docling.chunking import HybridChunker
+from write_queue import run_write
+from models import PDFDocument
+from qag.generator import generate_qa, generate_candidates
+from pdf_extract.pipeline import IngestionPipeline
+from pdf_extract.blob_store import copy_blob, register_blob
+from pdf_extract import docling_cache
+from model_registry import register_model, get_model, use_model, lazy_import
 import logging
-
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+import time
 
 logging.getLogger("docling").setLevel(logging.ERROR)
 
-def save_pdf(user_id, original_path, file_bytes):
-    user_dir = os.path.join(UPLOAD_DIR, str(user_id))
-    os.makedirs(user_dir, exist_ok=True)
-    filename = os.path.basename(original_path)
-    save_path = os.path.join(user_dir, filename)
-    if os.path.exists(save_path):
-        print(f"Arquivo {filename} já existe. Substituindo...")
-    with open(save_path, "wb") as f:
-        f.write(file_bytes)
-    return save_path
+CHUNK_TOKENIZER = "maritaca-ai/sabia-7b"
 
-def extract_blocks_with_docling(path, max_tokens=1024, use_tokenizer_limit=True):
+def _load_converter():
+    document_converter = lazy_import("docling.document_converter")
+    return document_converter.DocumentConverter()
+
+register_model("docling_converter", _load_converter)
+
+def get_converter():
+    """DocumentConverter único do processo; os modelos de layout são carregados uma vez só."""
+    return get_model("docling_converter")
+
+def get_chunker(max_tokens=1024, use_tokenizer_limit=True):
+    """HybridChunker reaproveitado entre uploads, um por configuração de chunking."""
+    return get_model(_chunker_name(max_tokens, use_tokenizer_limit))
+
+def _chunker_name(max_tokens, use_tokenizer_limit):
+    """Registra o HybridChunker da configuração e retorna o nome dele no registro."""
+    name = f"docling_chunker:{max_tokens}:{use_tokenizer_limit}"
+
+    def load():
+        # docling é importado só aqui: carregar o módulo já custa segundos
+        chunking = lazy_import("docling.chunking")
+        if use_tokenizer_limit:
+            return chunking.HybridChunker(
+                tokenizer=CHUNK_TOKENIZER, 
+                max_tokens=max_tokens,
+                merge_peers=True
+            )
+        return chunking.HybridChunker()
+
+    register_model(name, load)
+    return name
+
+def warm_up_docling(max_tokens=1024, use_tokenizer_limit=True):
+    """Carrega o conversor, o pipeline de PDF e o tokenizer do chunker antes do primeiro upload."""
+    base_models = lazy_import("docling.datamodel.base_models")
+    get_converter().initialize_pipeline(base_models.InputFormat.PDF)
+    get_chunker(max_tokens, use_tokenizer_limit)
+
+def register_pdf(db, original_path, sha256, size):
+    """Registra o PDF já copiado para o blob store; o mesmo conteúdo é armazenado uma única vez."""
+    blob = register_blob(db, sha256, size)
+    if blob.documents:
+        print(f"Arquivo {os.path.basename(original_path)} já armazenado. Reutilizando o conteúdo existente...")
+    return blob
+
+def iter_blocks_with_docling(path, max_tokens=1024, use_tokenizer_limit=True, content_hash=None):
     """
-    Extrai blocos do PDF.
+    Extrai blocos do PDF, entregando cada um assim que o chunker o produz.
     - Se use_tokenizer_limit=True: Usa o tokenizer do Sabiá-7b e respeita max_tokens.
     - Se use_tokenizer_limit=False: Usa chunking padrão por estrutura (sem contagem precisa de tokens).
+
+    A conversão e os chunks ficam em cache, indexados pelo hash do PDF (`content_hash`).
+    """
+    if content_hash is None:
+        content_hash = docling_cache.file_sha256(path)
+    tokenizer_name = CHUNK_TOKENIZER if use_tokenizer_limit else "default"
+
+    cached_chunks = docling_cache.load_chunks(content_hash, max_tokens, use_tokenizer_limit, tokenizer_name)
+    if cached_chunks is not None:
+        yield from cached_chunks
+        return
+
+    # Conversor e chunker ficam presos no pool até o fim: a thread de manutenção
+    # não os descarrega no meio de um PDF grande
+    doc = docling_cache.load_document(content_hash)
+    if doc is None:
+        with use_model("docling_converter") as converter:
+            doc = converter.convert(source=path).document
+        docling_cache.save_document(content_hash, doc)
+
+    chunks = []
+    with use_model(_chunker_name(max_tokens, use_tokenizer_limit)) as chunker:
+        for chunk in chunker.chunk(dl_doc=doc):
+            enriched_text = chunker.contextualize(chunk=chunk).strip()
+            chunks.append(enriched_text)
+            yield enriched_text
+
+    docling_cache.save_chunks(content_hash, max_tokens, use_tokenizer_limit, tokenizer_name, chunks)
+
+def extract_blocks_with_docling(path, max_tokens=1024, use_tokenizer_limit=True):
+    """Extrai todos os blocos do PDF de uma vez (ver `iter_blocks_with_docling`)."""
+    return list(iter_blocks_with_docling(path, max_tokens, use_tokenizer_limit))
+
+def ingest_pdf(user_id, path, interactive=True, token_limit=1024, use_tokenizer=True, batch_size=4):
     """
-    doc = DocumentConverter().convert(source=path).document
-    
-    if use_tokenizer_limit:
-        chunker = HybridChunker(
-            tokenizer="maritaca-ai/sabia-7b", 
-            max_tokens=max_tokens,
-            merge_peers=True
+    Salva o PDF, extrai os blocos e gera as QAs.
+
+    Args:
+        interactive: True aprova cada QA na hora; False gera candidatas para aprovar depois
+
+    Returns:
+        IngestionPipeline: Pipeline executado, com os tempos de cada estágio
+    """
+    # A cópia e o hash rodam antes: a transação de escrita só grava as linhas
+    sha256, size = copy_blob(path)
+
+    def save_document(db):
+        blob = register_pdf(db, path, sha256, size)
+        pdf_doc = PDFDocument(
+            file_path=blob.path,
+            original_name=os.path.basename(path),
+            blob_sha256=blob.sha256,
+            uploader_id=user_id,
         )
-    else:
-        chunker = HybridChunker()
-    
-    blocks = []
-    for i, chunk in enumerate(chunker.chunk(dl_doc=doc)):
-        enriched_text = chunker.contextualize(chunk=chunk)
-        blocks.append(enriched_text.strip())
-    
-    return blocks
+        db.add(pdf_doc)
+        db.flush()
+        return blob.path, blob.sha256, pdf_doc.id
+
+    try:
+        saved_path, content_hash, pdf_id = run_write(save_document)
+    except FileNotFoundError:
+        # O coletor de lixo removeu o blob entre a cópia e o registro: copia de novo
+        sha256, size = copy_blob(path)
+        saved_path, content_hash, pdf_id = run_write(save_document)
+
+    # Chunking e gravação rodam em threads; a geração consome os blocos aqui, na thread principal
+    pipeline = IngestionPipeline(
+        iter_blocks_with_docling(saved_path, max_tokens=token_limit, use_tokenizer_limit=use_tokenizer,
+                                 content_hash=content_hash),
+        pdf_id,
+    ).start()
+
+    total = 0
+    pending = []
+    for block in pipeline.blocks():
+        if interactive:
+            started = time.perf_counter()
+            generate_qa(block, user_id)
+            pipeline.generated(time.perf_counter() - started)
+            continue
+
+        pending.append(block)
+        if len(pending) == batch_size:
+            started = time.perf_counter()
+            total += generate_candidates(pending, user_id, batch_size=batch_size)
+            pipeline.generated(time.perf_counter() - started)
+            pending = []
+
+    if pending:
+        started = time.perf_counter()
+        total += generate_candidates(pending, user_id, batch_size=batch_size)
+        pipeline.generated(time.perf_counter() - started)
+
+    if not interactive:
+        print(f"📬 {total} QAs aguardando aprovação em 'Gerenciar QAs'.")
+
+    pipeline.report()
+    print(f"✅ PDF processado e salvo com {pipeline.timings['blocks']} blocos.")
+    return pipeline
+
+def ingest_pdfs(user_id, paths, token_limit=1024, use_tokenizer=True):
+    """Processa vários PDFs em lote, todos com o mesmo conversor e chunker já carregados."""
+    warm_up_docling(token_limit, use_tokenizer)
+    for path in paths:
+        print(f"\n⏳ Processando {path}...")
+        ingest_pdf(user_id, path, interactive=False, token_limit=token_limit, use_tokenizer=use_tokenizer)
 
 def handle_pdf_upload(user):
     path = input("Caminho do PDF: ")
@@ -54,32 +177,11 @@ def handle_pdf_upload(user):
         print("❌ Arquivo inválido. Por favor, selecione um PDF.")
         return
 
-    with open(path, "rb") as f:
-        file_bytes = f.read()
+    print("1. Interativo (aprovar cada QA agora)\n2. Em lote (gerar tudo e aprovar depois)")
+    modo = input("Modo de geração: ").strip()
+    if modo not in ("1", "2"):
+        print("❌ Opção inválida!")
+        return
 
     print("⏳ Processando PDF...")
-    saved_path = save_pdf(user.id, path, file_bytes)
-    
-    token_limit = 1024
-    use_tokenizer = True
-    blocks = extract_blocks_with_docling(
-        saved_path, 
-        max_tokens=token_limit, 
-        use_tokenizer_limit=use_tokenizer
-    )
-
-    db = SessionLocal()
-    pdf_doc = PDFDocument(file_path=saved_path, uploader_id=user.id)
-    db.add(pdf_doc)
-    db.commit()
-    db.refresh(pdf_doc)
- 
-    for i, block_text in enumerate(blocks):
-        block = PDFBlock(pdf_id=pdf_doc.id, text_content=block_text)
-        db.add(block)
-        db.commit()
-        db.refresh(block)
-
-        generate_qa(block, user.id)
-
-    print(f"✅ PDF processado e salvo com {len(blocks)} blocos.")
\ No newline at end of file
+    ingest_pdf(user.id, path, interactive=modo == "1")
\ No newline at end of file
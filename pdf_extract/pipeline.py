@@ -0,0 +1,147 @@
+"""
+Pipeline de ingestão de PDFs em estágios concorrentes.
+
+Conversão/chunking, gravação dos blocos e geração de QAs rodam ao mesmo tempo,
+ligados por filas limitadas: o primeiro bloco chega ao gerador enquanto as
+páginas seguintes ainda estão sendo divididas em chunks.
+"""
+import queue
+import threading
+import time
+from collections import namedtuple
+from models import PDFBlock
+from write_queue import run_write
+
+# Bloco já gravado no banco; é o que circula entre as threads (sem sessão associada)
+IngestedBlock = namedtuple("IngestedBlock", ["id", "pdf_id", "text_content"])
+
+_END = object()
+
+
+class IngestionPipeline:
+    """
+    Executa chunking e gravação em threads e entrega os blocos gravados em `blocks()`.
+
+    Args:
+        chunks: Iterável de textos (ex.: gerador de chunks do docling); é consumido na thread de chunking
+        pdf_id: ID do PDFDocument dono dos blocos
+        commit_every: Máximo de blocos gravados por commit
+        queue_size: Capacidade de cada fila entre estágios
+    """
+
+    def __init__(self, chunks, pdf_id, commit_every=16, queue_size=32):
+        self.chunks = chunks
+        self.pdf_id = pdf_id
+        self.commit_every = commit_every
+        self._texts = queue.Queue(maxsize=queue_size)
+        self._written = queue.Queue(maxsize=queue_size)
+        self._errors = []
+        self._threads = []
+        self.timings = {
+            "chunking": 0.0,
+            "writing": 0.0,
+            "generation": 0.0,
+            "first_block": None,
+            "first_generated": None,
+            "total": None,
+            "blocks": 0,
+            "commits": 0,
+        }
+        self._started_at = None
+
+    def start(self):
+        self._started_at = time.perf_counter()
+        for target in (self._chunk_stage, self._write_stage):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def _elapsed(self):
+        return time.perf_counter() - self._started_at
+
+    def _chunk_stage(self):
+        try:
+            iterator = iter(self.chunks)
+            while True:
+                started = time.perf_counter()
+                text = next(iterator, _END)
+                self.timings["chunking"] += time.perf_counter() - started
+                if text is _END:
+                    break
+                self._texts.put(text)
+        except Exception as e:
+            self._errors.append(e)
+        finally:
+            self._texts.put(_END)
+
+    def _insert_blocks(self, db, texts):
+        blocks = [PDFBlock(pdf_id=self.pdf_id, text_content=text) for text in texts]
+        db.add_all(blocks)
+        db.flush()
+        return [IngestedBlock(block.id, block.pdf_id, block.text_content) for block in blocks]
+
+    def _write_stage(self):
+        finished = False
+        try:
+            while not finished:
+                # Espera o próximo texto e junta o que já estiver na fila, até commit_every
+                pending = [self._texts.get()]
+                while len(pending) < self.commit_every and not self._texts.empty():
+                    pending.append(self._texts.get())
+                if pending[-1] is _END:
+                    pending.pop()
+                    finished = True
+                if not pending:
+                    continue
+
+                started = time.perf_counter()
+                written = run_write(lambda db: self._insert_blocks(db, pending))
+                self.timings["writing"] += time.perf_counter() - started
+                self.timings["commits"] += 1
+
+                if self.timings["first_block"] is None:
+                    self.timings["first_block"] = self._elapsed()
+                self.timings["blocks"] += len(written)
+                for block in written:
+                    self._written.put(block)
+        except Exception as e:
+            self._errors.append(e)
+            # Drena a fila para não bloquear a thread de chunking
+            while not finished and self._texts.get() is not _END:
+                pass
+        finally:
+            self._written.put(_END)
+
+    def blocks(self):
+        """Entrega os blocos na ordem do documento, assim que são gravados."""
+        while True:
+            block = self._written.get()
+            if block is _END:
+                break
+            yield block
+
+        for thread in self._threads:
+            thread.join()
+        self.timings["total"] = self._elapsed()
+        if self._errors:
+            raise self._errors[0]
+
+    def generated(self, seconds):
+        """Registra o tempo gasto pelo estágio de geração (executado por quem consome `blocks()`)."""
+        self.timings["generation"] += seconds
+        if self.timings["first_generated"] is None:
+            self.timings["first_generated"] = self._elapsed()
+
+    def report(self):
+        t = self.timings
+        print("\n⏱️ Tempos da ingestão:")
+        print(f"   Conversão e chunking: {t['chunking']:.2f}s")
+        print(f"   Gravação: {t['writing']:.2f}s ({t['blocks']} blocos em {t['commits']} commits)")
+        print(f"   Geração de QAs: {t['generation']:.2f}s")
+        if t["first_block"] is not None:
+            print(f"   Primeiro bloco gravado em: {t['first_block']:.2f}s")
+        if t["first_generated"] is not None:
+            print(f"   Primeira QA gerada em: {t['first_generated']:.2f}s")
+        if t["total"] is not None:
+            print(f"   Total: {t['total']:.2f}s")
@@ -0,0 +1,69 @@
+"""
+Avaliação em segundo plano durante a revisão.
+
+As respostas entram numa fila e uma thread as avalia (em lote, quando há mais
+de uma esperando) e aplica o FSRS, enquanto o usuário já responde a próxima
+pergunta. Os resultados são devolvidos na ordem em que as respostas foram dadas
+e saem da memória assim que entregues.
+"""
+import queue
+import threading
+
+_END = object()
+
+
+class AsyncReviewer:
+    """
+    Args:
+        process_batch: Função que recebe uma lista de itens e retorna a lista de resultados
+    """
+
+    def __init__(self, process_batch):
+        self.process_batch = process_batch
+        self._queue = queue.Queue()
+        self._results = {}
+        self._reported = 0
+        self._submitted = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        finished = False
+        while not finished:
+            # Junta tudo o que já estiver na fila para avaliar em um único lote
+            pending = [self._queue.get()]
+            while not self._queue.empty():
+                pending.append(self._queue.get())
+            if pending[-1] is _END:
+                pending.pop()
+                finished = True
+            if not pending:
+                continue
+
+            sequences = [seq for seq, _ in pending]
+            try:
+                results = self.process_batch([item for _, item in pending])
+            except Exception as e:
+                results = [e] * len(pending)
+            with self._lock:
+                for seq, result in zip(sequences, results):
+                    self._results[seq] = result
+
+    def submit(self, item):
+        self._queue.put((self._submitted, item))
+        self._submitted += 1
+
+    def completed(self):
+        """Resultados prontos ainda não reportados, em ordem (para no primeiro que falta)."""
+        ready = []
+        with self._lock:
+            while self._reported in self._results:
+                ready.append(self._results.pop(self._reported))
+                self._reported += 1
+        return ready
+
+    def finish(self):
+        """Espera a fila esvaziar; os resultados restantes saem no próximo `completed()`."""
+        self._queue.put(_END)
+        self._thread.join()
@@ -0,0 +1,99 @@
+"""
+Buffer de QAs candidatas para o "g = gerar de novo" do generate_qa.
+
+Várias amostras Top-p são geradas em uma única chamada ao modelo, já
+interpretadas e sem duplicatas. A primeira leva só é gerada no primeiro "g";
+depois, cada "g" retira a próxima do buffer e uma nova leva é gerada em
+segundo plano quando o buffer está quase vazio.
+"""
+import threading
+from collections import deque
+
+
+class CandidateBuffer:
+    """
+    Args:
+        qag: Backend do modelo (precisa de `sample(inputs, n)`)
+        inputs: Prompt já codificado pelo backend
+        seen: Conjunto de (pergunta, resposta) já mostrados; é atualizado pelo buffer
+        parse: Função que extrai (pergunta, resposta) do texto gerado
+        size: Amostras geradas por chamada ao modelo
+        low_water: Quando o buffer fica com isso ou menos, uma nova leva começa em segundo plano
+        max_attempts: Levas seguidas sem nenhuma QA nova antes de desistir
+        stats: Dicionário onde o backend acumula tokens gerados e tempo (opcional)
+    """
+
+    def __init__(self, qag, inputs, seen, parse, size=4, low_water=1, max_attempts=3, stats=None):
+        self.qag = qag
+        self.inputs = inputs
+        self.seen = seen
+        self.parse = parse
+        self.size = size
+        self.low_water = low_water
+        self.max_attempts = max_attempts
+        self._candidates = deque()
+        self._refill_thread = None
+        self._lock = threading.Lock()
+        self._error = None
+        self._closed = False
+        self.stats = stats
+
+    def _refill(self):
+        try:
+            for _ in range(self.max_attempts):
+                if self._closed:
+                    return
+                decoded_batch = self.qag.sample(self.inputs, self.size, stats=self.stats)
+                added = 0
+                with self._lock:
+                    for decoded in decoded_batch:
+                        candidate = self.parse(decoded)
+                        if candidate in self.seen:
+                            continue
+                        self.seen.add(candidate)
+                        self._candidates.append(candidate)
+                        added += 1
+                if added:
+                    return
+        except Exception as e:
+            self._error = e
+
+    def refill_async(self):
+        """Começa a gerar uma nova leva em segundo plano, se nenhuma estiver em andamento."""
+        if self._closed or (self._refill_thread is not None and self._refill_thread.is_alive()):
+            return
+        self._refill_thread = threading.Thread(target=self._refill, daemon=True)
+        self._refill_thread.start()
+
+    def close(self):
+        """
+        Chamado quando o bloco é resolvido: nenhuma leva nova começa e a que
+        estiver em andamento termina antes de `seen` e `stats` serem lidos.
+        """
+        self._closed = True
+        if self._refill_thread is not None:
+            self._refill_thread.join()
+
+    def pop(self):
+        """
+        Retorna a próxima (pergunta, resposta) inédita, ou None se o modelo
+        não produzir nada novo depois de `max_attempts` levas.
+        """
+        with self._lock:
+            empty = not self._candidates
+        if empty:
+            self.refill_async()
+            self._refill_thread.join()
+            if self._error is not None:
+                error, self._error = self._error, None
+                raise error
+
+        with self._lock:
+            if not self._candidates:
+                return None
+            candidate = self._candidates.popleft()
+            remaining = len(self._candidates)
+
+        if remaining <= self.low_water:
+            self.refill_async()
+        return candidate
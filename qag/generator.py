@@ -1,12 +1,23 @@
-from database import SessionLocal
-from models import QA, UserHistory, PDFBlock
+from database import session_scope
+from models import QA, UserHistory, PDFBlock, CardState, QACandidate
+from card_state.card_state import get_due_cards
+import copy
+import functools
+import os
+import time
+import threading
+from collections import deque, namedtuple
 from datetime import datetime, timezone
-from fsrs import Scheduler, Card, Rating, State
-from grading.grading import predict_grade
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from transformers import BitsAndBytesConfig
+from fsrs import Card, Rating, State
+from grading.grading import predict_grades
+from scheduling.scheduler import get_scheduler
+from qag.async_review import AsyncReviewer
+from qag.review_writer import ReviewWriter
+from write_queue import run_write
+from qag.candidate_buffer import CandidateBuffer
+from model_registry import register_model, get_model, use_model, get_device, cpu_threads, lazy_import
+from inference_server.client import remote_generator
 from time_travel import get_current_time, prompt_for_travel_date
-import torch
 
 # FSRS
 rating_map = {
@@ -20,30 +31,325 @@ state_map = {
     2: State.Review,
     3: State.Relearning,
 }
-scheduler = Scheduler()
 
 # Modelo QAG
-bnb_config = BitsAndBytesConfig(
-    load_in_4bit=True,
-    bnb_4bit_quant_type="nf4",
-    bnb_4bit_compute_dtype=torch.float16,
+model_name_qag = "graziele-fagundes/Sabia7B-QAG"
+
+# Instrução fixa no início de todo prompt; o KV-cache dela é calculado uma vez só
+INSTRUCTION = (
+    "Dado o contexto, gere uma pergunta e uma resposta. "
+    "A resposta de cada pergunta é um segmento do contexto correspondente. "
+    "A resposta deve ser curta e direta.\n"
 )
-model_qag = AutoModelForCausalLM.from_pretrained("graziele-fagundes/Sabia7B-QAG", device_map="cuda", quantization_config=bnb_config)
-tokenizer_qag = AutoTokenizer.from_pretrained("graziele-fagundes/Sabia7B-QAG", use_fast=True)   
+
+# Prompt tokenizado e o KV-cache de todos os seus tokens, exceto o último
+PromptState = namedtuple("PromptState", ["input_ids", "cache"])
+
+# Orçamento de tokens novos por geração: uma pergunta e uma resposta curtas
+max_new_tokens = int(os.environ.get("MEMENTO_QAG_MAX_NEW_TOKENS", "128"))
+
+# Tokens gerados e tempo gasto nos últimos blocos (ver `record_generation_stats`)
+GENERATION_STATS_SIZE = 1000
+generation_stats = deque(maxlen=GENERATION_STATS_SIZE)
+
+
+def _add_stats(stats, new_tokens, seconds):
+    if stats is not None:
+        stats["new_tokens"] = stats.get("new_tokens", 0) + int(new_tokens)
+        stats["seconds"] = stats.get("seconds", 0.0) + seconds
+
+
+_answer_line_stop_class = None
+
+
+def _answer_line_stop(tokenizer, prompt_length):
+    """
+    Critério de parada: encerra cada sequência assim que a linha
+    "### Resposta: ..." é concluída com uma quebra de linha.
+    """
+    global _answer_line_stop_class
+    if _answer_line_stop_class is None:
+        torch = lazy_import("torch")
+        transformers = lazy_import("transformers")
+
+        class AnswerLineStop(transformers.StoppingCriteria):
+            # Tokens decodificados de novo na busca do marcador: cobre "### Resposta:" partido em tokens
+            MARKER_WINDOW = 16
+
+            def __init__(self, tokenizer, prompt_length):
+                self.tokenizer = tokenizer
+                self.prompt_length = prompt_length
+                self.checked_length = prompt_length
+                # Por sequência: [achou o marcador, a resposta já tem texto, terminou]
+                self.rows = None
+
+            def __call__(self, input_ids, scores, **kwargs):
+                # Só os tokens novos de cada passo são decodificados (mais uma janela
+                # curta enquanto o marcador não aparece), não a sequência inteira
+                if self.rows is None:
+                    self.rows = [[False, False, False] for _ in range(input_ids.shape[0])]
+                for row, state in zip(input_ids, self.rows):
+                    if state[2]:
+                        continue
+                    if state[0]:
+                        text = self.tokenizer.decode(row[self.checked_length:], skip_special_tokens=True)
+                    else:
+                        start = max(self.prompt_length, self.checked_length - self.MARKER_WINDOW)
+                        text = self.tokenizer.decode(row[start:], skip_special_tokens=True)
+                        if "### Resposta:" not in text:
+                            continue
+                        state[0] = True
+                        text = text.split("### Resposta:", 1)[1]
+                    if not state[1]:
+                        text = text.lstrip()
+                        state[1] = bool(text)
+                    state[2] = "\n" in text
+                self.checked_length = input_ids.shape[1]
+                return torch.tensor([state[2] for state in self.rows], dtype=torch.bool, device=input_ids.device)
+
+        _answer_line_stop_class = AnswerLineStop
+    return _answer_line_stop_class(tokenizer, prompt_length)
+
+
+def _exclusive(method):
+    """Serializa o uso do modelo entre threads."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class _SabiaGenerator:
+    """Sabia7B-QAG quantizado em 4 bits na GPU, ou em bfloat16 na CPU (bitsandbytes exige GPU)."""
+
+    def __init__(self):
+        torch = lazy_import("torch")
+        transformers = lazy_import("transformers")
+        self.device = get_device()
+        if self.device == "cpu":
+            torch.set_num_threads(cpu_threads())
+            self.model = transformers.AutoModelForCausalLM.from_pretrained(model_name_qag, device_map="cpu", torch_dtype=torch.bfloat16)
+        else:
+            bnb_config = transformers.BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_quant_type="nf4",
+                bnb_4bit_compute_dtype=torch.float16,
+            )
+            self.model = transformers.AutoModelForCausalLM.from_pretrained(model_name_qag, device_map=self.device, quantization_config=bnb_config)
+        self.tokenizer = transformers.AutoTokenizer.from_pretrained(model_name_qag, use_fast=True)
+
+        self._prefix_ids = None
+        self._prefix_cache = None
+        # Um único uso do modelo por vez (o buffer de candidatas gera em outra thread)
+        self._lock = threading.RLock()
+
+    def _instruction_cache(self):
+        """KV-cache da instrução fixa, compartilhado por todos os blocos."""
+        if self._prefix_cache is None:
+            torch = lazy_import("torch")
+            cache_utils = lazy_import("transformers.cache_utils")
+            self._prefix_ids = self.tokenizer(INSTRUCTION, return_tensors="pt").input_ids.to(self.device)
+            with torch.no_grad():
+                output = self.model(input_ids=self._prefix_ids, past_key_values=cache_utils.DynamicCache(), use_cache=True)
+            self._prefix_cache = output.past_key_values
+        return self._prefix_ids, self._prefix_cache
+
+    @_exclusive
+    def encode(self, prompt, cache_prompt=True):
+        """
+        Tokeniza o prompt e pré-calcula o KV-cache dele, reaproveitado em cada regeneração.
+
+        O cache da instrução só é reaproveitado se a tokenização do prompt completo
+        começar exatamente pelos mesmos tokens; caso contrário o prompt é codificado inteiro.
+        """
+        input_ids = self.tokenizer(prompt, return_tensors="pt").input_ids.to(self.device)
+        if not cache_prompt:
+            return PromptState(input_ids, None)
+
+        torch = lazy_import("torch")
+        cache_utils = lazy_import("transformers.cache_utils")
+        prefix_ids, prefix_cache = self._instruction_cache()
+        prefix_length = prefix_ids.shape[1]
+        if input_ids.shape[1] > prefix_length and torch.equal(input_ids[:, :prefix_length], prefix_ids):
+            cache = copy.deepcopy(prefix_cache)
+        else:
+            prefix_length = 0
+            cache = cache_utils.DynamicCache()
+
+        # O generate precisa de pelo menos um token fora do cache
+        with torch.no_grad():
+            output = self.model(input_ids=input_ids[:, prefix_length:-1], past_key_values=cache, use_cache=True)
+        return PromptState(input_ids, output.past_key_values)
+
+    def _generate(self, input_ids, stats=None, output_scores=False, **kwargs):
+        """
+        Chamada comum ao `model.generate`: orçamento de tokens novos, parada ao fim
+        da linha de resposta e contagem de tokens gerados.
+        """
+        transformers = lazy_import("transformers")
+        prompt_length = input_ids.shape[1]
+        started = time.perf_counter()
+        output = self.model.generate(
+            input_ids=input_ids,
+            max_new_tokens=max_new_tokens,
+            stopping_criteria=transformers.StoppingCriteriaList([_answer_line_stop(self.tokenizer, prompt_length)]),
+            return_dict_in_generate=True,
+            output_scores=output_scores,
+            **kwargs
+        )
+        seconds = time.perf_counter() - started
+
+        new_tokens = output.sequences[:, prompt_length:]
+        if self.tokenizer.pad_token_id is not None:
+            counts = (new_tokens != self.tokenizer.pad_token_id).sum(dim=1).tolist()
+        else:
+            counts = [new_tokens.shape[1]] * new_tokens.shape[0]
+        if isinstance(stats, list):
+            # Um dicionário por prompt do lote
+            for row_stats, count in zip(stats, counts):
+                _add_stats(row_stats, count, seconds)
+        else:
+            _add_stats(stats, sum(counts), seconds)
+        return self.tokenizer.batch_decode(output.sequences, skip_special_tokens=True)
+
+    @_exclusive
+    def generate(self, inputs, do_sample, stats=None, output_scores=False):
+        sampling = {"top_p": 0.9} if do_sample else {}
+        if inputs.cache is not None:
+            # Cópia: o generate estende o cache e ele precisa continuar valendo para a próxima regeneração
+            sampling["past_key_values"] = copy.deepcopy(inputs.cache)
+        return self._generate(inputs.input_ids, stats, output_scores, do_sample=do_sample, **sampling)[0]
+
+    @_exclusive
+    def sample(self, inputs, n, stats=None):
+        """Gera `n` amostras Top-p do mesmo prompt em uma única chamada ao modelo."""
+        if inputs.cache is None:
+            return self._generate(inputs.input_ids, stats, do_sample=True, top_p=0.9, num_return_sequences=n)
+
+        # Com o KV-cache do prompt, o lote é montado à mão: o generate não replica o cache
+        cache = copy.deepcopy(inputs.cache)
+        cache.batch_repeat_interleave(n)
+        return self._generate(inputs.input_ids.repeat(n, 1), stats, past_key_values=cache, do_sample=True, top_p=0.9)
+
+    @_exclusive
+    def generate_batch(self, prompts, do_sample, stats=None):
+        """Gera uma QA para cada prompt em um único forward pass (prompts com padding à esquerda)."""
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.tokenizer.padding_side = "left"
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.device)
+        sampling = {"top_p": 0.9} if do_sample else {}
+        return self._generate(
+            inputs.input_ids,
+            stats,
+            attention_mask=inputs.attention_mask,
+            do_sample=do_sample,
+            pad_token_id=self.tokenizer.pad_token_id,
+            **sampling
+        )
+
+
+class _StubGenerator:
+    """Gerador determinístico, sem torch, para testes e benchmarks."""
+
+    def __init__(self):
+        self._calls = 0
+
+    def encode(self, prompt, cache_prompt=True):
+        return prompt
+
+    def generate(self, inputs, do_sample, stats=None, output_scores=False):
+        context = inputs.split("### Contexto:")[-1].split("### Pergunta:")[0].strip()
+        words = context.split() or ["contexto"]
+        if do_sample:
+            self._calls += 1
+        start = self._calls % len(words)
+        subject = " ".join(words[start:start + 5])
+        generated = f" O que diz o trecho sobre {subject}\n### Resposta: {subject}\n"
+        _add_stats(stats, len(generated.split()), 0.0)
+        return inputs + generated
+
+    def sample(self, inputs, n, stats=None):
+        return [self.generate(inputs, do_sample=True, stats=stats) for _ in range(n)]
+
+    def generate_batch(self, prompts, do_sample, stats=None):
+        stats = stats or [None] * len(prompts)
+        return [self.generate(prompt, do_sample, stats=row_stats) for prompt, row_stats in zip(prompts, stats)]
+
+
+register_model("qag", _SabiaGenerator, stub_loader=_StubGenerator, remote_loader=remote_generator)
+
+
+def record_generation_stats(block_id, stats, verbose=True):
+    """Guarda os tokens gerados e a vazão (tokens/s) de um bloco em `generation_stats` (só os últimos blocos)."""
+    new_tokens = stats.get("new_tokens", 0)
+    seconds = stats.get("seconds", 0.0)
+    record = {
+        "block_id": block_id,
+        "new_tokens": new_tokens,
+        "seconds": seconds,
+        "tokens_per_second": new_tokens / seconds if seconds else None,
+    }
+    generation_stats.append(record)
+    if verbose and seconds:
+        print(f"⏱️ Bloco {block_id}: {new_tokens} tokens gerados em {seconds:.2f}s ({record['tokens_per_second']:.1f} tokens/s)")
+    return record
+
+
+def build_prompt(text_content):
+    return INSTRUCTION + f"### Contexto: {text_content}\n### Pergunta:"
+
+
+def parse_qa(decoded):
+    if "### Pergunta:" in decoded and "### Resposta:" in decoded:
+        question = decoded.split("### Pergunta:")[1].split("### Resposta:")[0].strip()
+        answer = decoded.split("### Resposta:")[1].strip()
+    else:
+        question = decoded.strip()
+        answer = ""
+    return question, answer
+
+
+def format_qa(question, answer):
+    # Deixa pergunta e resposta bem formuladas (? e . no final) (primeira letra maiúscula)
+    if not question.endswith("?"):
+        question += "?"
+    if not answer.endswith("."):
+        answer += "."
+    question = question[0].upper() + question[1:]
+    answer = answer[0].upper() + answer[1:]
+    return question, answer
+
+
+def save_qa(user_id, block_id, question, answer):
+    run_write(lambda db: db.add(QA(user_id=user_id, pdf_block_id=block_id, question=question, answer=answer)))
 
 
 def generate_qa(block, user_id):
-    prompt = (
-        "Dado o contexto, gere uma pergunta e uma resposta. "
-        "A resposta de cada pergunta é um segmento do contexto correspondente. "
-        "A resposta deve ser curta e direta.\n"
-        f"### Contexto: {block.text_content}\n### Pergunta:"
-    )
-    inputs = tokenizer_qag(prompt, return_tensors="pt").input_ids.to("cuda")
+    stats = {}
+    try:
+        # O QAG fica no pool durante toda a aprovação interativa do bloco
+        with use_model("qag"):
+            return _generate_qa(block, user_id, stats)
+    finally:
+        record_generation_stats(block.id, stats)
+
+
+def _generate_qa(block, user_id, stats):
+    prompt = build_prompt(block.text_content)
+    qag = get_model("qag")
+    inputs = qag.encode(prompt)
 
-    db = SessionLocal()
     seen_qas = set()
+    candidates = CandidateBuffer(qag, inputs, seen_qas, parse_qa, stats=stats)
+    try:
+        return _approve_qa(block, user_id, qag, inputs, seen_qas, candidates, stats)
+    finally:
+        candidates.close()
 
+
+def _approve_qa(block, user_id, qag, inputs, seen_qas, candidates, stats):
     print("\n" + "=" * 100)
     print(f"📘 Texto usado como contexto (tamanho {len(block.text_content)}):\n{block.text_content}\n")
 
@@ -51,33 +357,14 @@ def generate_qa(block, user_id):
     # Etapa 1: Greedy
     # ==========================
     while True:
-        output = model_qag.generate(
-            input_ids=inputs,
-            max_length=2048,
-            return_dict_in_generate=True,
-            output_scores=True,
-            do_sample=False
-        )
-        decoded = tokenizer_qag.decode(output.sequences[0], skip_special_tokens=True)
-
-        if "### Pergunta:" in decoded and "### Resposta:" in decoded:
-            question = decoded.split("### Pergunta:")[1].split("### Resposta:")[0].strip()
-            answer = decoded.split("### Resposta:")[1].strip()
-        else:
-            question = decoded.strip()
-            answer = ""
+        decoded = qag.generate(inputs, do_sample=False, stats=stats)
+        question, answer = parse_qa(decoded)
 
         if (question, answer) in seen_qas:
             return []
         seen_qas.add((question, answer))
 
-        # Deixa pergunta e resposta bem formuladas (? e . no final) (primeira letra maiúscula)
-        if not question.endswith("?"):
-            question += "?"
-        if not answer.endswith("."):
-            answer += "."
-        question = question[0].upper() + question[1:]
-        answer = answer[0].upper() + answer[1:]
+        question, answer = format_qa(question, answer)
 
         print("=" * 60)
         print("✨ Estratégia: Greedy Search")
@@ -88,10 +375,7 @@ def generate_qa(block, user_id):
         user_input = input("👉 Digite [a = aprovar | r = reprovar | g = gerar de novo] > ").lower()
 
         if user_input == 'a':
-            qa = QA(user_id=user_id, pdf_block_id=block.id, question=question, answer=answer)
-            db.add(qa)
-            db.commit()
-            db.refresh(qa)
+            save_qa(user_id, block.id, question, answer)
             print("✅ QA aprovada e salva!")
             return [(question, answer)]
 
@@ -111,35 +395,12 @@ def generate_qa(block, user_id):
     # Etapa 2: Top-p (loop até decidir)
     # ==========================
     while True:
-        output = model_qag.generate(
-            input_ids=inputs,
-            max_length=2048,
-            return_dict_in_generate=True,
-            output_scores=True,
-            do_sample=True,
-            top_p=0.9
-        )
-        decoded = tokenizer_qag.decode(output.sequences[0], skip_special_tokens=True)
-
-        if "### Pergunta:" in decoded and "### Resposta:" in decoded:
-            question = decoded.split("### Pergunta:")[1].split("### Resposta:")[0].strip()
-            answer = decoded.split("### Resposta:")[1].strip()
-        else:
-            question = decoded.strip()
-            answer = ""
-
-        if (question, answer) in seen_qas:
-            print("⚠️ QA duplicada encontrada, gerando de novo...")
-            continue
-        seen_qas.add((question, answer))
+        candidate = candidates.pop()
+        if candidate is None:
+            print("⚠️ Não foi possível gerar uma QA diferente. Passando para o próximo bloco.")
+            return []
 
-        # Deixa pergunta e resposta bem formuladas (? e . no final) (primeira letra maiúscula)
-        if not question.endswith("?"):
-            question += "?"
-        if not answer.endswith("."):
-            answer += "."
-        question = question[0].upper() + question[1:]
-        answer = answer[0].upper() + answer[1:]
+        question, answer = format_qa(*candidate)
 
         print("=" * 60)
         print("✨ Estratégia: Top-p Sampling")
@@ -150,10 +411,7 @@ def generate_qa(block, user_id):
         user_input = input("👉 Digite [a = aprovar | r = reprovar | g = gerar de novo] > ").lower()
 
         if user_input == 'a':
-            qa = QA(user_id=user_id, pdf_block_id=block.id, question=question, answer=answer)
-            db.add(qa)
-            db.commit()
-            db.refresh(qa)
+            save_qa(user_id, block.id, question, answer)
             print("✅ QA aprovada e salva!")
             return [(question, answer)]
 
@@ -170,7 +428,136 @@ def generate_qa(block, user_id):
             continue
 
 
-def create_card_from_history(history: UserHistory | None) -> Card:
+def generate_candidates(blocks, user_id, batch_size=4, do_sample=False):
+    """
+    Gera QAs candidatas para vários blocos sem interação com o usuário.
+
+    Os blocos são processados em lotes de `batch_size` por chamada ao modelo e
+    as candidatas ficam em `qa_candidates` aguardando aprovação.
+
+    Returns:
+        int: Quantidade de candidatas salvas
+    """
+    strategy = "top_p" if do_sample else "greedy"
+    total = 0
+    for start in range(0, len(blocks), batch_size):
+        batch = blocks[start:start + batch_size]
+        prompts = [build_prompt(block.text_content) for block in batch]
+        batch_stats = [{} for _ in batch]
+        with use_model("qag") as qag:
+            decoded_batch = qag.generate_batch(prompts, do_sample=do_sample, stats=batch_stats)
+        for block, block_stats in zip(batch, batch_stats):
+            record_generation_stats(block.id, block_stats, verbose=False)
+
+        generated = [(block.id, *format_qa(*parse_qa(decoded))) for block, decoded in zip(batch, decoded_batch)]
+        total += run_write(lambda db: _save_candidates(db, user_id, generated, strategy))
+        print(f"⏳ {min(start + batch_size, len(blocks))}/{len(blocks)} blocos processados...")
+    return total
+
+
+def _save_candidates(db, user_id, generated, strategy):
+    """Grava as candidatas (bloco, pergunta, resposta) que ainda não existem; retorna quantas."""
+    saved = 0
+    for block_id, question, answer in generated:
+        duplicated = db.query(QACandidate.id).filter_by(
+            pdf_block_id=block_id, question=question, answer=answer
+        ).first()
+        if duplicated:
+            continue
+        db.add(QACandidate(
+            user_id=user_id,
+            pdf_block_id=block_id,
+            question=question,
+            answer=answer,
+            strategy=strategy,
+        ))
+        saved += 1
+    return saved
+
+
+def _pending_candidates(user_id, status):
+    with session_scope() as db:
+        return db.query(QACandidate, PDFBlock).join(
+            PDFBlock, QACandidate.pdf_block_id == PDFBlock.id
+        ).filter(
+            QACandidate.user_id == user_id,
+            QACandidate.status == status
+        ).order_by(QACandidate.id).all()
+
+
+def _set_candidates_status(db, candidate_ids, status):
+    db.query(QACandidate).filter(QACandidate.id.in_(candidate_ids)).update(
+        {QACandidate.status: status}, synchronize_session=False
+    )
+
+
+def _approve_candidate(db, candidate, user_id):
+    db.add(QA(user_id=user_id, pdf_block_id=candidate.pdf_block_id,
+              question=candidate.question, answer=candidate.answer))
+    _set_candidates_status(db, [candidate.id], "approved")
+
+
+def review_candidates(user):
+    """
+    Fila de aprovação das QAs geradas em lote; não chama o modelo entre um item e outro.
+
+    As leituras usam sessões curtas e cada decisão é gravada pela fila de escrita,
+    sem transação aberta enquanto a pessoa lê a QA.
+    """
+    while True:
+        pending = _pending_candidates(user.id, "pending")
+
+        if pending:
+            print(f"\n📬 {len(pending)} QAs pendentes de aprovação.")
+        for candidate, block in pending:
+            print("\n" + "=" * 100)
+            print(f"📘 Texto usado como contexto (tamanho {len(block.text_content)}):\n{block.text_content}\n")
+            print("=" * 60)
+            print(f"✨ Estratégia: {'Top-p Sampling' if candidate.strategy == 'top_p' else 'Greedy Search'}")
+            print(f"\nPergunta:\n{candidate.question}")
+            print(f"Resposta:\n{candidate.answer}\n")
+            print("=" * 60)
+
+            while True:
+                user_input = input("👉 Digite [a = aprovar | r = reprovar | g = gerar de novo | s = sair] > ").lower()
+                if user_input in ("a", "r", "g", "s"):
+                    break
+                print("⚠️ Opção inválida.")
+
+            if user_input == "s":
+                return
+            try:
+                if user_input == "a":
+                    run_write(lambda db: _approve_candidate(db, candidate, user.id))
+                    print("✅ QA aprovada e salva!")
+                elif user_input == "r":
+                    run_write(lambda db: _set_candidates_status(db, [candidate.id], "rejected"))
+                    print("❌ QA rejeitada.")
+                else:
+                    run_write(lambda db: _set_candidates_status(db, [candidate.id], "regenerate"))
+                    print("🔄 Bloco marcado para gerar de novo.")
+            except Exception as e:
+                # A candidata continua pendente e volta na próxima vez
+                print(f"❌ Erro ao salvar a decisão: {e}")
+
+        # Blocos marcados com "g" são gerados de novo, todos juntos, em lote
+        marked = _pending_candidates(user.id, "regenerate")
+
+        if not marked:
+            if not pending:
+                print("\n📭 Nenhuma QA pendente de aprovação.")
+            return
+
+        regenerar = input(f"\n🔄 Gerar novas QAs (Top-p) para {len(marked)} blocos agora? (s/n): ").strip().lower()
+        if regenerar != "s":
+            return
+        blocks = list({block.id: block for _, block in marked}.values())
+        marked_ids = [candidate.id for candidate, _ in marked]
+        run_write(lambda db: _set_candidates_status(db, marked_ids, "rejected"))
+        generate_candidates(blocks, user.id, do_sample=True)
+
+
+def create_card_from_history(history: UserHistory | CardState | None) -> Card:
     card = Card()
     if history:
         card.state = state_map.get(history.state)
@@ -185,12 +572,82 @@ def create_card_from_history(history: UserHistory | None) -> Card:
 
     return card
 
-def get_latest_history(db, qa_id):
-    return db.query(UserHistory).filter_by(qa_id=qa_id).order_by(UserHistory.review.desc()).first()
+ReviewResult = namedtuple("ReviewResult", ["qa", "bert_grade", "confidence", "grade", "history", "due"])
+
+def grade_answers(items, user_id, now):
+    """
+    Avalia as respostas e aplica o FSRS.
+
+    Args:
+        items: Lista de (QA, estado atual do card, resposta do usuário)
+
+    Returns:
+        list: ReviewResult na mesma ordem; `history` é None se a nota for inválida
+    """
+    grades, confidences = predict_grades([(qa.question, qa.answer, user_answer) for qa, _, user_answer in items])
+    # Pesos do FSRS ajustados ao usuário (ou os padrão)
+    scheduler = get_scheduler(user_id)
+
+    results = []
+    for (qa, history, user_answer), bert_grade, confidence in zip(items, grades, confidences):
+        bert_grade = int(bert_grade)
+        grade = bert_grade + 1  # Converter de 0-3 para 1-4
+        rating = rating_map.get(grade)
+        if not rating:
+            results.append(ReviewResult(qa, bert_grade, float(confidence), grade, None, None))
+            continue
+
+        card = create_card_from_history(history)
+
+        updated_card, review_log = scheduler.review_card(card = card, rating = rating, review_datetime=now)
+
+        # Garantir que due está em UTC para armazenar no banco
+        due_utc = None
+        if updated_card.due:
+            # Se due tem tzinfo, converter para UTC
+            if updated_card.due.tzinfo is not None:
+                due_utc = updated_card.due.astimezone(timezone.utc).replace(tzinfo=timezone.utc)
+            else:
+                # Se é naive, assumir que já é UTC
+                due_utc = updated_card.due.replace(tzinfo=timezone.utc)
+
+        new_history = UserHistory(
+            qa_id=qa.id,
+            user_id=user_id,
+            user_answer=user_answer,
+            state=updated_card.state.value,
+            step=updated_card.step,
+            difficulty=updated_card.difficulty,
+            stability=updated_card.stability,
+            grade=grade,
+            review=now,
+            due=due_utc
+        )
+        results.append(ReviewResult(qa, bert_grade, float(confidence), grade, new_history, due_utc))
+
+    return results
+
+def print_review_result(result):
+    print(f"\nNota BERTimbau-Grading (0-3): {result.bert_grade} (confiança {result.confidence:.2f})")
+    print(f"Nota FSRS (1-4): {result.grade}")
+    if result.history is None:
+        print("Nota inválida. Pulando.")
+        return
+
+    # Exibir em hora local para o usuário
+    if result.due:
+        local_time = result.due.astimezone()
+        print(f"Próxima revisão: {local_time.strftime('%d/%m/%Y %H:%M')}")
+
+def print_async_results(results):
+    for result in results:
+        if isinstance(result, Exception):
+            print("\nErro:", result)
+            continue
+        print(f"\n📝 Resultado — {result.qa.question}")
+        print_review_result(result)
 
 def start_review(user):
-    db = SessionLocal()
-    
     # Menu: Normal ou Teste
     print("\n" + "="*50)
     print("MODO DE REVISÃO")
@@ -210,18 +667,9 @@ def start_review(user):
         print("❌ Opção inválida!")
         return
 
-    qas = db.query(QA, PDFBlock).join(
-        PDFBlock, QA.pdf_block_id == PDFBlock.id
-    ).filter(QA.user_id == user.id).all()
-
-    revisables = []
-    for qa, b in qas:
-        history = get_latest_history(db, qa.id)
-        due = history.due if history else None
-        if due is not None:
-            due = due.replace(tzinfo=timezone.utc)
-        if due is None or due <= now:
-            revisables.append((qa, b, history))
+    # Uma única consulta em cards_state (índice user_id, due); a sessão fecha em seguida
+    with session_scope() as db:
+        revisables = get_due_cards(db, user.id, now)
 
     # Filtro opcional por ID de QA
     if modo == "2" and revisables:
@@ -244,60 +692,59 @@ def start_review(user):
 
     print(f"\n📒 Hoje ({now.astimezone().strftime('%d/%m/%Y %H:%M')}) você tem {len(revisables)} QAs para revisar.")
 
-    for qa, b, history in revisables:
-        print("\n" + "-"*50)
-        print("Pergunta:", qa.question)
-        user_answer = input("\nSua resposta: ")
-        try:
-            print("\nGabarito:", qa.answer)
-            bert_grade, confidence = predict_grade(qa.question, qa.answer, user_answer)
-            grade = bert_grade + 1  # Converter de 0-3 para 1-4
-            print(f"\nNota BERTimbau-Grading (0-3): {bert_grade} (confiança {confidence:.2f})")
-            print(f"Nota FSRS (1-4): {grade}")
-            rating = rating_map.get(grade)
-            if not rating:
-                print("Nota inválida. Pulando.")
-                continue
-        except Exception as e:
-            print("Erro:", e)
-            continue
+    em_segundo_plano = input("\n⚡ Avaliar em segundo plano (a próxima pergunta aparece na hora)? (s/N): ").strip().lower() == "s"
 
-        card = create_card_from_history(history)
-        
-        updated_card, review_log = scheduler.review_card(card = card, rating = rating, review_datetime=now)
+    # As revisões são gravadas em lotes; o que estiver pendente é gravado ao sair (inclusive com Ctrl+C)
+    with ReviewWriter() as writer:
+        if em_segundo_plano:
+            review_in_background(writer, user, revisables, now)
+            return
 
-        # Garantir que due está em UTC para armazenar no banco
-        due_utc = None
-        if updated_card.due:
-            # Se due tem tzinfo, converter para UTC
-            if updated_card.due.tzinfo is not None:
-                due_utc = updated_card.due.astimezone(timezone.utc).replace(tzinfo=timezone.utc)
-            else:
-                # Se é naive, assumir que já é UTC
-                due_utc = updated_card.due.replace(tzinfo=timezone.utc)
+        for qa, b, history in revisables:
+            print("\n" + "-"*50)
+            print("Pergunta:", qa.question)
+            user_answer = input("\nSua resposta: ")
+            try:
+                print("\nGabarito:", qa.answer)
+                result = grade_answers([(qa, history, user_answer)], user.id, now)[0]
+            except Exception as e:
+                print("Erro:", e)
+                continue
 
-        new_history = UserHistory(
-            qa_id=qa.id,
-            user_id=user.id,
-            user_answer=user_answer,
-            state=updated_card.state.value,
-            step=updated_card.step,
-            difficulty=updated_card.difficulty,
-            stability=updated_card.stability,
-            grade=grade,
-            review=now,
-            due=due_utc
-        )
-        db.add(new_history)
+            print_review_result(result)
+            if result.history is None:
+                continue
 
-        # Exibir em hora local para o usuário
-        if updated_card.due:
-            local_due = updated_card.due
-            if local_due.tzinfo is None:
-                local_due = local_due.replace(tzinfo=timezone.utc)
-            local_time = local_due.astimezone()
-            print(f"Próxima revisão: {local_time.strftime('%d/%m/%Y %H:%M')}")
-        db.commit()
+            writer.add(result.history)
 
     print("\n" + "-"*50)
-    print("✅ Revisão concluída.")
\ No newline at end of file
+    print("✅ Revisão concluída.")
+
+def save_async_results(writer, results):
+    print_async_results(results)
+    for result in results:
+        if not isinstance(result, Exception) and result.history is not None:
+            writer.add(result.history)
+
+def review_in_background(writer, user, revisables, now):
+    """
+    Revisão com avaliação assíncrona: notas e FSRS são calculados numa thread
+    enquanto o usuário responde; cada resultado vai para o `writer` assim que fica pronto.
+    """
+    reviewer = AsyncReviewer(lambda items: grade_answers(items, user.id, now))
+    try:
+        for qa, b, history in revisables:
+            save_async_results(writer, reviewer.completed())
+            print("\n" + "-"*50)
+            print("Pergunta:", qa.question)
+            user_answer = input("\nSua resposta: ")
+            print("\nGabarito:", qa.answer)
+            reviewer.submit((qa, history, user_answer))
+    finally:
+        # Mesmo com Ctrl+C ou erro, as respostas já dadas são avaliadas e gravadas
+        print("\n⏳ Aguardando as últimas avaliações...")
+        reviewer.finish()
+        save_async_results(writer, reviewer.completed())
+        writer.flush()
+        print("\n" + "-"*50)
+        print(f"✅ Revisão concluída. {writer.saved} respostas salvas.")
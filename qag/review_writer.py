@@ -0,0 +1,85 @@
+"""
+Gravação das revisões em lote.
+
+Cada resposta avaliada gera uma linha no `users_history` e atualiza o
+`cards_state` e o `user_stats`. Em vez de um commit (e um fsync) por card, as
+revisões ficam pendentes e são gravadas juntas, em uma única transação, quando
+acumulam `flush_size` revisões ou quando a mais antiga já espera há
+`flush_interval` segundos (verificado a cada nova revisão). Ao sair do bloco
+`with` (fim da revisão, Ctrl+C ou erro) e no fim do processo, o que estiver
+pendente é gravado.
+
+Cada lote vai para a fila de escrita do processo (`write_queue`), que o junta
+a outras escritas que estiverem esperando e repete a transação se outro
+processo estiver gravando no mesmo banco.
+"""
+import atexit
+import os
+import threading
+import time
+from write_queue import run_write
+from card_state.card_state import upsert_card_states
+from user_history.stats import record_reviews
+
+FLUSH_INTERVAL = float(os.environ.get("MEMENTO_REVIEW_FLUSH_SECONDS", "30"))
+FLUSH_SIZE = int(os.environ.get("MEMENTO_REVIEW_FLUSH_SIZE", "20"))
+
+
+def _write_reviews(db, histories):
+    # Um INSERT em lote no histórico, um executemany no cards_state e um UPDATE por usuário
+    db.add_all(histories)
+    upsert_card_states(db, histories)
+    record_reviews(db, histories)
+
+
+class ReviewWriter:
+    """
+    Args:
+        flush_interval: Segundos máximos que uma revisão espera para ser gravada
+        flush_size: Revisões por transação
+    """
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL, flush_size=FLUSH_SIZE):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.saved = 0
+        self._pending = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def add(self, history):
+        """Agenda a gravação de um `UserHistory` (ainda fora de qualquer sessão)."""
+        with self._lock:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append(history)
+            full = len(self._pending) >= self.flush_size
+            expired = time.monotonic() - self._oldest >= self.flush_interval
+        if full or expired:
+            self.flush()
+
+    def flush(self):
+        """Grava as revisões pendentes em uma transação; retorna quantas foram gravadas."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if not pending:
+                return 0
+            try:
+                run_write(lambda db: _write_reviews(db, pending))
+            except Exception:
+                # Nada foi gravado: as revisões voltam para a fila
+                self._pending = pending + self._pending
+                raise
+            self.saved += len(pending)
+            return len(pending)
+
+    def close(self):
+        self.flush()
+        atexit.unregister(self.flush)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
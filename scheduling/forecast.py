@@ -0,0 +1,148 @@
+"""
+Previsão da carga de revisões para os próximos dias.
+
+Os estados atuais dos cards (`cards_state`) são carregados em arrays NumPy e,
+em uma única passada vetorizada, calcula-se por dia:
+
+- quantos cards vencem (atrasados contam no dia de hoje; QAs nunca revisados também)
+- a retrievability média (chance de lembrar) no momento da revisão, pelo FSRS
+- os minutos de revisão estimados, com tempos diferentes para acerto e erro
+
+A previsão considera a próxima revisão de cada card; as revisões feitas
+dentro do horizonte geram outras que não entram na conta.
+"""
+import itertools
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from sqlalchemy import func, select
+from models import CardState, QA
+from scheduling.scheduler import get_scheduler
+
+# Tempo médio (segundos) para responder e avaliar um card lembrado / esquecido
+SECONDS_SUCCESS = 20.0
+SECONDS_FAIL = 45.0
+
+# Dia juliano de 1970-01-01 00:00 UTC
+_UNIX_EPOCH_JD = 2440587.5
+
+Forecast = namedtuple("Forecast", ["days", "due", "new", "retrievability", "minutes"])
+
+
+def _julian_day(dt):
+    return dt.timestamp() / 86400 + _UNIX_EPOCH_JD
+
+
+def load_card_arrays(db, user_id=None):
+    """
+    Carrega due, última revisão (dias julianos) e estabilidade de todos os cards.
+
+    A conversão das datas é feita pelo SQLite (`julianday`) e as linhas vão do
+    cursor direto para o array, sem passar por objetos datetime nem Row: com
+    milhões de cards, é isso que domina o tempo da previsão.
+
+    Returns:
+        tuple: (due, review, stability) como arrays float64; valores nulos viram NaN
+    """
+    sql = f"SELECT julianday(due), julianday(review), stability FROM {CardState.__tablename__}"
+    params = ()
+    if user_id is not None:
+        sql += " WHERE user_id = ?"
+        params = (user_id,)
+
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute(sql, params)
+        values = np.fromiter(
+            (np.nan if value is None else value for value in itertools.chain.from_iterable(cursor)),
+            dtype=np.float64,
+        )
+    finally:
+        cursor.close()
+    columns = values.reshape(-1, 3)
+    return columns[:, 0], columns[:, 1], columns[:, 2]
+
+
+def count_new_cards(db, user_id=None):
+    """QAs que ainda não têm estado (nunca revisados): entram na revisão de hoje."""
+    query = select(func.count(QA.id)).outerjoin(
+        CardState, (CardState.qa_id == QA.id) & (CardState.user_id == QA.user_id)
+    ).where(CardState.id.is_(None))
+    if user_id is not None:
+        query = query.where(QA.user_id == user_id)
+    return db.execute(query).scalar_one()
+
+
+def compute_forecast(due, review, stability, parameters, now, horizon=30, new_cards=0,
+                     seconds_success=SECONDS_SUCCESS, seconds_fail=SECONDS_FAIL):
+    """
+    Calcula a previsão a partir dos arrays de `load_card_arrays`.
+
+    Args:
+        due, review, stability: Arrays em dias julianos (due, review) e dias (stability)
+        parameters: Pesos do FSRS (ex.: `scheduler.parameters`)
+        now: Data/hora (com timezone) a partir da qual prever; o dia 0 é o dia local de `now`
+        horizon: Quantidade de dias
+        new_cards: QAs nunca revisados (vencem hoje, retrievability 0)
+
+    Returns:
+        Forecast: Datas dos dias e, por dia, cards vencendo, novos, retrievability média e minutos
+    """
+    decay = -parameters[20]
+    factor = 0.9 ** (1 / decay) - 1
+
+    local_now = now.astimezone()
+    today = local_now.replace(hour=0, minute=0, second=0, microsecond=0)
+    today_jd = _julian_day(today)
+    now_jd = _julian_day(now)
+
+    # Cards sem due vencem agora; atrasados entram no dia 0
+    due = np.where(np.isnan(due), now_jd, due)
+    day = np.floor(due - today_jd)
+    np.maximum(day, 0, out=day)
+    in_horizon = day < horizon
+    day = day[in_horizon].astype(np.int64)
+
+    # Retrievability no momento da revisão: atrasados são revisados hoje, os demais no vencimento
+    review_at = np.maximum(due[in_horizon], now_jd)
+    elapsed = np.floor(np.maximum(review_at - review[in_horizon], 0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        retrievability = (1 + factor * elapsed / stability[in_horizon]) ** decay
+    # Sem revisão anterior (ou estabilidade inválida), o FSRS considera retrievability 0
+    retrievability = np.nan_to_num(retrievability, nan=0.0, posinf=0.0, neginf=0.0)
+    reviewed = ~np.isnan(review[in_horizon])
+
+    due_counts = np.bincount(day, minlength=horizon)
+    reviewed_counts = np.bincount(day, weights=reviewed, minlength=horizon)
+    retrievability_sum = np.bincount(day, weights=retrievability * reviewed, minlength=horizon)
+    seconds = np.bincount(day, weights=retrievability * seconds_success + (1 - retrievability) * seconds_fail,
+                          minlength=horizon)
+
+    new = np.zeros(horizon, dtype=np.int64)
+    if horizon:
+        new[0] = new_cards
+        seconds[0] += new_cards * seconds_fail
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_retrievability = np.where(reviewed_counts > 0, retrievability_sum / reviewed_counts, np.nan)
+
+    days = [(today + timedelta(days=i)).date() for i in range(horizon)]
+    return Forecast(days, due_counts + new, new, mean_retrievability, seconds / 60)
+
+
+def forecast_workload(db, user_id=None, horizon=30, now=None, scheduler=None):
+    """Carrega os cards do banco e calcula a previsão (ver `compute_forecast`)."""
+    scheduler = scheduler or get_scheduler(user_id)
+    now = now or datetime.now(timezone.utc)
+    due, review, stability = load_card_arrays(db, user_id)
+    new_cards = count_new_cards(db, user_id)
+    return compute_forecast(due, review, stability, scheduler.parameters, now, horizon, new_cards)
+
+
+def print_forecast(forecast):
+    print(f"\n=== PREVISÃO DE REVISÕES ({len(forecast.days)} dias) ===\n")
+    print("   Dia          Cards   Novos   Retenção   Minutos")
+    for day, due, new, retrievability, minutes in zip(*forecast):
+        retention = f"{retrievability * 100:6.1f}%" if not np.isnan(retrievability) else "      -"
+        print(f"   {day.strftime('%d/%m/%Y')}   {due:5d}   {new:5d}   {retention}   {minutes:7.1f}")
+    print(f"\n📈 Total: {int(forecast.due.sum())} revisões, {forecast.minutes.sum():.0f} minutos")
@@ -0,0 +1,229 @@
+"""
+Agendador FSRS por usuário.
+
+- `get_scheduler(user_id)`: Scheduler com os pesos ajustados ao usuário, ou o padrão
+  (recarregado quando os pesos gravados mudam)
+- `fit_user_parameters`: ajusta os pesos com o otimizador do FSRS, lendo o
+  `users_history` do usuário em ordem de revisão, em lotes
+- `reschedule_user_cards`: recalcula o vencimento de todos os cards do usuário
+  em uma passada vetorizada e grava o novo vencimento no `cards_state` e na
+  última revisão do `users_history`, em UPDATEs em lote
+"""
+import json
+import threading
+from datetime import datetime, timezone
+import numpy as np
+from fsrs import Scheduler, Rating, ReviewLog, State
+from fsrs.scheduler import FUZZ_RANGES
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from database import session_scope
+from write_queue import run_write
+from models import CardState, UserHistory, UserSchedulerParams
+from user_history.archive import iter_user_history
+
+# Pesos padrão do FSRS, para quem ainda não tem histórico suficiente
+default_scheduler = Scheduler()
+
+# Revisões lidas do banco por vez
+STREAM_BATCH_SIZE = 10000
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(user_id=None) -> Scheduler:
+    """
+    Scheduler do usuário (pesos ajustados, se houver).
+
+    O scheduler fica em memória, associado ao `fitted_at` dos pesos: cada chamada
+    só confere essa data (busca pela chave primária) e monta um novo scheduler
+    quando outro processo (ex.: `manage.py fit-scheduler`) gravou pesos novos.
+    """
+    if user_id is None:
+        return default_scheduler
+
+    with session_scope() as db:
+        fitted_at = db.execute(
+            select(UserSchedulerParams.fitted_at).where(UserSchedulerParams.user_id == user_id)
+        ).scalar()
+        with _schedulers_lock:
+            cached = _schedulers.get(user_id)
+        if cached is not None and cached[0] == fitted_at:
+            return cached[1]
+        params = db.get(UserSchedulerParams, user_id)
+        parameters = json.loads(params.parameters) if params is not None else None
+        fitted_at = params.fitted_at if params is not None else None
+    scheduler = Scheduler(parameters=parameters) if parameters else default_scheduler
+
+    with _schedulers_lock:
+        _schedulers[user_id] = (fitted_at, scheduler)
+    return scheduler
+
+
+def iter_review_logs(db, user_id):
+    """
+    Lê o histórico completo do usuário (arquivo + tabela) em ordem de revisão,
+    como ReviewLogs do FSRS. Revisões sem nota ou sem data são ignoradas.
+    """
+    for record in iter_user_history(db, user_id, batch_size=STREAM_BATCH_SIZE):
+        if record.grade is None or record.review is None:
+            continue
+        yield ReviewLog(
+            card_id=record.qa_id,
+            rating=Rating(record.grade),
+            review_datetime=record.review.replace(tzinfo=timezone.utc),
+            review_duration=None,
+        )
+
+
+def fit_user_parameters(db, user_id, verbose=False):
+    """
+    Ajusta os pesos do FSRS ao histórico do usuário e os grava em `user_scheduler_params`.
+
+    Com poucas revisões o otimizador do FSRS devolve os pesos padrão.
+
+    Raises:
+        ImportError: Se o otimizador não estiver instalado (pip install "fsrs[optimizer]")
+
+    Returns:
+        tuple: (pesos, quantidade de revisões usadas)
+    """
+    from fsrs import Optimizer
+
+    review_logs = list(iter_review_logs(db, user_id))
+    parameters = list(Optimizer(review_logs).compute_optimal_parameters(verbose=verbose))
+
+    values = {"parameters": json.dumps(parameters), "review_count": len(review_logs), "fitted_at": datetime.utcnow()}
+    stmt = insert(UserSchedulerParams).values(user_id=user_id, **values)
+    # A leitura termina antes: a gravação passa pela fila de escrita
+    db.rollback()
+    run_write(lambda write_db: write_db.execute(
+        stmt.on_conflict_do_update(index_elements=[UserSchedulerParams.user_id], set_=values)))
+
+    with _schedulers_lock:
+        _schedulers.pop(user_id, None)
+    return parameters, len(review_logs)
+
+
+def next_intervals(stability, scheduler):
+    """Versão vetorizada de `Scheduler._next_interval`: dias até a próxima revisão, para cada estabilidade."""
+    decay = -scheduler.parameters[20]
+    factor = 0.9 ** (1 / decay) - 1
+    intervals = stability / factor * (scheduler.desired_retention ** (1 / decay) - 1)
+    # round() do Python arredonda .5 para o par, como np.rint
+    return np.clip(np.rint(intervals), 1, scheduler.maximum_interval)
+
+
+def card_random(card_ids, reviews):
+    """
+    Número em [0, 1) fixo para cada par (card, data da última revisão).
+
+    Faz o papel do `random()` do fuzz do FSRS, mas é determinístico: reagendar
+    de novo com os mesmos pesos não muda o vencimento, e uma nova revisão sorteia
+    outro valor. Hash SplitMix64, vetorizado.
+    """
+    seconds = reviews.astype("datetime64[s]").astype(np.int64).astype(np.uint64)
+    x = np.asarray(card_ids, dtype=np.uint64) * np.uint64(0x100000001B3) ^ seconds
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x = x ^ (x >> np.uint64(31))
+    return (x >> np.uint64(11)).astype(np.float64) / 2 ** 53
+
+
+def fuzz_intervals(intervals, scheduler, random_values):
+    """
+    Versão vetorizada de `Scheduler._get_fuzzed_interval`: mesmas faixas de fuzz
+    do FSRS, com `random_values` (ver `card_random`) no lugar do `random()`.
+
+    Sem isso, todos os cards com a mesma estabilidade cairiam no mesmo dia.
+    """
+    if not scheduler.enable_fuzzing:
+        return intervals
+    delta = np.ones_like(intervals)
+    for fuzz_range in FUZZ_RANGES:
+        delta += fuzz_range["factor"] * np.maximum(np.minimum(intervals, fuzz_range["end"]) - fuzz_range["start"], 0.0)
+
+    min_ivl = np.maximum(2, np.rint(intervals - delta))
+    max_ivl = np.minimum(np.rint(intervals + delta), scheduler.maximum_interval)
+    min_ivl = np.minimum(min_ivl, max_ivl)
+    fuzzed = np.minimum(np.rint(random_values * (max_ivl - min_ivl + 1) + min_ivl), scheduler.maximum_interval)
+    # O FSRS não aplica fuzz em intervalos menores que 2,5 dias
+    return np.where(intervals < 2.5, intervals, fuzzed)
+
+
+def reschedule_user_cards(db, user_id, scheduler=None):
+    """
+    Recalcula o vencimento dos cards do usuário com os pesos do scheduler.
+
+    Só cards em estado Review são reagendados: a estabilidade salva é mantida e
+    o intervalo é recalculado a partir dela (retenção desejada e decaimento do
+    usuário), com o fuzz do FSRS sorteado por card (`card_random`). Cards em
+    aprendizado seguem os passos em minutos do FSRS e ficam como estão.
+
+    As linhas vão do cursor direto para arrays (datas como datetime64) e os novos
+    vencimentos são gravados pela fila de escrita, com um executemany no
+    `cards_state` e outro na última revisão de cada card no `users_history`,
+    sem objetos ORM.
+
+    Returns:
+        int: Quantidade de cards com vencimento alterado
+    """
+    scheduler = scheduler or get_scheduler(user_id)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute(
+            f"SELECT id, qa_id, stability, review, due FROM {CardState.__tablename__} "
+            "WHERE user_id = ? AND state = ? AND stability IS NOT NULL AND review IS NOT NULL",
+            (user_id, State.Review.value),
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return 0
+
+        ids, qa_ids, stability, review_text, due = zip(*rows)
+        stability = np.array(stability, dtype=np.float64)
+        review = np.array(review_text, dtype="datetime64[us]")
+        due = np.array(due, dtype="datetime64[us]")
+
+        intervals = fuzz_intervals(next_intervals(stability, scheduler), scheduler, card_random(qa_ids, review))
+        new_due = review + intervals.astype("timedelta64[D]")
+        changed = np.flatnonzero(new_due != due)
+        if not len(changed):
+            return 0
+    finally:
+        cursor.close()
+
+    # Mesmo formato em que o SQLAlchemy grava DateTime no SQLite
+    new_due_text = np.char.replace(np.datetime_as_string(new_due[changed], unit="us"), "T", " ").tolist()
+    card_updates = [(new_due_text[i], ids[index], review_text[index]) for i, index in enumerate(changed.tolist())]
+    history_updates = [(new_due_text[i], review_text[index], user_id, qa_ids[index])
+                       for i, index in enumerate(changed.tolist())]
+
+    def write_due(write_db):
+        write_cursor = write_db.connection().connection.cursor()
+        try:
+            # Um card revisado depois da leitura já tem outro vencimento e fica como está
+            write_cursor.executemany(
+                f"UPDATE {CardState.__tablename__} SET due = ? WHERE id = ? AND review = ?",
+                card_updates,
+            )
+            updated = write_cursor.rowcount
+            # A última revisão de cada card no histórico recebe o mesmo vencimento: a tela
+            # de desempenho e o `backfill_card_states` leem o `due` de lá. Também aqui,
+            # só se ela ainda for a revisão lida
+            write_cursor.executemany(
+                f"UPDATE {UserHistory.__tablename__} SET due = ? WHERE review = ? AND id = ("
+                f"SELECT id FROM {UserHistory.__tablename__} WHERE user_id = ? AND qa_id = ? "
+                "ORDER BY review DESC, id DESC LIMIT 1)",
+                history_updates,
+            )
+        finally:
+            write_cursor.close()
+        return updated
+
+    # A leitura termina antes: a gravação passa pela fila de escrita
+    db.rollback()
+    return run_write(write_due)
+
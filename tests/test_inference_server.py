@@ -0,0 +1,116 @@
+"""
+Ida e volta pelo daemon de inferência com os modelos stub, pelo mesmo socket dos clientes.
+
+O daemon roda em um subprocesso (`serve(stub=True)` instala o tratador de SIGTERM,
+que só funciona na thread principal).
+"""
+import os
+import socket
+import stat
+import subprocess
+import sys
+import time
+import pytest
+from inference_server import client
+from inference_server.protocol import SOCKET_ENV_VAR, socket_path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVE = "import sys; from inference_server.server import serve; sys.exit(0 if serve(path=sys.argv[1], stub=True) else 1)"
+
+
+def _start_daemon(path, tmp_path):
+    env = dict(os.environ, MEMENTO_DB_PATH=str(tmp_path / "memento.db"))
+    return subprocess.Popen([sys.executable, "-c", SERVE, path], cwd=ROOT, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+
+def _wait_ready(process, path, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            pytest.fail(f"O daemon terminou antes de ficar pronto: {process.communicate()}")
+        try:
+            return client.request({"op": "ping"})
+        except OSError:
+            time.sleep(0.1)
+    pytest.fail("O daemon não ficou pronto a tempo")
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    # Caminho curto: sockets Unix aceitam pouco mais de 100 caracteres
+    path = os.path.join("/tmp", f"memento-test-{os.getpid()}.sock")
+    monkeypatch.setenv(SOCKET_ENV_VAR, path)
+    process = _start_daemon(path, tmp_path)
+    try:
+        yield path, process, _wait_ready(process, path)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def test_round_trip(daemon):
+    path, _, info = daemon
+    assert info["ok"] and info["grading_revision"] == "stub"
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+    grader = client.RemoteGrader(info["grading_revision"])
+    grades, confidences = grader.predict_batch(["fotossíntese produz glicose"], ["glicose"])
+    assert grades.tolist() == [3] and confidences.shape == (1,)
+
+    generator = client.RemoteGenerator()
+    prompt = "### Contexto: a clorofila absorve a luz\n### Pergunta:"
+    stats = {}
+    greedy = generator.generate(generator.encode(prompt), do_sample=False, stats=stats)
+    assert greedy.startswith(prompt) and "### Resposta:" in greedy
+    assert stats["new_tokens"] > 0
+    assert len(generator.sample(generator.encode(prompt), 3)) == 3
+    assert len(generator.generate_batch([prompt, prompt + " outro"], do_sample=False)) == 2
+
+
+def test_second_daemon_keeps_the_live_one(daemon, tmp_path):
+    path, process, _ = daemon
+    second = _start_daemon(path, tmp_path)
+    assert second.wait(timeout=60) == 1
+    assert process.poll() is None
+    assert client.request({"op": "ping"})["ok"]
+
+
+def test_stale_socket_is_replaced(tmp_path, monkeypatch):
+    path = os.path.join("/tmp", f"memento-test-stale-{os.getpid()}.sock")
+    monkeypatch.setenv(SOCKET_ENV_VAR, path)
+    # Arquivo de socket sem ninguém atendendo, como o de um daemon morto com SIGKILL
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+
+    process = _start_daemon(path, tmp_path)
+    try:
+        assert _wait_ready(process, path)["ok"]
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    assert not os.path.exists(path)
+
+
+def test_default_socket_is_private(tmp_path, monkeypatch):
+    monkeypatch.delenv(SOCKET_ENV_VAR, raising=False)
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    assert socket_path() == str(tmp_path / "memento" / "inference.sock")
+
+    process = _start_daemon(socket_path(), tmp_path)
+    try:
+        assert _wait_ready(process, socket_path())["ok"]
+        assert stat.S_IMODE(os.stat(tmp_path / "memento").st_mode) == 0o700
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def test_client_refuses_a_file_that_is_not_a_socket(tmp_path, monkeypatch):
+    path = tmp_path / "memento.sock"
+    path.write_text("")
+    monkeypatch.setenv(SOCKET_ENV_VAR, str(path))
+    with pytest.raises(PermissionError):
+        client.request({"op": "ping"})
@@ -0,0 +1,81 @@
+"""
+Abrir o main.py e chegar ao menu não pode importar torch/transformers nem carregar
+modelos, e com os modelos stub a abertura tem um orçamento de tempo.
+
+O main.py roda em um subprocesso (ele executa o menu ao ser importado), com um
+banco temporário e as respostas do cadastro e do menu na entrada padrão.
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cadastra um usuário e sai pelo menu (opção 4)
+MENU_INPUT = "2\nTeste\nteste@memento\nsenha\n4\n"
+
+# Orçamentos com os modelos stub: a sessão inteira (interpretador, migrações,
+# cadastro com bcrypt e saída) e a soma do -X importtime dos imports de topo.
+# Medido em torno de 1 s e 0,5 s; a folga cobre máquinas de CI mais lentas
+STARTUP_BUDGET_S = 5.0
+IMPORT_BUDGET_S = 2.5
+
+# Importa o main.py e depois inspeciona o processo
+SCRIPT = """
+import json, sys
+import main
+import model_registry
+print("RESULT " + json.dumps({
+    "heavy_modules": sorted(name for name in ("torch", "transformers", "docling") if name in sys.modules),
+    "loaded_models": sorted(model_registry._models),
+}))
+"""
+
+
+def _run_main(tmp_path, stub, args=("main.py",)):
+    env = dict(os.environ,
+               MEMENTO_DB_PATH=str(tmp_path / "memento.db"),
+               MEMENTO_ARCHIVE_DIR=str(tmp_path / "history_archive"),
+               MEMENTO_USE_DAEMON="0")
+    if stub:
+        env["MEMENTO_STUB_MODELS"] = "1"
+    else:
+        env.pop("MEMENTO_STUB_MODELS", None)
+
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, *args], input=MENU_INPUT, capture_output=True, text=True,
+                            cwd=ROOT, env=env, timeout=120)
+    elapsed = time.perf_counter() - started
+    assert result.returncode == 0, result.stderr
+    assert "Menu:" in result.stdout
+    return result, elapsed
+
+
+def test_main_menu_does_not_load_models(tmp_path):
+    result, _ = _run_main(tmp_path, stub=False, args=("-c", SCRIPT))
+
+    line = next(line for line in result.stdout.splitlines() if line.startswith("RESULT "))
+    report = json.loads(line[len("RESULT "):])
+    assert report["heavy_modules"] == []
+    assert report["loaded_models"] == []
+
+
+def test_stub_startup_within_budget(tmp_path):
+    _, elapsed = _run_main(tmp_path, stub=True)
+    assert elapsed < STARTUP_BUDGET_S, f"python main.py levou {elapsed:.2f}s (orçamento: {STARTUP_BUDGET_S}s)"
+
+
+def test_stub_import_time_within_budget(tmp_path):
+    result, _ = _run_main(tmp_path, stub=True, args=("-X", "importtime", "main.py"))
+
+    # Linhas "import time: self | cumulative | módulo"; os de topo não têm recuo no nome
+    total_us = 0
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\S.*)$", line)
+        if match:
+            total_us += int(match.group(1))
+    total = total_us / 1e6
+    assert 0 < total < IMPORT_BUDGET_S, f"imports somam {total:.2f}s (orçamento: {IMPORT_BUDGET_S}s)"
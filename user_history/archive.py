@@ -0,0 +1,282 @@
+"""
+Compactação e arquivamento do users_history.
+
+Cada revisão acrescenta uma linha ao `users_history`. A compactação mantém na
+tabela a última linha de cada card (o estado atual) e as revisões recentes, e
+move as mais antigas para segmentos gzip JSONL, um por usuário e mês de revisão:
+
+    history_archive/<user_id>/<AAAA-MM>/<data>-<id>.jsonl.gz
+
+Os segmentos nunca são alterados: cada compactação cria segmentos novos. A
+tabela `history_archive_segments` é o índice deles, e `history_archive_stats`
+guarda por QA os agregados (tentativas, notas) do que foi arquivado.
+
+`iter_user_history` lê o histórico completo (arquivo + tabela) em ordem de
+revisão; é por ela que telas de desempenho, exportação e ajuste do FSRS leem.
+"""
+import gzip
+import heapq
+import itertools
+import json
+import os
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, delete
+from sqlalchemy.dialects.sqlite import insert
+from database import DB_PATH
+from write_queue import run_write
+from models import UserHistory, HistoryArchiveSegment, HistoryArchiveStats
+
+ARCHIVE_DIR = os.environ.get("MEMENTO_ARCHIVE_DIR", os.path.join(os.path.dirname(DB_PATH), "history_archive"))
+
+# Revisões dos últimos dias ficam na tabela mesmo quando não são a última do card
+KEEP_DAYS = 30
+
+HISTORY_FIELDS = ("id", "qa_id", "user_id", "user_answer", "grade", "state", "step",
+                  "difficulty", "stability", "review", "due")
+HistoryRecord = namedtuple("HistoryRecord", HISTORY_FIELDS)
+
+_DATETIME_FIELDS = ("review", "due")
+_DELETE_CHUNK = 500
+
+
+def _to_json(record):
+    values = record._asdict()
+    for field in _DATETIME_FIELDS:
+        if values[field] is not None:
+            values[field] = values[field].isoformat()
+    return json.dumps(values, ensure_ascii=False)
+
+
+def _from_json(line):
+    values = json.loads(line)
+    for field in _DATETIME_FIELDS:
+        if values[field] is not None:
+            values[field] = datetime.fromisoformat(values[field])
+    return HistoryRecord(**values)
+
+
+def _segment_path(relative_path):
+    return os.path.join(ARCHIVE_DIR, relative_path)
+
+
+def read_segment(relative_path):
+    """Lê as linhas de um segmento, na ordem em que foram gravadas (revisão, id)."""
+    path = _segment_path(relative_path)
+    if not os.path.exists(path) and os.path.exists(path + ".tmp"):
+        # Compactação interrompida depois do commit: o segmento ainda tem o nome temporário
+        path += ".tmp"
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            yield _from_json(line)
+
+
+def _sort_key(record):
+    return (record.review or datetime.min, record.id)
+
+
+def iter_user_history(db, user_id, qa_id=None, batch_size=10000):
+    """
+    Percorre todo o histórico do usuário, arquivado e na tabela, em ordem de revisão.
+
+    Args:
+        db: Sessão do banco
+        user_id: Dono do histórico
+        qa_id: Restringe a um QA (opcional)
+        batch_size: Linhas lidas da tabela por vez
+
+    Yields:
+        HistoryRecord: Mesmos campos do UserHistory, sem objetos ORM
+    """
+    segments = db.execute(
+        select(HistoryArchiveSegment.path).where(HistoryArchiveSegment.user_id == user_id)
+        .order_by(HistoryArchiveSegment.month, HistoryArchiveSegment.id)
+    ).scalars().all()
+
+    sources = []
+    for path in segments:
+        records = read_segment(path)
+        if qa_id is not None:
+            records = (record for record in records if record.qa_id == qa_id)
+        sources.append(records)
+
+    query = select(*[getattr(UserHistory, field) for field in HISTORY_FIELDS]).where(UserHistory.user_id == user_id)
+    if qa_id is not None:
+        query = query.where(UserHistory.qa_id == qa_id)
+    query = query.order_by(UserHistory.review, UserHistory.id).execution_options(yield_per=batch_size)
+    sources.append(HistoryRecord(*row) for row in db.execute(query))
+
+    yield from heapq.merge(*sources, key=_sort_key)
+
+
+def _write_segment(relative_path, records):
+    """Grava o segmento com nome temporário (.tmp); retorna a quantidade de linhas."""
+    path = _segment_path(relative_path) + ".tmp"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    count = 0
+    with open(path, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+            for record in records:
+                f.write(_to_json(record).encode("utf-8") + b"\n")
+                count += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+    return count
+
+
+def recover_segments(db):
+    """
+    Termina compactações interrompidas.
+
+    Segmentos temporários que estão no índice (o commit aconteceu) recebem o
+    nome final; os demais são de compactações desfeitas e são apagados.
+    """
+    if not os.path.isdir(ARCHIVE_DIR):
+        return
+    indexed = set(db.execute(select(HistoryArchiveSegment.path)).scalars())
+    for root, _, files in os.walk(ARCHIVE_DIR):
+        for name in files:
+            if not name.endswith(".tmp"):
+                continue
+            tmp_path = os.path.join(root, name)
+            relative_path = os.path.relpath(tmp_path, ARCHIVE_DIR)[:-len(".tmp")].replace(os.sep, "/")
+            if relative_path in indexed:
+                os.replace(tmp_path, _segment_path(relative_path))
+            else:
+                os.remove(tmp_path)
+
+
+def _archivable_rows(db, user_id, cutoff, batch_size):
+    """Linhas que não são a última do card e são anteriores a `cutoff`, por usuário, mês e revisão."""
+    ranked = select(
+        *[getattr(UserHistory, field) for field in HISTORY_FIELDS],
+        func.strftime("%Y-%m", UserHistory.review).label("month"),
+        func.row_number().over(
+            partition_by=UserHistory.qa_id,
+            order_by=(UserHistory.review.desc(), UserHistory.id.desc())
+        ).label("rn"),
+    ).where(UserHistory.review.isnot(None))
+    if user_id is not None:
+        ranked = ranked.where(UserHistory.user_id == user_id)
+    ranked = ranked.subquery()
+
+    query = select(*[ranked.c[field] for field in HISTORY_FIELDS], ranked.c.month).where(
+        ranked.c.rn > 1,
+        ranked.c.review < cutoff,
+    ).order_by(ranked.c.user_id, ranked.c.month, ranked.c.review, ranked.c.id).execution_options(yield_per=batch_size)
+    for row in db.execute(query):
+        yield row[-1], HistoryRecord(*row[:-1])
+
+
+def _commit_compaction(db, segments, stats, archived_ids):
+    """Grava o índice e os agregados dos segmentos e remove as linhas arquivadas da tabela."""
+    db.execute(insert(HistoryArchiveSegment), segments)
+
+    stmt = insert(HistoryArchiveStats)
+    excluded = stmt.excluded
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[HistoryArchiveStats.user_id, HistoryArchiveStats.qa_id],
+        set_={
+            "attempts": HistoryArchiveStats.attempts + excluded.attempts,
+            "grade_count": HistoryArchiveStats.grade_count + excluded.grade_count,
+            "grade_sum": HistoryArchiveStats.grade_sum + excluded.grade_sum,
+            "grade_min": func.min(func.coalesce(HistoryArchiveStats.grade_min, excluded.grade_min),
+                                  func.coalesce(excluded.grade_min, HistoryArchiveStats.grade_min)),
+            "grade_max": func.max(func.coalesce(HistoryArchiveStats.grade_max, excluded.grade_max),
+                                  func.coalesce(excluded.grade_max, HistoryArchiveStats.grade_max)),
+        },
+    ), [
+        {"user_id": stats_user_id, "qa_id": qa_id, "attempts": attempts, "grade_count": grade_count,
+         "grade_sum": grade_sum, "grade_min": grade_min, "grade_max": grade_max}
+        for (stats_user_id, qa_id), (attempts, grade_count, grade_sum, grade_min, grade_max) in stats.items()
+    ])
+
+    deleted = 0
+    for start in range(0, len(archived_ids), _DELETE_CHUNK):
+        deleted += db.execute(
+            delete(UserHistory).where(UserHistory.id.in_(archived_ids[start:start + _DELETE_CHUNK]))
+        ).rowcount
+    # Outra compactação arquivou parte das linhas depois da leitura: desfaz esta
+    if deleted != len(archived_ids):
+        raise RuntimeError("O histórico mudou durante a compactação; tente novamente.")
+
+
+def compact_history(db, user_id=None, keep_days=KEEP_DAYS, now=None, batch_size=10000):
+    """
+    Move para o arquivo as revisões antigas que não são a última de cada card.
+
+    Os segmentos são gravados antes (com nome temporário); o índice, os
+    agregados e a remoção das linhas entram em uma única transação, e só depois
+    dela os segmentos recebem o nome final. A transação passa pela fila de
+    escrita (`run_write`) e só começa depois da leitura. Uma interrupção em
+    qualquer ponto não perde nem duplica revisões (ver `recover_segments`).
+
+    Args:
+        db: Sessão do banco
+        user_id: Compacta só este usuário (padrão: todos)
+        keep_days: Revisões mais novas que isso ficam na tabela
+        now: Data de referência (UTC, sem timezone; padrão: agora)
+
+    Returns:
+        dict: Linhas arquivadas, segmentos criados e bytes gravados
+    """
+    recover_segments(db)
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=keep_days)
+    run_id = f"{now.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+    segments = []
+    archived_ids = []
+    stats = {}
+    rows = _archivable_rows(db, user_id, cutoff, batch_size)
+    for (segment_user_id, month), group in itertools.groupby(rows, key=lambda item: (item[1].user_id, item[0])):
+        relative_path = f"{segment_user_id}/{month}/{run_id}.jsonl.gz"
+
+        def records(group=group):
+            for _, record in group:
+                archived_ids.append(record.id)
+                entry = stats.setdefault((record.user_id, record.qa_id), [0, 0, 0, None, None])
+                entry[0] += 1
+                if record.grade is not None:
+                    entry[1] += 1
+                    entry[2] += record.grade
+                    entry[3] = record.grade if entry[3] is None else min(entry[3], record.grade)
+                    entry[4] = record.grade if entry[4] is None else max(entry[4], record.grade)
+                yield record
+
+        count = _write_segment(relative_path, records())
+        size = os.path.getsize(_segment_path(relative_path) + ".tmp")
+        segments.append({"user_id": segment_user_id, "month": month, "path": relative_path,
+                         "row_count": count, "size_bytes": size})
+
+    if not segments:
+        return {"rows": 0, "segments": 0, "bytes": 0}
+
+    # A leitura acabou: a gravação vai para a fila de escrita (BEGIN IMMEDIATE),
+    # sem segurar o lock de escrita durante a leitura e a compressão
+    db.rollback()
+    try:
+        run_write(lambda write_db: _commit_compaction(write_db, segments, stats, archived_ids))
+    except Exception:
+        for segment in segments:
+            os.remove(_segment_path(segment["path"]) + ".tmp")
+        raise
+
+    for segment in segments:
+        os.replace(_segment_path(segment["path"]) + ".tmp", _segment_path(segment["path"]))
+
+    return {
+        "rows": len(archived_ids),
+        "segments": len(segments),
+        "bytes": sum(segment["size_bytes"] for segment in segments),
+    }
+
+
+def export_history(db, user_id, output):
+    """Escreve todo o histórico do usuário (arquivo + tabela) em JSONL; retorna a quantidade de linhas."""
+    count = 0
+    for record in iter_user_history(db, user_id):
+        output.write(_to_json(record) + "\n")
+        count += 1
+    return count
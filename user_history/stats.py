@@ -0,0 +1,163 @@
+"""
+Estatísticas de desempenho calculadas no banco.
+
+- `qa_performance`: uma linha por QA com tentativas, média, melhor e pior nota
+  e última nota, revisão e vencimento, em uma passada (window functions), somando as
+  revisões já arquivadas (`history_archive_stats`)
+- `user_stats`: totais por usuário, atualizados a cada revisão por
+  `record_review`; `get_user_stats` cria a linha a partir do histórico na
+  primeira consulta
+"""
+from datetime import datetime
+from sqlalchemy import func, select, update, delete, union_all, literal
+from sqlalchemy.dialects.sqlite import insert
+from models import QA, UserHistory, HistoryArchiveStats, UserStats
+from write_queue import run_write
+
+PREVIEW_CHARS = 50
+
+
+def qa_performance(db, user_id):
+    """
+    Desempenho por QA do usuário, ordenado pelo ID do QA.
+
+    Returns:
+        list: Linhas com id, question/answer (cortadas em PREVIEW_CHARS) e seus
+        tamanhos, attempts, grade_count, grade_sum, grade_min, grade_max,
+        last_grade, last_review e last_due. Os três últimos vêm da última
+        revisão na tabela, que a compactação nunca arquiva (ver `compact_history`)
+    """
+    # Uma única passada pelo histórico do usuário: agregados por QA como window
+    # functions e, da última revisão (rn = 1), nota, data e vencimento
+    per_qa = {"partition_by": UserHistory.qa_id}
+    history = select(
+        UserHistory.qa_id,
+        func.count().over(**per_qa).label("attempts"),
+        func.count(UserHistory.grade).over(**per_qa).label("grade_count"),
+        func.coalesce(func.sum(UserHistory.grade).over(**per_qa), 0).label("grade_sum"),
+        func.min(UserHistory.grade).over(**per_qa).label("grade_min"),
+        func.max(UserHistory.grade).over(**per_qa).label("grade_max"),
+        UserHistory.grade,
+        UserHistory.review,
+        UserHistory.due,
+        func.row_number().over(
+            partition_by=UserHistory.qa_id,
+            order_by=(UserHistory.review.desc(), UserHistory.id.desc())
+        ).label("rn"),
+    ).where(UserHistory.user_id == user_id).subquery()
+    totals = select(history).where(history.c.rn == 1).subquery()
+
+    archived = HistoryArchiveStats
+
+    def combined_extreme(function, column, archived_column):
+        # min/max escalares do SQLite retornam NULL se um dos lados for NULL
+        return function(func.coalesce(column, archived_column), func.coalesce(archived_column, column))
+
+    query = select(
+        QA.id,
+        func.substr(QA.question, 1, PREVIEW_CHARS).label("question"),
+        func.length(QA.question).label("question_length"),
+        func.substr(QA.answer, 1, PREVIEW_CHARS).label("answer"),
+        func.length(QA.answer).label("answer_length"),
+        (totals.c.attempts + func.coalesce(archived.attempts, 0)).label("attempts"),
+        (totals.c.grade_count + func.coalesce(archived.grade_count, 0)).label("grade_count"),
+        (totals.c.grade_sum + func.coalesce(archived.grade_sum, 0)).label("grade_sum"),
+        combined_extreme(func.min, totals.c.grade_min, archived.grade_min).label("grade_min"),
+        combined_extreme(func.max, totals.c.grade_max, archived.grade_max).label("grade_max"),
+        totals.c.grade.label("last_grade"),
+        totals.c.review.label("last_review"),
+        totals.c.due.label("last_due"),
+    ).join(
+        totals, totals.c.qa_id == QA.id
+    ).outerjoin(
+        archived, (archived.qa_id == QA.id) & (archived.user_id == QA.user_id)
+    ).where(QA.user_id == user_id).order_by(QA.id)
+    return db.execute(query).all()
+
+
+def record_review(db, history: UserHistory):
+    """
+    Soma uma revisão aos totais do usuário.
+
+    Deve ser chamada na mesma sessão (e transação) que insere o `UserHistory`.
+    Se o usuário ainda não tem linha em `user_stats`, nada é feito: a linha é
+    criada por `get_user_stats` a partir do histórico, já com esta revisão.
+    """
+    record_reviews(db, [history])
+
+
+def record_reviews(db, histories):
+    """Como `record_review`, para várias revisões: um UPDATE por usuário."""
+    totals = {}
+    for history in histories:
+        entry = totals.setdefault(history.user_id, [0, 0, 0])
+        entry[0] += 1
+        if history.grade is not None:
+            entry[1] += 1
+            entry[2] += history.grade
+    now = datetime.utcnow()
+    for user_id, (reviews, graded, grade_sum) in totals.items():
+        db.execute(update(UserStats).where(UserStats.user_id == user_id).values(
+            total_reviews=UserStats.total_reviews + reviews,
+            graded_reviews=UserStats.graded_reviews + graded,
+            grade_sum=UserStats.grade_sum + grade_sum,
+            updated_at=now,
+        ))
+
+
+def rebuild_user_stats(db, user_id=None):
+    """
+    Recalcula `user_stats` a partir do `users_history` e das revisões arquivadas.
+
+    É um trabalho da fila de escrita: `run_write(lambda db: rebuild_user_stats(db))`.
+
+    Returns:
+        int: Quantidade de usuários gravados
+    """
+    hot = select(
+        UserHistory.user_id,
+        func.count().label("total_reviews"),
+        func.count(UserHistory.grade).label("graded_reviews"),
+        func.coalesce(func.sum(UserHistory.grade), 0).label("grade_sum"),
+    ).group_by(UserHistory.user_id)
+    cold = select(
+        HistoryArchiveStats.user_id,
+        func.sum(HistoryArchiveStats.attempts),
+        func.sum(HistoryArchiveStats.grade_count),
+        func.sum(HistoryArchiveStats.grade_sum),
+    ).group_by(HistoryArchiveStats.user_id)
+    clear = delete(UserStats)
+    if user_id is not None:
+        hot = hot.where(UserHistory.user_id == user_id)
+        cold = cold.where(HistoryArchiveStats.user_id == user_id)
+        clear = clear.where(UserStats.user_id == user_id)
+    combined = union_all(hot, cold).subquery()
+
+    totals = select(
+        combined.c.user_id,
+        func.sum(combined.c.total_reviews),
+        func.sum(combined.c.graded_reviews),
+        func.sum(combined.c.grade_sum),
+        literal(datetime.utcnow()),
+    ).group_by(combined.c.user_id)
+
+    db.execute(clear)
+    result = db.execute(insert(UserStats).from_select(
+        ["user_id", "total_reviews", "graded_reviews", "grade_sum", "updated_at"], totals
+    ))
+    return result.rowcount
+
+
+def get_user_stats(db, user_id):
+    """
+    Totais do usuário; a linha é reconstruída na primeira consulta (bancos antigos).
+
+    A reconstrução é gravada pela fila de escrita; a sessão `db` só lê.
+    """
+    stats = db.get(UserStats, user_id)
+    if stats is None:
+        # Termina a leitura para enxergar a linha gravada pela fila
+        db.rollback()
+        run_write(lambda write_db: rebuild_user_stats(write_db, user_id))
+        stats = db.get(UserStats, user_id)
+    return stats
@@ -1,7 +1,10 @@
-from datetime import datetime, timezone
-from sqlalchemy.orm import joinedload
+from datetime import timezone
+from sqlalchemy import func
 from database import SessionLocal
-from models import User, UserHistory, QA, PDFBlock, PDFDocument
+from models import QA, PDFBlock, PDFDocument
+from qag.generator import review_candidates
+from scheduling.forecast import forecast_workload, print_forecast
+from user_history.stats import qa_performance, get_user_stats
 
 
 def user_history_menu(user):
@@ -9,7 +12,9 @@ def user_history_menu(user):
     while True:
         print("\n1. Visualizar QAs")
         print("2. Visualizar Desempenho por QA")
-        print("3. Voltar ao Menu Principal")
+        print("3. Aprovar QAs Pendentes")
+        print("4. Previsão de Revisões")
+        print("5. Voltar ao Menu Principal")
         
         escolha = input("\nEscolha uma opção: ").strip()
         
@@ -18,68 +23,111 @@ def user_history_menu(user):
         elif escolha == "2":
             visualizar_desempenho_por_qa(user)
         elif escolha == "3":
+            review_candidates(user)
+        elif escolha == "4":
+            visualizar_previsao(user)
+        elif escolha == "5":
             break
         else:
             print("❌ Opção inválida! Tente novamente.")
 
 
+# Caracteres mostrados de cada campo e QAs por página
+PREVIEW_CHARS = 50
+QAS_PER_PAGE = 20
+
+
+def iter_qa_pages(db, user_id, page_size=QAS_PER_PAGE):
+    """
+    Percorre os QAs do usuário em páginas, sob demanda (paginação por keyset no ID).
+
+    Só as colunas exibidas são lidas e os textos já vêm cortados pelo SQLite
+    (`substr`), com as quebras de linha do bloco trocadas por espaço: o texto
+    completo dos blocos nunca sai do banco.
+
+    Yields:
+        list: Linhas de uma página (id, pergunta, tamanho da pergunta, resposta,
+        tamanho da resposta, início e fim do bloco, tamanho do bloco, nome e caminho do PDF)
+    """
+    def preview(column, start):
+        return func.replace(func.substr(column, start, PREVIEW_CHARS), "\n", " ")
+
+    query = db.query(
+        QA.id,
+        func.substr(QA.question, 1, PREVIEW_CHARS).label("question"),
+        func.length(QA.question).label("question_length"),
+        func.substr(QA.answer, 1, PREVIEW_CHARS).label("answer"),
+        func.length(QA.answer).label("answer_length"),
+        preview(PDFBlock.text_content, 1).label("block_start"),
+        preview(PDFBlock.text_content, -PREVIEW_CHARS).label("block_end"),
+        func.length(PDFBlock.text_content).label("block_length"),
+        PDFDocument.original_name,
+        PDFDocument.file_path,
+    ).join(PDFBlock, QA.pdf_block_id == PDFBlock.id).join(
+        PDFDocument, PDFBlock.pdf_id == PDFDocument.id
+    ).filter(QA.user_id == user_id).order_by(QA.id)
+
+    last_id = 0
+    while True:
+        page = query.filter(QA.id > last_id).limit(page_size).all()
+        if not page:
+            return
+        yield page
+        last_id = page[-1].id
+
+
 def visualizar_qas(user):
-    """Visualiza todos os Q&As do usuário com informações do PDF e bloco"""
+    """Visualiza os Q&As do usuário, página por página, com informações do PDF e bloco"""
     db = SessionLocal()
     try:
-        # Busca todos os Q&As do usuário com joins para obter informações completas
-        qas = db.query(QA).join(PDFBlock).join(PDFDocument).filter(
-            QA.user_id == user.id
-        ).options(
-            joinedload(QA.pdf_block).joinedload(PDFBlock.pdf_document)
-        ).all()
-        
-        if not qas:
+        total = db.query(func.count(QA.id)).filter(QA.user_id == user.id).scalar()
+        if not total:
             print("\n📝 Você ainda não possui Q&As criados.")
             return
-        
-        print(f"\n=== SEUS QAs ({len(qas)} encontrados) ===\n")
-        
-        for i, qa in enumerate(qas, 1):
-            pdf_path = qa.pdf_block.pdf_document.file_path
-            pdf_name = pdf_path.split('/')[-1] if '/' in pdf_path else pdf_path
-            # Remove quebra de linha para visualização
-            qa.pdf_block.text_content = qa.pdf_block.text_content.replace('\n', ' ')
-
-            # Formatação inteligente do bloco
-            bloco_texto = qa.pdf_block.text_content
-            if len(bloco_texto) > 100:
-                bloco_display = f"{bloco_texto[:50]}...{bloco_texto[-50:]}"
-            else:
-                bloco_display = bloco_texto[:50]
-            
-            if len(qa.question) > 50:
-                pergunta_display = f"{qa.question[:50]}..."
-            else:
-                pergunta_display = qa.question
-            
-            if len(qa.answer) > 50:
-                resposta_display = f"{qa.answer[:50]}..."
-            else:
-                resposta_display = qa.answer
 
-            print(f"┌─ Q&A #{i} ─────────────────────────────────────────────")
-            print(f"│ 📄 PDF: {pdf_name}")
-            print(f"│ 📍 Caminho: {pdf_path}")
-            print(f"│ 📦 Bloco: {bloco_display}")
-            print(f"│")
-            print(f"│ ❓ PERGUNTA:")
-            print(f"│    {pergunta_display}")
-            print(f"│")
-            print(f"│ ✅ RESPOSTA:")
-            print(f"│    {resposta_display}")
-            print(f"└─────────────────────────────────────────────────────")
-            
-            if i < len(qas):
-                print()
-        
+        print(f"\n=== SEUS QAs ({total} encontrados) ===\n")
+
+        i = 0
+        for page in iter_qa_pages(db, user.id):
+            for qa in page:
+                i += 1
+                pdf_path = qa.file_path
+                pdf_name = qa.original_name or (pdf_path.split('/')[-1] if '/' in pdf_path else pdf_path)
+
+                # Formatação inteligente do bloco
+                if qa.block_length > 2 * PREVIEW_CHARS:
+                    bloco_display = f"{qa.block_start}...{qa.block_end}"
+                else:
+                    bloco_display = qa.block_start
+
+                pergunta_display = f"{qa.question}..." if qa.question_length > PREVIEW_CHARS else qa.question
+                resposta_display = f"{qa.answer}..." if qa.answer_length > PREVIEW_CHARS else qa.answer
+
+                print(f"┌─ Q&A #{i} ─────────────────────────────────────────────")
+                print(f"│ 📄 PDF: {pdf_name}")
+                print(f"│ 📍 Caminho: {pdf_path}")
+                print(f"│ 📦 Bloco: {bloco_display}")
+                print(f"│")
+                print(f"│ ❓ PERGUNTA:")
+                print(f"│    {pergunta_display}")
+                print(f"│")
+                print(f"│ ✅ RESPOSTA:")
+                print(f"│    {resposta_display}")
+                print(f"└─────────────────────────────────────────────────────")
+
+                if i < total:
+                    print()
+
+            if i >= total:
+                break
+            # A próxima página só é buscada se o usuário pedir
+            continuar = input(f"📄 {i} de {total}. ENTER para a próxima página, 'q' para voltar: ").strip().lower()
+            if continuar == "q":
+                return
+            print()
+
         input("\nPressione ENTER para continuar...")
-        
+
     except Exception as e:
         print(f"❌ Erro ao buscar Q&As: {e}")
     finally:
@@ -90,48 +138,23 @@ def visualizar_desempenho_por_qa(user):
     """Visualiza o desempenho do usuário para cada Q&A"""
     db = SessionLocal()
     try:
-        # Busca o histórico do usuário com informações dos Q&As
-        historico = db.query(UserHistory).join(QA).filter(
-            QA.user_id == user.id
-        ).options(joinedload(UserHistory.qa)).all()
+        # Uma linha por Q&A, já agregada pelo banco (inclui as revisões arquivadas)
+        desempenho = qa_performance(db, user.id)
         
-        if not historico:
+        if not desempenho:
             print("\n📊 Você ainda não possui histórico de estudos.")
             return
         
-        # Agrupa por Q&A
-        qa_performance = {}
-        for entry in historico:
-            qa_id = entry.qa_id
-            if qa_id not in qa_performance:
-                qa_performance[qa_id] = {
-                    'qa': entry.qa,
-                    'tentativas': [],
-                    'notas': [],
-                    'ultima_revisao': None,
-                    'proxima_revisao': None
-                }
-            
-            qa_performance[qa_id]['tentativas'].append(entry)
-            if entry.grade is not None:
-                qa_performance[qa_id]['notas'].append(entry.grade)
-            if entry.review:
-                qa_performance[qa_id]['ultima_revisao'] = entry.review
-            if entry.due:
-                qa_performance[qa_id]['proxima_revisao'] = entry.due
+        print(f"\n=== DESEMPENHO POR QA ({len(desempenho)} Q&As) ===\n")
         
-        print(f"\n=== DESEMPENHO POR QA ({len(qa_performance)} Q&As) ===\n")
-        
-        for i, (qa_id, data) in enumerate(qa_performance.items(), 1):
-            qa = data['qa']
-            tentativas = len(data['tentativas'])
-            notas = data['notas']
+        for i, data in enumerate(desempenho, 1):
+            tentativas = data.attempts
             
             # Cálculos de desempenho
-            media_nota = sum(notas) / len(notas) if notas else 0
-            melhor_nota = max(notas) if notas else 0
-            pior_nota = min(notas) if notas else 0
-            ultima_nota = notas[-1] if notas else 0
+            media_nota = data.grade_sum / data.grade_count if data.grade_count else 0
+            melhor_nota = data.grade_max or 0
+            pior_nota = data.grade_min or 0
+            ultima_nota = data.last_grade or 0
             
             # Status baseado na última nota
             if ultima_nota >= 4:
@@ -143,15 +166,8 @@ def visualizar_desempenho_por_qa(user):
             else:
                 status = "🔴 Precisa Revisar"
             
-            if len(qa.question) > 50:
-                pergunta_display = f"{qa.question[:50]}..."
-            else:
-                pergunta_display = qa.question
-            
-            if len(qa.answer) > 50:
-                resposta_display = f"{qa.answer[:50]}..."
-            else:
-                resposta_display = qa.answer
+            pergunta_display = f"{data.question}..." if data.question_length > PREVIEW_CHARS else data.question
+            resposta_display = f"{data.answer}..." if data.answer_length > PREVIEW_CHARS else data.answer
 
             print(f"┌─ Q&A #{i} ─────────────────────────────────────────────")
             print(f"│ ❓ PERGUNTA:")
@@ -168,37 +184,32 @@ def visualizar_desempenho_por_qa(user):
             print(f"│    Pior Nota: {pior_nota}")
             print(f"│    Última Nota: {ultima_nota}")
             
-            if data['ultima_revisao']:
+            if data.last_review:
                 # Converte de UTC para timezone local para exibição
-                ultima_revisao_local = data['ultima_revisao'].replace(tzinfo=timezone.utc).astimezone()
+                ultima_revisao_local = data.last_review.replace(tzinfo=timezone.utc).astimezone()
                 print(f"│    Última Revisão: {ultima_revisao_local.strftime('%d/%m/%Y %H:%M')}")
             
-            if data['proxima_revisao']:
-                # Usa UTC para cálculos de diferença de tempo
-                now_utc = datetime.now(timezone.utc)
-                proxima_revisao_utc = data['proxima_revisao'].replace(tzinfo=timezone.utc)
-                # Converte para timezone local para exibição
-                proxima_revisao_local = proxima_revisao_utc.astimezone()
+            if data.last_due:
+                # Converte de UTC para timezone local para exibição
+                proxima_revisao_local = data.last_due.replace(tzinfo=timezone.utc).astimezone()
                 print(f"│    Próxima Revisão: {proxima_revisao_local.strftime('%d/%m/%Y %H:%M')}")
             
             print(f"└─────────────────────────────────────────────────────")
             
-            if i < len(qa_performance):
+            if i < len(desempenho):
                 print()
         
         # Estatísticas gerais
-        total_tentativas = sum(len(data['tentativas']) for data in qa_performance.values())
-        todas_notas = []
-        for data in qa_performance.values():
-            todas_notas.extend(data['notas'])
+        total_tentativas = sum(data.attempts for data in desempenho)
+        total_avaliacoes = sum(data.grade_count for data in desempenho)
         
-        if todas_notas:
-            media_geral = sum(todas_notas) / len(todas_notas)
+        if total_avaliacoes:
+            media_geral = sum(data.grade_sum for data in desempenho) / total_avaliacoes
             print(f"\n📈 ESTATÍSTICAS GERAIS:")
-            print(f"   Total de QAs: {len(qa_performance)}")
+            print(f"   Total de QAs: {len(desempenho)}")
             print(f"   Total de Tentativas: {total_tentativas}")
             print(f"   Média Geral: {media_geral:.1f}")
-            print(f"   Total de Avaliações: {len(todas_notas)}")
+            print(f"   Total de Avaliações: {total_avaliacoes}")
         
         input("\nPressione ENTER para continuar...")
         
@@ -208,31 +219,40 @@ def visualizar_desempenho_por_qa(user):
         db.close()
 
 
+def visualizar_previsao(user, dias=30):
+    """Mostra quantas revisões vencem por dia nos próximos dias"""
+    db = SessionLocal()
+    try:
+        forecast = forecast_workload(db, user_id=user.id, horizon=dias)
+        if not forecast.due.any():
+            print(f"\n📅 Nenhuma revisão prevista para os próximos {dias} dias.")
+            return
+        print_forecast(forecast)
+        input("\nPressione ENTER para continuar...")
+    except Exception as e:
+        print(f"❌ Erro ao calcular a previsão: {e}")
+    finally:
+        db.close()
+
+
 def obter_estatisticas_usuario(user):
     """Função auxiliar para obter estatísticas gerais do usuário"""
     db = SessionLocal()
     try:
         # Total de Q&As criados
-        total_qas = db.query(QA).filter(QA.user_id == user.id).count()
-        
-        # Total de estudos realizados
-        total_estudos = db.query(UserHistory).join(QA).filter(
-            QA.user_id == user.id
-        ).count()
-        
-        # Média geral de notas
-        notas = db.query(UserHistory.grade).join(QA).filter(
-            QA.user_id == user.id,
-            UserHistory.grade.isnot(None)
-        ).all()
+        total_qas = db.query(func.count(QA.id)).filter(QA.user_id == user.id).scalar()
         
-        media_geral = sum(nota[0] for nota in notas) / len(notas) if notas else 0
+        # Totais de estudos e notas, mantidos a cada revisão em user_stats
+        stats = get_user_stats(db, user.id)
+        total_estudos = stats.total_reviews if stats else 0
+        total_avaliacoes = stats.graded_reviews if stats else 0
+        media_geral = stats.grade_sum / total_avaliacoes if total_avaliacoes else 0
         
         return {
             'total_qas': total_qas,
             'total_estudos': total_estudos,
             'media_geral': media_geral,
-            'total_avaliacoes': len(notas)
+            'total_avaliacoes': total_avaliacoes
         }
     
     except Exception as e:
@@ -0,0 +1,157 @@
+"""
+Fila única de escrita no SQLite.
+
+Vários processos do Memento (um por pessoa estudando) podem usar o mesmo
+`memento.db`. Dentro de cada processo, as escritas são enviadas para uma fila
+e gravadas por uma única thread:
+
+- trabalhos que chegam juntos são gravados na mesma transação (um commit, um
+  fsync); se um deles falhar, os demais são gravados um a um para isolar o erro
+- a transação começa com `BEGIN IMMEDIATE`: o lock de escrita é pego logo no
+  início, esperando até o `busy_timeout`, em vez de falhar no meio ao promover
+  uma leitura para escrita
+- se o banco continuar ocupado (outro processo gravando), o lote é repetido
+  com backoff exponencial
+
+Um trabalho é uma função que recebe a sessão e retorna um valor:
+
+    pdf_id = run_write(lambda db: salvar_documento(db, ...))
+"""
+import atexit
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from sqlalchemy.exc import OperationalError
+from database import SessionLocal
+
+# Trabalhos gravados por transação
+MAX_BATCH = 64
+# Tentativas extras quando o banco está ocupado, e o intervalo entre elas (segundos)
+MAX_RETRIES = int(os.environ.get("MEMENTO_WRITE_RETRIES", "8"))
+BACKOFF_BASE = 0.05
+BACKOFF_MAX = 2.0
+
+_STOP = object()
+
+
+def is_locked_error(error):
+    """Se o erro é de banco ocupado ("database is locked" / "busy")."""
+    original = getattr(error, "orig", error)
+    if not isinstance(original, sqlite3.OperationalError):
+        return False
+    message = str(original).lower()
+    return "locked" in message or "busy" in message
+
+
+class WriteQueue:
+    """
+    Args:
+        max_batch: Máximo de trabalhos por transação
+        retries: Tentativas extras quando o banco está ocupado
+    """
+
+    def __init__(self, max_batch=MAX_BATCH, retries=MAX_RETRIES):
+        self.max_batch = max_batch
+        self.retries = retries
+        self.stats = {"jobs": 0, "transactions": 0, "retries": 0}
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, job):
+        """Coloca o trabalho na fila; retorna um Future com o resultado."""
+        future = Future()
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="memento-writer", daemon=True)
+                self._thread.start()
+            self._queue.put((job, future))
+        return future
+
+    def run(self, job):
+        """Grava e espera: retorna o resultado do trabalho ou levanta o erro dele."""
+        return self.submit(job).result()
+
+    def close(self):
+        """Grava o que estiver na fila e encerra a thread."""
+        with self._lock:
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                return
+            self._queue.put(_STOP)
+        thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            # Junta o que já estiver na fila, até max_batch, em uma transação
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch and batch[-1] is not _STOP:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is _STOP:
+                batch.pop()
+                stopping = True
+            if batch:
+                self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        try:
+            results = self._transaction([job for job, _ in batch])
+        except BaseException as e:
+            if len(batch) > 1:
+                for item in batch:
+                    self._write_batch([item])
+            else:
+                batch[0][1].set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _transaction(self, jobs):
+        """Executa os trabalhos em uma transação, repetindo enquanto o banco estiver ocupado."""
+        for attempt in range(self.retries + 1):
+            db = SessionLocal()
+            try:
+                db.connection().exec_driver_sql("BEGIN IMMEDIATE")
+                results = [job(db) for job in jobs]
+                db.commit()
+                self.stats["jobs"] += len(jobs)
+                self.stats["transactions"] += 1
+                return results
+            except (OperationalError, sqlite3.OperationalError) as e:
+                db.rollback()
+                if not is_locked_error(e) or attempt == self.retries:
+                    raise
+                self.stats["retries"] += 1
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+                time.sleep(delay * random.uniform(0.5, 1.5))
+            except BaseException:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+
+_write_queue = WriteQueue()
+atexit.register(_write_queue.close)
+
+
+def submit_write(job):
+    """Envia um trabalho para a fila de escrita do processo; retorna um Future."""
+    return _write_queue.submit(job)
+
+
+def run_write(job):
+    """Envia um trabalho para a fila de escrita do processo e espera o resultado."""
+    return _write_queue.run(job)
+
+
+def write_stats():
+    return dict(_write_queue.stats)